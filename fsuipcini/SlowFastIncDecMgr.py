@@ -1,6 +1,6 @@
 """
 SlowFastIncDecMgr.py -- Manager of Slow/Fast actions on a Rotary Encoder
-Version 20210616-0-4d7af4d
+Version 20261017-0
 
 The MIT License (MIT)
 Copyright © 2021 Blake Buhlig
@@ -28,10 +28,35 @@ Description:
 
 WARNING: This is a prototype work-in-progress; expect problems.
 
-TODO
+SlowFastIncDecMgr maps a control, and optionally a distinct fast control, to
+the slow and fast virtual buttons of a rotary, e.g. as set up by rotfsev.lua.
+
+A speed multiplier, slow_speed/fast_speed, makes one detent do what that
+many detents do. It is compiled by scaled() to a single control where one of
+the Scalers can -- e.g. an OffsetControl increment or decrement with its
+operand scaled -- and otherwise to that many repeats of the entry.
+fast_ctrl_events is the older way to say the same, always by repeating; giving
+both is a ValueError.
 
 """
 from .buttons import btnmap, ButtonAction
+from .offsets import OffsetControl
+
+
+# Functions (control, speed) returning a single control that does what speed
+# repetitions of control do, or None if they cannot. Sim controls taking
+# their step as the parameter can be added here.
+Scalers = [OffsetControl.scaled]
+
+# The (control, repeat) for speed repetitions of ctrl, as mapped by
+# SlowFastIncDecMgr and VelocityTierMgr
+def scaled(ctrl,speed):
+   if speed != 1:
+      for scaler in Scalers:
+         scaled_ctrl = scaler(ctrl,speed)
+         if scaled_ctrl is not None:
+            return scaled_ctrl, 1
+   return ctrl, speed
 
 
 class SlowFastIncDecMgr():
@@ -42,17 +67,31 @@ class SlowFastIncDecMgr():
       self._fast_decr_btn = fast_decr_btn
       self._fast_incr_btn = fast_incr_btn
 
-   def btnmap(self,ctrl_dec,ctrl_inc,conds=None,fast_ctrl_dec=None,fast_ctrl_inc=None,fast_ctrl_events=1):
-      btnmap(self._slow_decr_btn,ctrl_dec,action=ButtonAction.PRESS_AND_RELEASE,conds=conds)
-      btnmap(self._slow_incr_btn,ctrl_inc,action=ButtonAction.PRESS_AND_RELEASE,conds=conds)
-
-      for _ in range(fast_ctrl_events):
-         btnmap(self._fast_decr_btn,fast_ctrl_dec or ctrl_dec,action=ButtonAction.PRESS_AND_RELEASE,conds=conds)
-
-      for _ in range(fast_ctrl_events):
-         btnmap(self._fast_incr_btn,fast_ctrl_inc or ctrl_inc,action=ButtonAction.PRESS_AND_RELEASE,conds=conds)
-
-   def btnmapgroup(self,ctrl_dec,ctrl_inc,group_conds=[],fast_ctrl_dec=None,fast_ctrl_inc=None,fast_ctrl_events=1,all_conds=[]):
+   # fast_ctrl_events and fast_speed both say how far a fast detent moves,
+   # only one of them can be given
+   def btnmap(self,ctrl_dec,ctrl_inc,conds=None,fast_ctrl_dec=None,fast_ctrl_inc=None,fast_ctrl_events=None,slow_speed=1,fast_speed=None):
+      if fast_ctrl_events is not None and fast_speed is not None:
+         raise ValueError(f'got both fast_ctrl_events={fast_ctrl_events} and '
+                          f'fast_speed={fast_speed}, pass only one')
+      if fast_speed is None and fast_ctrl_events is None:
+         fast_ctrl_events = 1
+
+      for button, ctrl, speed in [
+            (self._slow_decr_btn,ctrl_dec,slow_speed),
+            (self._slow_incr_btn,ctrl_inc,slow_speed)]:
+         ctrl, repeat = scaled(ctrl,speed)
+         btnmap(button,ctrl,action=ButtonAction.PRESS_AND_RELEASE,conds=conds,repeat=repeat)
+
+      for button, ctrl in [
+            (self._fast_decr_btn,fast_ctrl_dec or ctrl_dec),
+            (self._fast_incr_btn,fast_ctrl_inc or ctrl_inc)]:
+         if fast_speed is None:
+            repeat = fast_ctrl_events
+         else:
+            ctrl, repeat = scaled(ctrl,fast_speed)
+         btnmap(button,ctrl,action=ButtonAction.PRESS_AND_RELEASE,conds=conds,repeat=repeat)
+
+   def btnmapgroup(self,ctrl_dec,ctrl_inc,group_conds=[],fast_ctrl_dec=None,fast_ctrl_inc=None,fast_ctrl_events=None,all_conds=[],slow_speed=1,fast_speed=None):
 
       if not isinstance(group_conds,list):
          group_conds = [ group_conds ]
@@ -61,5 +100,6 @@ class SlowFastIncDecMgr():
                   conds=all_conds+group_conds,
                   fast_ctrl_dec=fast_ctrl_dec,
                   fast_ctrl_inc=fast_ctrl_inc,
-                  fast_ctrl_events=fast_ctrl_events)
-
+                  fast_ctrl_events=fast_ctrl_events,
+                  slow_speed=slow_speed,
+                  fast_speed=fast_speed)
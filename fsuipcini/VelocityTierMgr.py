@@ -0,0 +1,120 @@
+"""
+VelocityTierMgr.py -- Manager of velocity tiers of a Rotary Encoder
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+
+WARNING: This is a prototype work-in-progress; expect problems.
+
+VelocityTierMgr is the N speed successor of SlowFastIncDecMgr, for rotaries
+managed by rotvel.lua. The plugin toggles one virtual button per detent,
+that of the velocity tier the rotary is turned at; the manager maps each
+tier's decrement and increment virtual buttons to a control at a speed
+multiplier, compiled by scaled(), see SlowFastIncDecMgr.py, to a single
+control where possible. By default tier i moves 2**i times as far per
+detent as the slowest.
+
+CreateTierButtons() allocates the virtual buttons, DEC_0..DEC_<n-1> then
+INC_0..INC_<n-1>, on the given virtual joystick or the first with room, see
+virtbtns.py, and rotaries() describes the rotvel.lua configuration for
+them, e.g.
+
+   TrimTiers = CreateTierButtons('TrimTiers',joycode=None,n_tiers=4)
+   TrimTiers.mgr = VelocityTierMgr.for_buttons(TrimTiers)
+   TrimTiers.mgr.btnmap(TrimDn,TrimUp,speeds=[1,2,4,8])
+   RotvelRotaries = TrimTiers.mgr.rotaries(Bravo.TRIMWHEEL_DOWN,
+                                           Bravo.TRIMWHEEL_UP)
+
+"""
+from .buttons import btnmap, ButtonAction
+from .devices import CreateButtons
+from .luagen import VelocityRotary
+from .SlowFastIncDecMgr import scaled
+from .virtbtns import is_virtual_joy
+
+# The virtual buttons of n_tiers tiers in each direction, from button
+# first_btn of virtual joystick joycode, or wherever there is room if None
+def CreateTierButtons(name,joycode,n_tiers,first_btn=0):
+   if (joycode is not None and not is_virtual_joy(joycode)) or \
+      first_btn < 0 or first_btn + 2*n_tiers > 32:
+      raise ValueError(f'{name}: {n_tiers} tiers from button {first_btn} do '
+                       f'not fit on a virtual joystick 64-72')
+   mappings = dict()
+   for direction, base in [('DEC',first_btn),('INC',first_btn+n_tiers)]:
+      for tier in range(n_tiers):
+         mappings[f'{direction}_{tier}'] = base + tier
+   return CreateButtons(name,joycode=joycode,mappings=mappings)
+
+
+class VelocityTierMgr():
+   def __init__(self, decr_btns, incr_btns):
+      if len(decr_btns) != len(incr_btns):
+         raise ValueError('need as many decrement as increment tiers')
+      self._decr_btns = list(decr_btns)
+      self._incr_btns = list(incr_btns)
+
+   @classmethod
+   def for_buttons(cls, tier_buttons):
+      n_tiers = len(tier_buttons) // 2
+      return cls([tier_buttons[f'DEC_{tier}'] for tier in range(n_tiers)],
+                 [tier_buttons[f'INC_{tier}'] for tier in range(n_tiers)])
+
+   @property
+   def n_tiers(self):
+      return len(self._decr_btns)
+
+   # The rotvel.lua configuration of the physical decrement and increment
+   # buttons, with the keyword arguments of luagen.VelocityRotary
+   def rotaries(self, decr_button, incr_button, **kwargs):
+      kwargs.setdefault('Thresh_ms',VelocityRotary._field_defaults[
+                           'Thresh_ms'][:self.n_tiers-1])
+      return [VelocityRotary(decr_button,self._decr_btns,**kwargs),
+              VelocityRotary(incr_button,self._incr_btns,**kwargs)]
+
+   # Map each tier to ctrl_dec/ctrl_inc, or to the (dec, inc) controls given
+   # for it in tier_ctrls, at the tier's multiplier in speeds
+   def btnmap(self,ctrl_dec,ctrl_inc,conds=[],speeds=None,tier_ctrls={}):
+      if speeds is None:
+         speeds = [1 << tier for tier in range(self.n_tiers)]
+      if len(speeds) != self.n_tiers:
+         raise ValueError(f'need {self.n_tiers} speeds, got {len(speeds)}')
+
+      for tier, speed in enumerate(speeds):
+         dec, inc = tier_ctrls.get(tier,(ctrl_dec,ctrl_inc))
+         for button, ctrl in [(self._decr_btns[tier],dec),
+                              (self._incr_btns[tier],inc)]:
+            ctrl, repeat = scaled(ctrl,speed)
+            btnmap(button,ctrl,action=ButtonAction.PRESS_AND_RELEASE,conds=conds,repeat=repeat)
+
+   def btnmapgroup(self,ctrl_dec,ctrl_inc,group_conds=[],all_conds=[],speeds=None,tier_ctrls={}):
+
+      if not isinstance(group_conds,list):
+         group_conds = [ group_conds ]
+
+      self.btnmap(ctrl_dec,ctrl_inc,
+                  conds=all_conds+group_conds,
+                  speeds=speeds,
+                  tier_ctrls=tier_ctrls)
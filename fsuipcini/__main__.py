@@ -0,0 +1,351 @@
+"""
+__main__.py -- Command line tools
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+WARNING: This is a prototype work-in-progress; expect problems.
+
+Command line entry point for tooling around the fsuipcini modules, run as
+
+   python3 -m fsuipcini <command> ...
+
+Use "python3 -m fsuipcini --help" for the list of commands.
+
+"""
+import argparse
+import sys
+import time
+from collections import namedtuple
+from . import analyze
+from . import luamodel
+from . import ovrldbtn
+from . import rotfsev
+from . import rotvel
+from . import search
+from . import simulator
+from . import sweep
+from . import tracemap
+from . import virtbtns
+
+def _cmd_search(args):
+   start = time.perf_counter()
+   index = search.load_index(rebuild=args.rebuild)
+   loaded = time.perf_counter()
+
+   if args.list_groups:
+      for group in index.groups:
+         print(group)
+      return 0
+
+   results = index.search(args.query,mode=args.mode,group=args.group,
+                          catalog=args.catalog,limit=args.limit)
+   done = time.perf_counter()
+
+   for entry in results:
+      print(f'{entry.fullname}\t{entry.ctrlcode}\t{entry.group or ""}')
+
+   if args.verbose:
+      print(f'{len(results)} of {len(index)} controls; '
+            f'index load {(loaded-start)*1000:.1f} ms, '
+            f'query {(done-loaded)*1000:.2f} ms',file=sys.stderr)
+   return 0 if results else 1
+
+def _cmd_trace(args):
+   start = time.perf_counter()
+   trace_map = tracemap.TraceMap(args.sidecar)
+   loaded = time.perf_counter()
+
+   status = 0
+   for key in args.entries:
+      rec = trace_map.lookup(key,section=args.section,ini_fn=args.ini)
+      if rec is None:
+         print(f'{key}: not found',file=sys.stderr)
+         status = 1
+      else:
+         print(rec.format())
+
+   if args.verbose:
+      print(f'{len(trace_map)} entries; sidecar load '
+            f'{(loaded-start)*1000:.1f} ms',file=sys.stderr)
+   return status
+
+# The (section name, entries) from the INI or generator script given to the
+# command, and the script's globals if any
+def _load_sections(args):
+   if args.script:
+      return analyze.run_script_entries(args.script)
+   if args.ini:
+      return analyze.read_ini_entries(args.ini,args.section), dict()
+   print(f'{args.command}: an INI or --script is required',file=sys.stderr)
+   sys.exit(2)
+
+def _add_entries_args(cmd_parser):
+   cmd_parser.add_argument('ini',nargs='?',
+                       help="INI whose entries to use")
+   cmd_parser.add_argument('--script',
+                       help="use the entries generated by this script, "
+                            "e.g. gen_ini.py, instead")
+   cmd_parser.add_argument('-s','--section',default='Buttons',
+                       help="sections of the INI to use, including "
+                            "profile specific ones (default: Buttons)")
+
+def _cmd_cost(args):
+   sections, script_globals = _load_sections(args)
+   modes = dict()
+   if args.modes_class in script_globals:
+      modes = analyze.modes_from_class(script_globals[args.modes_class])
+   for mode in args.mode or []:
+      name, _, conds = mode.partition('=')
+      modes[name] = conds.split()
+
+   report = analyze.CostReport(sections,modes)
+   print(report.format(limit=args.limit))
+   return 0
+
+def _cmd_sim(args):
+   sections, _ = _load_sections(args)
+   sim = simulator.ButtonSimulator(sections,record=args.log)
+   if args.events:
+      events = simulator.read_events(args.events)
+   else:
+      events = simulator.synthetic_events(sim.buttons(),args.synthetic,
+                                          seed=args.seed)
+
+   start = time.perf_counter()
+   sim.replay(events)
+   elapsed = time.perf_counter() - start
+
+   for fired in sim.fired:
+      event = fired.event
+      print(f'{event[0]} {event[1]},{event[2]}\t{fired.ctrlcode},{fired.param}')
+   if args.top:
+      for (ctrlcode, param), count in sim.control_counts.most_common(args.top):
+         print(f'{count:>9} {ctrlcode},{param}')
+   print(sim.summary(),file=sys.stderr)
+   print(f'{len(events)/max(elapsed,1e-9):.0f} events/s',file=sys.stderr)
+   return 0
+
+# For each Lua plugin model: the function sweep evaluates, the trace it is
+# evaluated on, the default parameter grid, how to rank its scores best
+# first, and the per label report of replaying the trace as configured
+_LuaModel = namedtuple('_LuaModel','evaluate trace grid rank report')
+
+def _timed_events(args,synthetic):
+   if args.events:
+      return luamodel.read_timed_events(args.events)
+   return synthetic(args.synthetic,args.seed)
+
+def _rotfsev_model(args):
+   defs = rotfsev.read_lua_defs(args.lua or 'rotfsev.lua')
+   events = _timed_events(args,lambda n, seed:
+                          rotfsev.synthetic_turns(defs,n,seed=seed))
+   gestures = luamodel.group_gestures(events)
+   grid = dict(FastThresh_ms=sweep.parse_range('40:300:20'),
+               FastThreshFilter_cnt=sweep.parse_range('0:3'))
+   rank = lambda score: (score.misclassified,(score.slow_p95_ms or 0) +
+                                             (score.fast_detect_p95_ms or 0))
+   return _LuaModel(rotfsev.evaluate,(defs,events,gestures),grid,rank,
+                    lambda: [rotfsev.evaluate(dict(),defs,events,gestures)])
+
+def _ovrldbtn_model(args):
+   config = ovrldbtn.read_lua_config(args.lua or 'ovrldbtn.lua')
+   events = _timed_events(args,lambda n, seed:
+                          ovrldbtn.synthetic_sequences(config,n,seed=seed))
+   gestures = luamodel.group_gestures(events)
+   grid = dict(n_click_threshold_ms=sweep.parse_range('150:450:50'),
+               btn_hold_threshold_ms=sweep.parse_range('100:400:50'))
+   rank = lambda score: (score.misdetections,(score.click_p95_ms or 0) +
+                                             (score.hold_p95_ms or 0))
+
+   def _report():
+      model = ovrldbtn.OvrldbtnModel(config)
+      return ovrldbtn.latency_rows(model,events,model.run(events),gestures)
+
+   return _LuaModel(ovrldbtn.evaluate,(config,events,gestures),grid,rank,
+                    _report)
+
+def _rotvel_model(args):
+   defs = rotvel.read_lua_defs(args.lua or 'rotvel.lua')
+   events = _timed_events(args,lambda n, seed:
+                          rotvel.synthetic_turns(defs,n,seed=seed))
+   gestures = luamodel.group_gestures(events)
+   grid = dict(Tier1_ms=sweep.parse_range('60:160:20'),
+               Debounce_ms=sweep.parse_range('0,5,10'),
+               MaxTierStep=sweep.parse_range('0:2'))
+   rank = lambda score: (score.misclassified,score.ramp_p95 or 0)
+   return _LuaModel(rotvel.evaluate,(defs,events,gestures),grid,rank,
+                    lambda: [rotvel.evaluate(dict(),defs,events,gestures)])
+
+_LuaModels = dict(ovrldbtn=_ovrldbtn_model,rotfsev=_rotfsev_model,
+                  rotvel=_rotvel_model)
+
+def _add_lua_model_args(cmd_parser):
+   cmd_parser.add_argument('model',choices=sorted(_LuaModels),
+                       help="plugin to model")
+   cmd_parser.add_argument('--lua',
+                       help="plugin whose configuration to use (default: "
+                            "<model>.lua)")
+   cmd_parser.add_argument('--events',
+                       help="file of timestamped events, see luamodel.py")
+   cmd_parser.add_argument('--synthetic',type=int,default=5000,
+                       help="number of random gestures if no --events "
+                            "(default: 5000)")
+   cmd_parser.add_argument('--seed',type=int,default=0)
+
+def _cmd_replay(args):
+   rows = _LuaModels[args.model](args).report()
+   print(sweep.format_results([(dict(),row) for row in rows]))
+   return 0
+
+def _cmd_sweep(args):
+   lua_model = _LuaModels[args.model](args)
+   grid = dict(lua_model.grid)
+   for param in args.grid or []:
+      name, _, values = param.partition('=')
+      grid[name] = sweep.parse_range(values)
+
+   start = time.perf_counter()
+   results = sweep.sweep(lua_model.evaluate,sweep.param_grid(**grid),
+                         lua_model.trace,workers=args.workers)
+   elapsed = time.perf_counter() - start
+
+   print(sweep.format_results(results,key=lua_model.rank,limit=args.limit))
+   print(f'{len(results)} settings in {elapsed:.1f} s',file=sys.stderr)
+   return 0
+
+def _cmd_vbtns(args):
+   analyze.run_script_entries(args.script)
+   print(virtbtns.virtual_buttons().format())
+   return 0
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(prog='python3 -m fsuipcini',
+                       description="Tools for working with FSUIPC INI files")
+   subparsers = parser.add_subparsers(dest='command',required=True)
+
+   search_parser = subparsers.add_parser('search',
+                       help="find controls by name in the controls lists")
+   search_parser.add_argument('query',nargs='?',default='',
+                       help="(part of) the control name, case insensitive")
+   search_parser.add_argument('-m','--mode',default='auto',
+                       choices=['auto','exact','prefix','substring','fuzzy'],
+                       help="matching mode; auto tries exact, prefix, "
+                            "substring then fuzzy until something matches")
+   search_parser.add_argument('-g','--group',
+                       help="only controls whose MobiFlight group contains "
+                            "this text")
+   search_parser.add_argument('-c','--catalog',
+                       help="only controls of this catalog, e.g. SimCtrl")
+   search_parser.add_argument('-n','--limit',type=int,default=50,
+                       help="maximum number of results (0 for all)")
+   search_parser.add_argument('--list-groups',action='store_true',
+                       help="list the known MobiFlight groups and exit")
+   search_parser.add_argument('--rebuild',action='store_true',
+                       help="rebuild the cached index and control "
+                            "catalogs")
+   search_parser.add_argument('-v','--verbose',action='store_true',
+                       help="report index load and query time")
+   search_parser.set_defaults(func=_cmd_search)
+
+   trace_parser = subparsers.add_parser('trace',
+                       help="show where generated INI entries came from")
+   trace_parser.add_argument('sidecar',
+                       help="trace sidecar written by the generator, e.g. "
+                            "by gen_ini.py --trace-sidecar")
+   trace_parser.add_argument('entries',nargs='+',
+                       help="entry number, fixed token name, or #<id> from "
+                            "the entry's comment")
+   trace_parser.add_argument('-s','--section',default='Buttons',
+                       help="section of the entry numbers (default: Buttons)")
+   trace_parser.add_argument('--ini',
+                       help="resolve entry numbers through the ID comments "
+                            "in this INI, e.g. after it was edited")
+   trace_parser.add_argument('-v','--verbose',action='store_true',
+                       help="report sidecar load time")
+   trace_parser.set_defaults(func=_cmd_trace)
+
+   cost_parser = subparsers.add_parser('cost',
+                       help="rank buttons by the work FSUIPC does resolving "
+                            "their entries")
+   _add_entries_args(cost_parser)
+   cost_parser.add_argument('-n','--limit',type=int,default=20,
+                       help="number of buttons to list (0 for all)")
+   cost_parser.add_argument('--modes-class',default='PanelMode',
+                       help="class of the script whose attributes are the "
+                            "conditions of each mode (default: PanelMode)")
+   cost_parser.add_argument('--mode',action='append',
+                       help="NAME=CONDS, conditions selecting a mode to total, "
+                            "space separated, e.g. 'MFD=(+A,134) (+B,20)'")
+   cost_parser.set_defaults(func=_cmd_cost)
+
+   sim_parser = subparsers.add_parser('sim',
+                       help="replay button events against generated entries")
+   _add_entries_args(sim_parser)
+   sim_parser.add_argument('--events',
+                       help="file of events to replay, see simulator.py")
+   sim_parser.add_argument('--synthetic',type=int,default=100000,
+                       help="number of random events to replay if no "
+                            "--events (default: 100000)")
+   sim_parser.add_argument('--seed',type=int,default=0)
+   sim_parser.add_argument('--log',action='store_true',
+                       help="list each control sent with its event")
+   sim_parser.add_argument('--top',type=int,default=10,
+                       help="list the most sent controls (default: 10)")
+   sim_parser.set_defaults(func=_cmd_sim)
+
+   replay_parser = subparsers.add_parser('replay',
+                       help="replay an event trace through a model of a Lua "
+                            "plugin and report its latencies")
+   _add_lua_model_args(replay_parser)
+   replay_parser.set_defaults(func=_cmd_replay)
+
+   sweep_parser = subparsers.add_parser('sweep',
+                       help="evaluate the timing parameters of a Lua plugin "
+                            "against an event trace")
+   _add_lua_model_args(sweep_parser)
+   sweep_parser.add_argument('--grid',action='append',
+                       help="NAME=START:STOP[:STEP] or NAME=V1,V2,... values "
+                            "of a parameter to sweep, e.g. "
+                            "FastThresh_ms=40:300:20")
+   sweep_parser.add_argument('-j','--workers',type=int,
+                       help="worker processes (default: one per CPU)")
+   sweep_parser.add_argument('-n','--limit',type=int,default=20,
+                       help="number of settings to list, best first "
+                            "(0 for all)")
+   sweep_parser.set_defaults(func=_cmd_sweep)
+
+   vbtns_parser = subparsers.add_parser('vbtns',
+                       help="list the virtual buttons a generator script "
+                            "takes")
+   vbtns_parser.add_argument('--script',default='gen_ini.py',
+                       help="INI generator script (default: gen_ini.py)")
+   vbtns_parser.set_defaults(func=_cmd_vbtns)
+
+   args = parser.parse_args(argv)
+   return args.func(args)
+
+if __name__ == '__main__':
+   sys.exit(main())
@@ -1,6 +1,6 @@
 """
 _globals.py -- Internal module globals
-Version 20210616-0-61fbbf3
+Version 20261017-0
 
 The MIT License (MIT)
 Copyright © 2021 Blake Buhlig
@@ -32,6 +32,18 @@ TODO
 
 """
 Section_idx = 0
+Section_name=None
+Section_entries=list()
+Optimize=True
+Rendered_sections=None
 Trace_file_idx=0
 Trace_file_dict=dict()
+Trace_depth=None
+Trace_cache=dict()
+Trace_code_files=dict()
+Catalogs=list()
+Writer=None
+Trace_sidecar=None
+Lua_dispatch=None
+Virtual_buttons=None
  
@@ -0,0 +1,205 @@
+"""
+analyze.py -- Static per-button evaluation cost of generated entries
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+WARNING: This is a prototype work-in-progress; expect problems.
+
+Each time a button changes state FSUIPC goes through the entries of that
+button and action, checking the conditions of each, and every offset
+condition means reading an offset. CostReport indexes ButtonEntry's by
+(joystick, button, action) and ranks the buttons by how much of that work
+they cause, i.e. entries scanned plus conditions checked, so buttons whose
+entries multiply across panel modes stand out. Given the conditions making
+up each mode (e.g. the PanelMode class of gen_ini.py) it also totals the
+entries and conditions per mode.
+
+The entries can come from an INI, from a generator script run with its
+output discarded, or from keep_rendered_entries() in the script itself:
+
+   python3 -m fsuipcini cost FSUIPC7.ini
+   python3 -m fsuipcini cost --script gen_ini.py
+
+"""
+import io
+import re
+import runpy
+import sys
+from collections import namedtuple
+from .conditions import as_cond
+from .entries import parse_entry
+from .utils import set_output, close_output, keep_rendered_entries
+from . import _globals
+
+class ButtonCost(namedtuple('ButtonCost','section joy btn action entries '
+                            'conditions offset_reads offsets')):
+   __slots__ = ()
+
+   # Entries scanned plus conditions checked on each event of the button
+   @property
+   def cost(self):
+      return self.entries + self.conditions
+
+   @property
+   def joycode(self):
+      return f'{self.joy},{self.btn}'
+
+ModeCost = namedtuple('ModeCost','mode entries conditions buttons')
+
+def _button_cost(key,entries):
+   n_entries = conditions = offset_reads = 0
+   offsets = set()
+   for entry in entries:
+      n_entries += entry.repeat
+      conditions += entry.repeat * (len(entry.button_conds) +
+                                    len(entry.offset_conds))
+      offset_reads += entry.repeat * len(entry.offset_conds)
+      offsets.update((cond.size,cond.offset) for cond in entry.offset_conds)
+   return ButtonCost(*key,n_entries,conditions,offset_reads,len(offsets))
+
+# The conditions a mode is made of, from a ButtonEnum, condition, or list of
+# those
+def mode_conds(mode):
+   if not isinstance(mode,(list,tuple)):
+      mode = [mode]
+   return [as_cond(cond) for cond in mode]
+
+# The modes defined as class attributes, e.g. gen_ini.py's PanelMode
+def modes_from_class(cls):
+   return {name: mode_conds(mode) for name, mode in vars(cls).items()
+           if not name.startswith('_')}
+
+class CostReport:
+   # sections is a list of (section name, ButtonEntry's); modes maps mode
+   # names to the conditions that select the mode
+   def __init__(self,sections,modes=None):
+      index = dict()
+      for section, entries in sections:
+         for entry in entries:
+            key = (section,entry.joy,entry.btn,entry.action)
+            index.setdefault(key,list()).append(entry)
+      self.index = index
+      self.buttons = sorted((_button_cost(key,entries)
+                             for key, entries in index.items()),
+                            key=lambda b: (-b.cost,-b.entries,b.section,
+                                           b.joy,b.btn,b.action))
+      self.modes = dict(modes or {})
+
+   def __len__(self):
+      return len(self.buttons)
+
+   # Entries whose conditions include all those of a mode are counted for
+   # that mode; an entry may count for several modes if they overlap
+   def mode_totals(self):
+      totals = list()
+      for mode, conds in self.modes.items():
+         conds = set(conds)
+         n_entries = conditions = 0
+         buttons = set()
+         for key, entries in self.index.items():
+            for entry in entries:
+               if conds <= set(entry.button_conds + entry.offset_conds):
+                  n_entries += entry.repeat
+                  conditions += entry.repeat * (len(entry.button_conds) +
+                                                len(entry.offset_conds))
+                  buttons.add(key)
+         totals.append(ModeCost(mode,n_entries,conditions,len(buttons)))
+      totals.sort(key=lambda m: -(m.entries + m.conditions))
+      return totals
+
+   def format(self,limit=20):
+      sections = {b.section for b in self.buttons}
+      shown = self.buttons[:limit or None]
+      names = [b.joycode if len(sections) == 1 else f'[{b.section}]{b.joycode}'
+               for b in shown]
+      width = max([16] + [len(name) for name in names])
+      lines = [f'{"button":<{width}} {"act":>3} {"entries":>7} {"conds":>6} '
+               f'{"offrd":>6} {"offs":>4} {"cost":>6}']
+      for name, b in zip(names,shown):
+         lines.append(f'{name:<{width}} {b.action:>3} {b.entries:>7} '
+                      f'{b.conditions:>6} {b.offset_reads:>6} '
+                      f'{b.offsets:>4} {b.cost:>6}')
+      if limit and len(self.buttons) > limit:
+         lines.append(f'... {len(self.buttons) - limit} more')
+      total_entries = sum(b.entries for b in self.buttons)
+      total_conds = sum(b.conditions for b in self.buttons)
+      lines.append(f'{len(self.buttons)} button actions, {total_entries} '
+                   f'entries, {total_conds} conditions, '
+                   f'{sum(b.offset_reads for b in self.buttons)} offset reads')
+
+      if self.modes:
+         lines.append('')
+         lines.append(f'{"mode":<{width}} {"btns":>3} {"entries":>7} '
+                      f'{"conds":>6} {"cost":>6}')
+         for m in self.mode_totals():
+            lines.append(f'{m.mode:<{width}} {m.buttons:>3} {m.entries:>7} '
+                         f'{m.conditions:>6} {m.entries+m.conditions:>6}')
+      return '\n'.join(lines)
+
+_SectionRegex = re.compile(r'^\s*\[(?P<section>[^\]]*)\]')
+
+# The button entries of the [Buttons] (or whichever) sections of an INI, as
+# (section name, entries); section_filter is a section name, matching its
+# profile specific sections too, or None for all sections
+def read_ini_entries(fn,section_filter='Buttons'):
+   sections = list()
+   entries = None
+   with open(fn,'r') as ifh:
+      for line in ifh:
+         m = _SectionRegex.match(line)
+         if m:
+            name = m.group('section')
+            entries = None
+            if section_filter is None or \
+               name.split('.')[0].lower() == section_filter.lower():
+               entries = list()
+               sections.append((name,entries))
+         elif entries is not None:
+            parsed = parse_entry(line)
+            if parsed:
+               entries.append(parsed[1])
+   return sections
+
+# Run a generator script such as gen_ini.py with its output discarded, and
+# return the entries it rendered along with its global namespace
+def run_script_entries(path,argv=()):
+   saved_argv = sys.argv
+   sys.argv = [path] + list(argv)
+   was_kept = _globals.Rendered_sections is not None
+   rendered = keep_rendered_entries()
+   start = len(rendered)
+   # The script takes its virtual buttons anew
+   _globals.Virtual_buttons = None
+   set_output(io.StringIO())
+   try:
+      script_globals = runpy.run_path(path,run_name='__main__')
+   finally:
+      close_output()
+      sys.argv = saved_argv
+   sections = rendered[start:]
+   if not was_kept:
+      _globals.Rendered_sections = None
+   return sections, script_globals
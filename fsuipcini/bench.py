@@ -0,0 +1,330 @@
+"""
+bench.py -- Benchmarks for the fsuipcini modules
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+WARNING: This is a prototype work-in-progress; expect problems.
+
+Micro-benchmarks for the parts of the fsuipcini modules that dominate the
+run time of an INI generator script. Run as e.g.
+
+   python3 -m fsuipcini.bench catalog --file "Controls List for MSFS Build 999.txt"
+
+Each subcommand prints its own before/after comparison. The dispatch
+subcommand also checks that the Lua dispatch tables send the same controls
+as the INI entries they replace; its times are of the simulation, the
+entries, conditions, variables and lookups per event are what carry over
+to FSUIPC and the plugin.
+
+"""
+
+import argparse
+import gc
+import inspect
+import io
+import random
+import time
+import traceback
+import tracemalloc
+from . import _globals
+from .analyze import run_script_entries
+from .controls import CreateControls, SimCtrlFiles, MBFCtrlFiles
+from . import utils
+from . import offsetbatch
+from .conditions import ButtonCondition
+from .luadispatch import LuaDispatch
+from .offsets import OffsetControl, OffsetSize
+from .offsetspace import OffsetSpace
+from .simulator import ButtonSimulator
+
+# The first of the controls lists gen_ini.py loads that is found
+_DefaultCatalogFiles = SimCtrlFiles + MBFCtrlFiles
+
+def _timeit(fn,repeat):
+   best = None
+   for _ in range(repeat):
+      gc.collect()
+      start = time.perf_counter()
+      fn()
+      elapsed = time.perf_counter() - start
+      best = elapsed if best is None else min(best,elapsed)
+   return best
+
+def _retained_bytes(fn):
+   gc.collect()
+   tracemalloc.start()
+   try:
+      before = tracemalloc.get_traced_memory()[0]
+      keep = fn()
+      after = tracemalloc.get_traced_memory()[0]
+   finally:
+      tracemalloc.stop()
+   del keep
+   return after - before
+
+def bench_catalog(filelist,n_refs=100,repeat=5):
+   # Warm the on-disk catalog cache so only catalog construction is measured
+   CreateControls("BenchCtrl",list(filelist))
+
+   names = list(CreateControls("BenchCtrl",list(filelist),lazy=True)._index)
+   refs = random.Random(0).sample(names,min(n_refs,len(names)))
+
+   def _build_and_use(lazy):
+      ctrls = CreateControls("BenchCtrl",list(filelist),lazy=lazy)
+      for name in refs:
+         getattr(ctrls,name).ctrlcode
+      return ctrls
+
+   print(f'{len(names)} controls, {len(refs)} referenced')
+   results = dict()
+   for label, lazy in [('Enum',False),('lazy',True)]:
+      secs = _timeit(lambda: _build_and_use(lazy),repeat)
+      nbytes = _retained_bytes(lambda: _build_and_use(lazy))
+      results[label] = (secs,nbytes)
+      print(f'{label:>6}: {secs*1000:8.2f} ms {nbytes/1024:10.1f} KiB')
+
+   (enum_secs, enum_bytes), (lazy_secs, lazy_bytes) = results.values()
+   print(f'speedup {enum_secs/lazy_secs:.1f}x, '
+         f'memory {enum_bytes/max(lazy_bytes,1):.1f}x smaller')
+
+
+# gen_trace_str() as it was before traces were cached, for comparison
+def _walk_stack_trace_str():
+   infelems=list()
+   for frame, b in traceback.walk_stack(inspect.currentframe().f_back.f_back):
+      cur_file=frame.f_globals["__file__"]
+      cur_file_code = _globals.Trace_file_dict.get(cur_file,None)
+      if not cur_file_code:
+         cur_file_code = utils._n2alphacode(_globals.Trace_file_idx)
+
+         _globals.Trace_file_dict[cur_file] = cur_file_code
+         _globals.Trace_file_idx += 1
+
+      infelems.append(f'{cur_file_code}{frame.f_lineno}')
+
+   trace_str =';'.join(infelems)
+   if len(trace_str) > 64:
+      trace_str=f'~{trace_str[-64:]}'
+
+   return trace_str
+
+def _nested(depth,fn):
+   if depth > 0:
+      return _nested(depth-1,fn)
+   return fn()
+
+def bench_trace(n_entries=20000,stack_depth=6,repeat=3):
+   # Roughly the shape of gen_ini.py: a handful of call sites, each generating
+   # many entries from a few frames deep
+   def _emit(trace_fn):
+      for i in range(n_entries):
+         _nested(stack_depth,lambda: trace_fn())
+
+   def _run(trace_fn,depth):
+      utils.set_trace_depth(depth)
+      utils.set_output(io.StringIO())
+      utils.section("Bench")
+      secs = _timeit(lambda: _emit(trace_fn),repeat)
+      utils.end_section()
+      utils.set_trace_depth(None)
+      return secs
+
+   cases = [('walk_stack (old)',_walk_stack_trace_str,None),
+            ('cached, full',utils.gen_trace_str,None),
+            ('cached, depth 2',utils.gen_trace_str,2),
+            ('disabled',utils.trace_comment,0)]
+
+   print(f'{n_entries} entries, {stack_depth} frames deep')
+   baseline = None
+   for label, trace_fn, depth in cases:
+      secs = _run(trace_fn,depth)
+      baseline = baseline or secs
+      print(f'{label:>18}: {secs*1000:8.2f} ms '
+            f'{secs/n_entries*1e6:6.2f} us/entry {baseline/secs:6.1f}x')
+   utils.set_output(None)
+
+
+def bench_offsets(n_controls=1000000,repeat=3):
+   Op = OffsetControl.Operation
+   trim = OffsetControl(offset=0x0BC0,size=OffsetSize.Int16,
+                        llimit=-16383,ulimit=16383)
+   xpndr = OffsetControl(offset=0x66C0,size=OffsetSize.Byte,llimit=0,ulimit=3)
+   adf = OffsetControl(offset=0x66C1,size=OffsetSize.Byte,llimit=0,ulimit=2)
+   virt = OffsetControl(offset=0x3340,size=OffsetSize.Int32)
+   kinds = [trim.op(Op.IncrementSigned,mult*128) for mult in (1,2,8)] + \
+           [trim.op(Op.DecrementSigned,mult*128) for mult in (1,2,8)] + \
+           [xpndr.op(Op.IncrementCyclic,1),xpndr.op(Op.DecrementCyclic,1),
+            adf.op(Op.IncrementCyclic,1),adf.op(Op.DecrementCyclic,1)] + \
+           [virt.op(op,1 << bit) for op in (Op.Setbits,Op.Clrbits,
+                                             Op.Togglebits)
+                                  for bit in range(8)]
+   controls = random.Random(0).choices(kinds,k=n_controls)
+   arrays = offsetbatch.decode_controls(controls)
+
+   def _one_by_one():
+      space = OffsetSpace()
+      for ctrl in controls:
+         space.apply_control(*ctrl)
+      return space
+
+   def _batch(decoded=None):
+      space = OffsetSpace()
+      if decoded is None:
+         decoded = offsetbatch.decode_controls(controls)
+      offsetbatch.apply_batch(space,*decoded)
+      return space
+
+   if bytes(_one_by_one().mem) != bytes(_batch(arrays).mem):
+      raise RuntimeError('batched and one by one results differ')
+
+   n_offsets = len(set(int(offset) for offset in arrays[0]))
+   print(f'{n_controls} controls on {n_offsets} offsets'
+         f'{"" if offsetbatch.np is not None else " (NumPy not available)"}')
+   baseline = None
+   for label, fn in [('one by one',_one_by_one),
+                     ('decode + batch',_batch),
+                     ('batch',lambda: _batch(arrays))]:
+      secs = _timeit(fn,repeat)
+      baseline = baseline or secs
+      print(f'{label:>15}: {secs*1000:8.1f} ms '
+            f'{secs/n_controls*1e9:7.1f} ns/control {baseline/secs:6.1f}x')
+
+
+# The buttons whose pressed state the dispatch tables' variables test
+def _condition_buttons(tables):
+   buttons = set()
+   for table in tables:
+      for variable in table.variables:
+         if isinstance(variable,ButtonCondition) and \
+            variable.test == ButtonCondition.Test.PRESSED:
+            buttons.add((str(variable.joy),variable.btn))
+   return sorted(buttons)
+
+def bench_dispatch(script,buttons_var='LuaDispatchButtons',n_events=200000,
+                   repeat=3):
+   sections, script_globals = run_script_entries(script)
+   dispatch = LuaDispatch()
+   dispatch.select(*script_globals[buttons_var])
+   dispatched = [(name, dispatch.take(name,entries))
+                 for name, entries in sections]
+   for joycode, reason in dispatch.skipped.items():
+      print(f'{joycode}: not dispatched, {reason}')
+
+   # Click the dispatched buttons at random, in between pressing or releasing
+   # one of the buttons they are conditioned on, so the tables are exercised
+   # in every mode
+   targets = [(str(table.joy),int(table.btn)) for table in dispatch.tables]
+   modes = [button for button in _condition_buttons(dispatch.tables)
+            if button not in targets]
+   rnd = random.Random(0)
+   held = set()
+   events = list()
+   while len(events) < n_events:
+      if modes and rnd.random() < 0.2:
+         button = rnd.choice(modes)
+         events.append(('U' if button in held else 'P',)+button)
+         held ^= {button}
+      else:
+         button = rnd.choice(targets)
+         events.extend([('P',)+button,('U',)+button])
+   n_clicks = sum(1 for event in events if event[1:] in targets)
+
+   def _run(record,use_dispatch):
+      if use_dispatch:
+         sim = ButtonSimulator(dispatched,record=record,
+                               dispatch=dispatch.tables)
+      else:
+         sim = ButtonSimulator(sections,record=record)
+      return sim.replay(events)
+
+   fired = [[(f.event,f.ctrlcode,utils.val(f.param)) for f in
+             _run(True,use_dispatch).fired] for use_dispatch in (False,True)]
+   if fired[0] != fired[1]:
+      raise RuntimeError('the INI and Lua dispatch fire different controls')
+
+   n_entries = sum(table.n_entries for table in dispatch.tables)
+   n_shapes = sum(len(shapes) for table in dispatch.tables
+                  for shapes in table.shapes.values())
+   print(f'{len(dispatch.tables)} buttons, {n_entries} entries, '
+         f'{n_shapes} shape tables; {len(events)} events, {n_clicks} on '
+         f'the dispatched buttons, {len(fired[0])} controls')
+   baseline = None
+   for label, use_dispatch in [('INI',False),('Lua dispatch',True)]:
+      sim = _run(False,use_dispatch)
+      secs = _timeit(lambda: _run(False,use_dispatch),repeat)
+      baseline = baseline or secs
+      print(f'{label:>13}: {sim.entries_scanned/n_clicks:6.2f} entries '
+            f'{sim.conditions_evaluated/n_clicks:6.2f} conditions '
+            f'{sim.variables_tested/n_clicks:6.2f} variables '
+            f'{sim.lookups/n_clicks:5.2f} lookups per event, '
+            f'{secs*1000:7.1f} ms {baseline/secs:5.1f}x')
+
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(prog='python3 -m fsuipcini.bench',
+                                    description="fsuipcini benchmarks")
+   subparsers = parser.add_subparsers(dest='bench',required=True)
+
+   catalog_parser = subparsers.add_parser('catalog',
+                       help="eager Enum vs. lazy control catalog")
+   catalog_parser.add_argument('--file',action='append',
+                       help="controls list to load (default: the MSFS "
+                            "controls list, else the custom controls list)")
+   catalog_parser.add_argument('--refs',type=int,default=100,
+                       help="number of controls to reference")
+
+   trace_parser = subparsers.add_parser('trace',
+                       help="cost of the per-entry trace comments")
+   trace_parser.add_argument('--entries',type=int,default=20000)
+   trace_parser.add_argument('--stack-depth',type=int,default=6)
+
+   offsets_parser = subparsers.add_parser('offsets',
+                       help="offset controls applied one by one vs. batched")
+   offsets_parser.add_argument('--controls',type=int,default=1000000)
+
+   dispatch_parser = subparsers.add_parser('dispatch',
+                       help="the INI's entries vs. Lua dispatch tables")
+   dispatch_parser.add_argument('--script',default='gen_ini.py',
+                       help="INI generator script (default: gen_ini.py)")
+   dispatch_parser.add_argument('--buttons',default='LuaDispatchButtons',
+                       help="the script's list of buttons to dispatch "
+                            "(default: LuaDispatchButtons)")
+   dispatch_parser.add_argument('--events',type=int,default=200000)
+
+   args = parser.parse_args(argv)
+
+   if args.bench == 'catalog':
+      bench_catalog(args.file or _DefaultCatalogFiles,n_refs=args.refs)
+   elif args.bench == 'trace':
+      bench_trace(n_entries=args.entries,stack_depth=args.stack_depth)
+   elif args.bench == 'offsets':
+      bench_offsets(n_controls=args.controls)
+   elif args.bench == 'dispatch':
+      bench_dispatch(args.script,buttons_var=args.buttons,
+                     n_events=args.events)
+
+if __name__ == '__main__':
+   main()
@@ -1,6 +1,6 @@
 """
 buttons.py -- Button helpers
-Version 20210620-0-f6d579c
+Version 20261017-0
 
 The MIT License (MIT)
 Copyright © 2021 Blake Buhlig
@@ -32,9 +32,13 @@ TODO
 
 """
 from enum import Enum
-from .utils import val, gen_trace_str
+from .utils import val, capture_trace
+from .entries import ButtonEntry
+from .condexpr import CondOperand, is_cond_expr, compile_conds
 from . import _globals
-from .offsets import OffsetCondition
+from .offsets import OffsetCondition, OffsetControl, OffsetSize
+from .conditions import ButtonCondition, as_cond
+from .virtbtns import is_virtual_joy, VirtualButtonOffset
 from . import controls
 
 
@@ -45,24 +49,7 @@ class ButtonAction(Enum):
    HOLD    = 'H'
    PRESS_AND_RELEASE = ''
 
-class ButtonCondition:
-   class Test(Enum):
-      PRESSED  = {False:'-',  True:'+' }
-      FLAG_SET = {False:'F-', True:'F+'}
-
-   def __init__(self, joycode, btncode, condition_test, condition_state):
-      self._joycode = joycode
-      self._btncode = btncode
-      self._condition_test = condition_test
-      self._condition_state = condition_state
-
-   def __str__(self):
-      return ''.join(map(str,[
-                      '(',
-                      self._condition_test.value[bool(self._condition_state)],
-                      self._joycode, ',', self._btncode, ')']))
-
-class ButtonEnum(Enum):
+class ButtonEnum(CondOperand,Enum):
    @property
    def joycode(self):
       return f'{val(self.JoystickCode)},{val(self)}'
@@ -97,34 +84,40 @@ class ButtonEnum(Enum):
 
       return 256*self.JoystickCode+val(self)
 
+   # The offset control of the DWord at 0x3340 with the virtual button's bit
    def _virt_btn_ctrl(self):
-      if self.JoystickCode < 64 or self.JoystickCode > 72:
+      if not is_virtual_joy(self.JoystickCode):
          raise RuntimeError(f"Bad JoystickCode {self.JoystickCode}, must be 64-72")
 
       btncode=val(self)
-      if btncode < 0 or self.JoystickCode > 31:
+      if btncode < 0 or btncode > 31:
          raise RuntimeError(f"Bad button code {btncode}, must be 0-31")
 
-      return OffsetCtrl(offset=0x3340+((self.JoystickCode-64) *4),
-                        size=OffsetSize.Int32, llimit=0, ulimit=31)
+      return OffsetControl(offset=VirtualButtonOffset+((self.JoystickCode-64)*4),
+                           size=OffsetSize.Int32)
 
    # Use this property to get the offset control for pressing the virtual button
    @property
    def VirtPress(self):
-      return self._virt_btn_ctrl.op(OffsetCtrl.Operation.Setbits,1 << val(self))
+      return self._virt_btn_ctrl().op(OffsetControl.Operation.Setbits,1 << val(self))
 
    # Use this property to get the offset control for releasing the virtual button
    @property
    def VirtRelease(self):
-      return self._virt_btn_ctrl.op(OffsetCtrl.Operation.Clearbits,1 << val(self))
+      return self._virt_btn_ctrl().op(OffsetControl.Operation.Clrbits,1 << val(self))
 
    # Use this property to get the offset control for toggling the virtual button
    @property
    def VirtToggle(self):
-      return self._virt_btn_ctrl.op(OffsetCtrl.Operation.Togglebits,1 << val(self))
+      return self._virt_btn_ctrl().op(OffsetControl.Operation.Togglebits,1 << val(self))
 
 
-def btnmap(button,control,conds=[],action=ButtonAction.PRESS):
+# Record the entries mapping button to control in the current section, see
+# entries.py. conds is a list of conditions that must all hold, or a
+# condition expression, see condexpr.py, which raises ValueError if it can
+# never hold. repeat is how many times FSUIPC is to send the control, i.e.
+# how many copies of each entry to render. Returns the new ButtonEntry's.
+def btnmap(button,control,conds=[],action=ButtonAction.PRESS,repeat=1):
 
    if action == ButtonAction.PRESS_AND_RELEASE:
       act = [ButtonAction.PRESS,ButtonAction.RELEASE]
@@ -141,38 +134,38 @@ def btnmap(button,control,conds=[],action=ButtonAction.PRESS):
    elif isinstance(control,tuple):
       control, param = control
 
-   for action in act:
-      s = val(action)
-
+   if is_cond_expr(conds):
+      # One set of entries per condition list the expression compiles to
+      cond_lists = compile_conds(conds)
+      if not cond_lists:
+         raise ValueError(f'{button}: the condition expression never holds, '
+                          f'nothing would be mapped')
+   else:
       if not isinstance(conds,list):
          conds=[conds]
 
       offset_conditions=list()
       button_conditions=list()
-      for cond in conds:
+      for cond in map(as_cond,conds): # ButtonEnum's default to CondPressed
          if isinstance(cond, OffsetCondition):
             offset_conditions.append(cond)
-         elif hasattr(cond, 'CondPressed'): # ButtonEnum duck-typing
-            button_conditions.append(cond.CondPressed) # Default ButtonEnum's to their CondPressed
-         else: # ButtonCondition, or string ... either way append it raw
+         else:
             button_conditions.append(cond)
+      cond_lists = [(button_conditions,offset_conditions)]
 
+   if hasattr(control,'ctrlcode'):
+      ctrlcode=control.ctrlcode
+   else:
+      ctrlcode=control
 
-      if len(button_conditions) > 0:
-         s = f"C{s}{''.join(map(lambda x : str(val(x)),button_conditions))}"
-
-      if len(offset_conditions) > 0:
-         s = f"{' '.join(map(str,offset_conditions))} {s}"
-
-      if hasattr(control,'ctrlcode'):
-         ctrlcode=control.ctrlcode
-      else:
-         ctrlcode=control
-
-
-      s = s + f'{val(button.joycode)},{ctrlcode},{val(param)}'
-
-      _globals.Section_idx += 1
+   joy, btn = val(button.joycode).split(',')
 
-      print(f'{_globals.Section_idx}={s} ;{gen_trace_str()}')
+   entries = list()
+   for button_conditions, offset_conditions in cond_lists:
+      for action in act:
+         entries.append(ButtonEntry(joy,int(btn),val(action),ctrlcode,
+                                    val(param),button_conditions,
+                                    offset_conditions,capture_trace(),repeat))
 
+   _globals.Section_entries.extend(entries)
+   return entries
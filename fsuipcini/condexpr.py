@@ -0,0 +1,326 @@
+"""
+condexpr.py -- Boolean condition expressions compiled to FSUIPC entries
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+WARNING: This is a prototype work-in-progress; expect problems.
+
+FSUIPC only ANDs the conditions of an entry, so anything else takes several
+entries. Conditions can instead be combined with &, | and ~ (or And(), Or()
+and Not()), e.g.
+
+   btnmap(Bravo.ROTENC_INC, ctrl,
+          conds=(Alpha.ROTARYSEL_4 | Alpha.ROTARYSEL_5) & ~AlphaTrig.CLICK1)
+
+and btnmap() compiles the expression into as few entries as possible:
+Quine-McCluskey yields the implicants of the expression, then a branch and
+bound search picks the smallest set of them that covers it. Since FSUIPC
+fires every entry whose conditions hold, the implicants picked must not
+overlap, or the control would be sent more than once.
+
+Operands are ButtonEnum's (meaning pressed), ButtonCondition's,
+OffsetCondition's and condition strings such as "(-A,0)"; use Cond() to
+make a string an operand. Negating a condition yields its complementary
+FSUIPC condition: + and -, F+ and F-, = and !, <v and >v-1. Combinations of
+offset conditions that cannot hold together, e.g. B337D=0 and B337D=1, are
+treated as don't-cares.
+
+"""
+from .optimize import offset_conds_satisfiable
+
+# At most this many distinct conditions per expression
+MaxConditions = 10
+
+# Limit on the number of nodes visited searching for the minimal cover,
+# after which the best cover found so far is used
+MaxSearchNodes = 5000
+
+class CondOperand:
+   __slots__ = ()
+
+   def __and__(self,other):
+      return And(self,other)
+
+   def __rand__(self,other):
+      return And(other,self)
+
+   def __or__(self,other):
+      return Or(self,other)
+
+   def __ror__(self,other):
+      return Or(other,self)
+
+   def __invert__(self):
+      return Not(self)
+
+class CondExpr(CondOperand):
+   pass
+
+class _Const(CondExpr):
+   def __init__(self,value):
+      self.value = value
+
+   def _columns(self,var_cols,full):
+      return full if self.value else 0
+
+   def _vars(self,vars):
+      pass
+
+   def _negate(self):
+      return _Const(not self.value)
+
+class _Literal(CondExpr):
+   def __init__(self,var,positive=True):
+      self.var = var
+      self.positive = positive
+
+   def _columns(self,var_cols,full):
+      col = var_cols[self.var]
+      return col if self.positive else full & ~col
+
+   def _vars(self,vars):
+      vars.setdefault(self.var,len(vars))
+
+   def _negate(self):
+      return _Literal(self.var,not self.positive)
+
+   def __str__(self):
+      return str(_render_literal(self.var,self.positive))
+
+class _And(CondExpr):
+   def __init__(self,terms):
+      self.terms = terms
+
+   def _columns(self,var_cols,full):
+      cols = full
+      for term in self.terms:
+         cols &= term._columns(var_cols,full)
+      return cols
+
+   def _vars(self,vars):
+      for term in self.terms:
+         term._vars(vars)
+
+   def _negate(self):
+      return _Or([term._negate() for term in self.terms])
+
+class _Or(_And):
+   def _columns(self,var_cols,full):
+      cols = 0
+      for term in self.terms:
+         cols |= term._columns(var_cols,full)
+      return cols
+
+   def _negate(self):
+      return _And([term._negate() for term in self.terms])
+
+# Variables are the conditions testing for true, so that a condition and its
+# complement share one: (+J,B) for (-J,B), (F+J,B) for (F-J,B), =v for !v
+# and <v for >v-1
+def _literal(cond):
+   if cond.positive:
+      return _Literal(cond,True)
+   return _Literal(cond.complement(),False)
+
+def _render_literal(var,positive):
+   return var if positive else var.complement()
+
+def Cond(x):
+   if isinstance(x,CondExpr):
+      return x
+   if isinstance(x,(list,tuple)):
+      return And(*x)
+   if isinstance(x,bool):
+      return _Const(x)
+   # conditions.py builds on the CondOperand above
+   from .conditions import as_cond
+   return _literal(as_cond(x))
+
+def And(*terms):
+   return _And([Cond(term) for term in terms])
+
+def Or(*terms):
+   return _Or([Cond(term) for term in terms])
+
+def Not(term):
+   return Cond(term)._negate()
+
+def is_cond_expr(conds):
+   if isinstance(conds,list):
+      return any(isinstance(cond,CondExpr) for cond in conds)
+   return isinstance(conds,CondExpr)
+
+
+def _bit_count(x):
+   return bin(x).count('1')
+
+# All implicants of the function whose on-set and don't-care set are given as
+# minterm bitsets, by Quine-McCluskey: starting from the minterms as cubes
+# (mask of the variables the cube depends on, their values), merge cubes that
+# differ in a single variable until nothing merges anymore. Returns the
+# minterms of each implicant by cube.
+def _implicants(on,dc,n_vars):
+   full_mask = (1 << n_vars) - 1
+   level = {(full_mask,m): 1 << m for m in range(1 << n_vars)
+            if (on | dc) >> m & 1}
+   implicants = dict(level)
+   while level:
+      merged = dict()
+      for (mask, value), minterms in level.items():
+         bits = mask & ~value
+         while bits:
+            bit = bits & -bits
+            bits ^= bit
+            other = level.get((mask,value | bit),None)
+            if other is not None:
+               merged[(mask & ~bit,value)] = minterms | other
+      implicants.update(merged)
+      level = merged
+   return implicants
+
+def _cube_minterms(mask,value,var_cols,full):
+   bits = full
+   for i, col in enumerate(var_cols):
+      if mask >> i & 1:
+         bits &= col if value >> i & 1 else full & ~col
+   return bits
+
+# The smallest set of mutually disjoint implicants covering the on-set, by
+# fewest implicants then fewest conditions
+def _disjoint_cover(on,candidates):
+   if not on:
+      return []
+
+   by_minterm = dict()
+   for cand in candidates:
+      bits = cand[0]
+      while bits:
+         bit = bits & -bits
+         bits ^= bit
+         by_minterm.setdefault(bit,list()).append(cand)
+   # Implicants covering the most first, so the first cover found is the
+   # greedy one; minterms with the fewest implicants first, to prune early
+   for cands in by_minterm.values():
+      cands.sort(key=lambda c: (-c[1],c[2]))
+   order = sorted(by_minterm,key=lambda m: len(by_minterm[m]))
+   largest = max(c[1] for c in candidates)
+
+   best = [None,None]
+   nodes = [0]
+   def search(uncovered,chosen,n_literals):
+      if not uncovered:
+         if best[0] is None or (len(chosen),n_literals) < best[1]:
+            best[0], best[1] = list(chosen), (len(chosen),n_literals)
+         return
+      nodes[0] += 1
+      if nodes[0] > MaxSearchNodes and best[0] is not None:
+         return
+      # Every implicant still to pick covers at most largest minterms
+      bound = len(chosen) - (-_bit_count(uncovered) // largest)
+      if best[0] is not None and (bound,n_literals) >= best[1]:
+         return
+      minterm = next(m for m in order if uncovered & m)
+      for cand in by_minterm[minterm]:
+         if cand[0] & ~uncovered:
+            continue
+         chosen.append(cand)
+         search(uncovered & ~cand[0],chosen,n_literals + cand[2])
+         chosen.pop()
+
+   search(on,[],0)
+   return best[0]
+
+# Compile a condition expression into the condition lists of the fewest
+# entries that together fire exactly when it holds. Each condition list
+# is a (ButtonCondition's, OffsetCondition's) tuple of lists; no list at
+# all means the expression never holds, one empty list that it always does.
+def compile_conds(expr):
+   expr = Cond(expr)
+   vars = dict()
+   expr._vars(vars)
+   n_vars = len(vars)
+   if n_vars > MaxConditions:
+      raise ValueError(f'{n_vars} distinct conditions in expression, at most '
+                       f'{MaxConditions} supported')
+
+   # Truth table columns as bitsets over the 2^n_vars minterms
+   full = (1 << (1 << n_vars)) - 1
+   var_cols = list()
+   for i in range(n_vars):
+      col = 0
+      for m in range(1 << n_vars):
+         if m >> i & 1:
+            col |= 1 << m
+      var_cols.append(col)
+   cols_by_var = dict(zip(vars,var_cols))
+   on = expr._columns(cols_by_var,full)
+
+   # Don't-cares: minterms asserting offset conditions that cannot all hold
+   dc = 0
+   groups = dict()
+   for var, i in vars.items():
+      if hasattr(var,'offset'): # OffsetCondition duck-typing
+         groups.setdefault((var.size,var.offset,var.mask),
+                           list()).append((var,i))
+   for group in groups.values():
+      if len(group) < 2:
+         continue
+      for assign in range(1 << len(group)):
+         conds = [_render_literal(var,assign >> j & 1)
+                  for j, (var, _) in enumerate(group)]
+         if not offset_conds_satisfiable(conds):
+            mask = value = 0
+            for j, (_, i) in enumerate(group):
+               mask |= 1 << i
+               value |= (assign >> j & 1) << i
+            dc |= _cube_minterms(mask,value,var_cols,full)
+   on &= ~dc
+
+   # Implicants as (on-set minterms covered, their count, number of
+   # conditions, cube), keeping only the one with the fewest conditions per
+   # distinct set of minterms covered
+   candidates = dict()
+   for (mask, value), minterms in _implicants(on,dc,n_vars).items():
+      bits = minterms & on
+      if bits:
+         cand = (bits,_bit_count(bits),_bit_count(mask),(mask,value))
+         if bits not in candidates or cand[2] < candidates[bits][2]:
+            candidates[bits] = cand
+
+   var_list = list(vars)
+   cond_lists = list()
+   for _, _, _, (mask, value) in _disjoint_cover(on,list(candidates.values())):
+      button_conds = list()
+      offset_conds = list()
+      for i, var in enumerate(var_list):
+         if mask >> i & 1:
+            cond = _render_literal(var,value >> i & 1)
+            if hasattr(var,'offset'): # OffsetCondition duck-typing
+               offset_conds.append(cond)
+            else:
+               button_conds.append(cond)
+      cond_lists.append((button_conds,offset_conds))
+   return cond_lists
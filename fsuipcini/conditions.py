@@ -0,0 +1,148 @@
+"""
+conditions.py -- FSUIPC button conditions and condition parsing
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+WARNING: This is a prototype work-in-progress; expect problems.
+
+An entry's conditions are kept as ButtonCondition and OffsetCondition
+objects from btnmap() through to the INI writer, which renders them with
+str(). Anything that still comes as text, i.e. condition strings such as
+"(-A,0)" given to btnmap() or Cond() and the conditions of entries read back
+from an INI by entries.parse_entry(), goes through parse_cond() here, and
+nowhere else.
+
+"""
+import re
+from enum import Enum
+from .condexpr import CondOperand
+from .offsets import OffsetCondition, OffsetSize
+from .utils import val
+
+# Conditions are interned: each distinct (joycode, button, test, state)
+# exists once, rendered once, and compares and hashes by identity. ButtonEntry
+# keeps them as is, so the sets and dicts keyed by them in optimize.py,
+# condexpr.py and luadispatch.py hash a precomputed value
+class ButtonCondition(CondOperand):
+   class Test(Enum):
+      PRESSED  = {False:'-',  True:'+' }
+      FLAG_SET = {False:'F-', True:'F+'}
+
+   __slots__ = ('_joycode','_btncode','_condition_test','_condition_state',
+                '_str','_hash')
+   _Interned = dict()
+
+   def __new__(cls, joycode, btncode, condition_test, condition_state):
+      key = (joycode, btncode, condition_test, bool(condition_state))
+      self = cls._Interned.get(key)
+      if self is None:
+         self = super().__new__(cls)
+         for name, value in zip(cls.__slots__, key + (
+               ''.join(map(str,['(',
+                                condition_test.value[bool(condition_state)],
+                                joycode, ',', btncode, ')'])),
+               hash(key))):
+            object.__setattr__(self, name, value)
+         self = cls._Interned.setdefault(key, self)
+      return self
+
+   def __setattr__(self, name, value):
+      raise AttributeError(f'{self.__class__.__name__} is immutable')
+
+   def __reduce__(self):
+      return (self.__class__, (self._joycode, self._btncode,
+                               self._condition_test, self._condition_state))
+
+   def __hash__(self):
+      return self._hash
+
+   def __str__(self):
+      return self._str
+
+   def __repr__(self):
+      return f'{self.__class__.__name__}({self._str})'
+
+   @property
+   def joy(self):
+      return self._joycode
+
+   @property
+   def btn(self):
+      return self._btncode
+
+   @property
+   def test(self):
+      return self._condition_test
+
+   @property
+   def state(self):
+      return self._condition_state
+
+   # Whether this is the pressed/set rather than the complementary test
+   @property
+   def positive(self):
+      return self._condition_state
+
+   def complement(self):
+      return ButtonCondition(self._joycode,self._btncode,
+                             self._condition_test,not self._condition_state)
+
+
+_ButtonCondRegex = re.compile(r'^\((?P<flag>F?)(?P<state>[+-])(?P<joy>[^,]+),'
+                              r'(?P<btn>\d+)\)$')
+_OffsetCondRegex = re.compile(r'^(?P<size>[BWD])(?P<offset>[0-9A-Fa-f]+)'
+                              r'(?:&x(?P<mask>[0-9A-Fa-f]+))?'
+                              r'(?P<test>[=!<>])(?P<value>-?\d+)$')
+_CondSizes = {size.condcode: size for size in OffsetSize if size.condcode}
+
+# The ButtonCondition or OffsetCondition a condition string such as "(-A,0)",
+# "(F+66,3)" or "W0BC8&xFF!1" stands for
+def parse_cond(cond):
+   m = _ButtonCondRegex.match(cond)
+   if m:
+      joy = m.group('joy')
+      test = ButtonCondition.Test.FLAG_SET if m.group('flag') else \
+             ButtonCondition.Test.PRESSED
+      return ButtonCondition(int(joy) if joy.isdigit() else joy,
+                             int(m.group('btn')),test,m.group('state') == '+')
+   m = _OffsetCondRegex.match(cond)
+   if m:
+      mask = m.group('mask')
+      return OffsetCondition(size=_CondSizes[m.group('size')],
+                             offset=int(m.group('offset'),16),
+                             condvalue=int(m.group('value')),
+                             mask=int(mask,16) if mask is not None else None,
+                             test=OffsetCondition.Test(m.group('test')))
+   raise ValueError(f'unsupported condition {cond}')
+
+# The condition object of a ButtonEnum (meaning pressed), condition object or
+# condition string
+def as_cond(cond):
+   if isinstance(cond,(ButtonCondition,OffsetCondition)):
+      return cond
+   if hasattr(cond,'CondPressed'): # ButtonEnum duck-typing
+      return cond.CondPressed
+   return parse_cond(str(val(cond)))
@@ -1,6 +1,6 @@
 """
 controls.py -- Controls helper
-Version 20210628-0-4567e73
+Version 20261017-0
 
 The MIT License (MIT)
 Copyright © 2021 Blake Buhlig
@@ -33,9 +33,19 @@ TODO
 """
 from enum import Enum
 from .utils import val
+from . import _globals
+from collections import namedtuple
+import functools
+import hashlib
+import mmap
+import os
+import pickle
 import re
+import weakref
 
 class Control:
+   __slots__ = ()
+
    def GetFullName(self,enumval):
       return self.__class__._FullNameData.get(enumval.name,None)
 
@@ -44,62 +54,430 @@ class Control:
       return f'{self.__class__._CtrlIdPrefix}{val(self)}'
 
 
+# Parsing the controls lists (in particular the several thousand line
+# "Controls List for MSFS Build 999.txt") is most of the startup time of a
+# gen_ini.py run, so the parsed name->ID tables are pickled into a cache
+# directory and reused until the source file or the parsing arguments change.
+# Set FSUIPCINI_CACHE_DIR to relocate the cache, or to an empty string to
+# disable it.
+_CATALOG_CACHE_VERSION = 2
+
+def _catalog_cache_dir():
+   cache_dir = os.environ.get('FSUIPCINI_CACHE_DIR',None)
+   if cache_dir is None:
+      base_dir = os.environ.get('LOCALAPPDATA',None) or \
+                 os.path.join(os.path.expanduser('~'),'.cache')
+      cache_dir = os.path.join(base_dir,'fsuipcini')
+   return cache_dir
+
+def _hash_fn(hasher,fn):
+   # Lambdas are recreated on every run, so identify name_filt_fn by what it
+   # does (its bytecode, constants and referenced names) rather than by id()
+   code = getattr(fn,'__code__',None)
+   if code is None:
+      hasher.update(repr((getattr(fn,'__module__',None),
+                          getattr(fn,'__qualname__',repr(fn)))).encode())
+      return
+
+   def _hash_code(c):
+      hasher.update(c.co_code)
+      hasher.update(repr(c.co_names).encode())
+      for const in c.co_consts:
+         if hasattr(const,'co_code'):
+            _hash_code(const)
+         else:
+            hasher.update(repr(const).encode())
+
+   _hash_code(code)
+   for cell in fn.__closure__ or ():
+      hasher.update(repr(cell.cell_contents).encode())
+
+def _catalog_cache_key(path,name_filt_fn,raw_name_regex,stop_on_relisting):
+   hasher = hashlib.sha256()
+   hasher.update(repr((_CATALOG_CACHE_VERSION,path,raw_name_regex,
+                       stop_on_relisting)).encode())
+   if name_filt_fn:
+      _hash_fn(hasher,name_filt_fn)
+   return hasher.hexdigest()
+
+def _load_cached_catalog(cache_fn,key):
+   try:
+      with open(cache_fn,'rb') as cache_ifh:
+         cached = pickle.load(cache_ifh)
+   except (OSError,pickle.PickleError,EOFError,AttributeError,ValueError):
+      return None
+
+   if not isinstance(cached,dict) or cached.get('key',None) != key:
+      return None
+   return cached
+
+def _store_cached_catalog(cache_fn,cached):
+   # Write to a temp file then rename so a concurrent or interrupted run never
+   # sees a partial cache file; failure to cache is never fatal.
+   tmp_fn = f'{cache_fn}.{os.getpid()}.tmp'
+   try:
+      os.makedirs(os.path.dirname(cache_fn),exist_ok=True)
+      with open(tmp_fn,'wb') as cache_ofh:
+         pickle.dump(cached,cache_ofh,protocol=pickle.HIGHEST_PROTOCOL)
+      os.replace(tmp_fn,cache_fn)
+   except OSError:
+      try:
+         os.remove(tmp_fn)
+      except OSError:
+         pass
+
+class ControlRecord(namedtuple('ControlRecord',
+                               ['ctrl_id','raw_name','name','line'])):
+   __slots__ = ()
+
+@functools.lru_cache(maxsize=None)
+def _control_line_pattern(raw_name_regex):
+   return re.compile(f"(?P<ctrl_num>\d{{4,}})\s+(?P<raw_name>{raw_name_regex})")
+
+def _iter_records(lines,name_filt_fn,raw_name_regex,stop_on_relisting):
+   match = _control_line_pattern(raw_name_regex).match
+   seen = dict()
+
+   for line in lines:
+      ctrl_match = match(line)
+      if not ctrl_match:
+         continue
+
+      raw_name = ctrl_match.group('raw_name')
+      ctrl_id = int(ctrl_match.group('ctrl_num'))
+      if seen.get(raw_name,None) == ctrl_id:
+         # The MSFS list repeats every control, first sorted by ID then by
+         # name; the first repeat marks the start of that second listing.
+         if stop_on_relisting:
+            return
+         continue
+      seen[raw_name] = ctrl_id
+
+      ctrl_name = name_filt_fn(raw_name) if name_filt_fn else raw_name
+      yield ControlRecord(ctrl_id,raw_name,ctrl_name,line.rstrip('\r\n'))
+
+def _iter_mmap_lines(ctrls_ifh):
+   try:
+      mapped = mmap.mmap(ctrls_ifh.fileno(),0,access=mmap.ACCESS_READ)
+   except ValueError: # Empty files can't be mapped
+      return
+   with mapped:
+      for line in iter(mapped.readline,b''):
+         yield line.decode('utf8')
+
+# Stream ControlRecords (control ID as an int, the raw name matched by
+# raw_name_regex, the name after name_filt_fn and the source line) out of a
+# controls list file without reading it all into memory first. Controls listed
+# more than once with the same ID are only reported the first time.
+def iter_control_records(filename,
+                         name_filt_fn=None,
+                         raw_name_regex="[\w\.]+",
+                         use_mmap=False,
+                         stop_on_relisting=False):
+
+   if use_mmap:
+      with open(filename,'rb') as ctrls_ifh:
+         yield from _iter_records(_iter_mmap_lines(ctrls_ifh),name_filt_fn,
+                                  raw_name_regex,stop_on_relisting)
+   else:
+      with open(filename,'r',encoding="utf8") as ctrls_ifh:
+         yield from _iter_records(ctrls_ifh,name_filt_fn,
+                                  raw_name_regex,stop_on_relisting)
+
+def _record_group(record):
+   # custom_ctrls_info.tsv.txt lines are "ID<tab>Control<tab>Group"
+   fields = record.line.split('\t')
+   if len(fields) < 3:
+      return None
+   group = fields[2].strip()
+   return group if group and group != 'None' else None
+
+def _tabulate_records(records):
+   enum_data=dict()
+   full_name_data=dict()
+   group_data=dict()
+
+   for record in records:
+      enum_data[record.name] = str(record.ctrl_id)
+      full_name_data[record.name] = record.raw_name
+      group = _record_group(record)
+      if group:
+         group_data[record.name] = group
+
+   return enum_data, full_name_data, group_data
+
+def _iter_hashed_lines(ctrls_ifh,hasher):
+   for line in ctrls_ifh:
+      hasher.update(line)
+      yield line.decode('utf8')
+
+def _file_digest(path):
+   hasher = hashlib.sha256()
+   with open(path,'rb') as ctrls_ifh:
+      for chunk in iter(lambda: ctrls_ifh.read(1 << 20),b''):
+         hasher.update(chunk)
+   return hasher.hexdigest()
+
+# refresh re-parses the file even if cached, and caches the result anew
+def _read_catalog(filename,name_filt_fn,raw_name_regex,use_cache=True,
+                  stop_on_relisting=False,refresh=False):
+   path = os.path.abspath(filename)
+   stat = os.stat(path)
+
+   cache_dir = _catalog_cache_dir() if use_cache else ''
+   cached = None
+   if cache_dir:
+      key = _catalog_cache_key(path,name_filt_fn,raw_name_regex,
+                               stop_on_relisting)
+      cache_fn = os.path.join(cache_dir,f'{key[:32]}.catalog.pickle')
+      if not refresh:
+         cached = _load_cached_catalog(cache_fn,key)
+
+      # Unchanged size and mtime is trusted without reading the file at all
+      if cached and cached['size'] == stat.st_size and \
+                    cached['mtime_ns'] == stat.st_mtime_ns:
+         return cached['names'], cached['full_names'], cached['groups']
+
+   if cached and cached['size'] == stat.st_size and \
+                 cached['sha256'] == _file_digest(path):
+      # Touched (e.g. recopied by an installer) but not modified
+      digest = cached['sha256']
+      enum_data, full_name_data, group_data = cached['names'], \
+                                              cached['full_names'], \
+                                              cached['groups']
+   else:
+      # Hash while parsing so the file is only read once
+      hasher = hashlib.sha256()
+      with open(path,'rb') as ctrls_ifh:
+         enum_data, full_name_data, group_data = _tabulate_records(
+                                       _iter_records(
+                                          _iter_hashed_lines(ctrls_ifh,hasher),
+                                          name_filt_fn,raw_name_regex,
+                                          stop_on_relisting))
+         for chunk in iter(lambda: ctrls_ifh.read(1 << 20),b''):
+            hasher.update(chunk)
+      digest = hasher.hexdigest()
+
+   if cache_dir:
+      _store_cached_catalog(cache_fn,dict(key=key,
+                                          path=path,
+                                          size=stat.st_size,
+                                          mtime_ns=stat.st_mtime_ns,
+                                          sha256=digest,
+                                          names=enum_data,
+                                          full_names=full_name_data,
+                                          groups=group_data))
+
+   return enum_data, full_name_data, group_data
+
+
+class _CatalogControl(Control):
+   __slots__ = ('_name_','_value_')
+
+   def __init__(self,name,value):
+      self._name_ = name
+      self._value_ = value
+
+   @property
+   def name(self):
+      return self._name_
+
+   @property
+   def value(self):
+      return self._value_
+
+   def __repr__(self):
+      return f'<{self.__class__.__name__}.{self._name_}: {self._value_!r}>'
+
+   def __str__(self):
+      return f'{self.__class__.__name__}.{self._name_}'
+
+   # The member class is made per catalog, so a member pickles as its
+   # catalog's and its own name, and unpickles as the member of the live
+   # catalog of that name
+   def __reduce__(self):
+      return (_catalog_member,(self.__class__.__name__,self._name_))
+
+# The member name of the most recently loaded catalog named catalog_name
+def _catalog_member(catalog_name,name):
+   for catalog in reversed(loaded_catalogs()):
+      if catalog.__name__ == catalog_name:
+         return catalog[name]
+   raise pickle.UnpicklingError(f'no control catalog {catalog_name} is '
+                                f'loaded to look up {name} in')
+
+class ControlCatalog:
+   # Stand-in for the Enum that CreateControls otherwise builds. Only the
+   # name->ID index is kept up front; member objects are created on first
+   # access and then reused, so "SimCtrl.X is SimCtrl.X" still holds and
+   # members behave like Enum members wherever btnmap() uses them.
+   def __init__(self,name,index,full_name_data,ctrl_id_pfx,module=None,
+                group_data=None):
+      self.__name__ = name
+      self._index = index
+      self._members = dict()
+      self._by_value = None
+      self._member_cls = type(name,(_CatalogControl,),
+                              dict(__slots__=(),
+                                   __module__=module or __name__,
+                                   _FullNameData=full_name_data,
+                                   _GroupData=group_data or dict(),
+                                   _CtrlIdPrefix=ctrl_id_pfx))
+
+   @property
+   def _FullNameData(self):
+      return self._member_cls._FullNameData
+
+   @property
+   def _GroupData(self):
+      return self._member_cls._GroupData
+
+   @property
+   def _CtrlIdPrefix(self):
+      return self._member_cls._CtrlIdPrefix
+
+   def __getattr__(self,name):
+      if name.startswith('__'):
+         raise AttributeError(name)
+      try:
+         return self[name]
+      except KeyError:
+         raise AttributeError(f"{self.__name__} has no control {name}") from None
+
+   def __getitem__(self,name):
+      member = self._members.get(name,None)
+      if member is None:
+         member = self._member_cls(name,self._index[name])
+         self._members[name] = member
+      return member
+
+   def __call__(self,value):
+      # Reverse lookup by control ID, like calling an Enum class
+      if self._by_value is None:
+         self._by_value = dict()
+         for name, ctrl_num in self._index.items():
+            self._by_value.setdefault(ctrl_num,name)
+      try:
+         return self[self._by_value[str(val(value))]]
+      except KeyError:
+         raise ValueError(f"{value!r} is not a valid {self.__name__}") from None
+
+   def __contains__(self,item):
+      if isinstance(item,_CatalogControl):
+         return isinstance(item,self._member_cls)
+      return item in self._index
+
+   def __iter__(self):
+      return (self[name] for name in self._index)
+
+   def __len__(self):
+      return len(self._index)
+
+   def __repr__(self):
+      return f"<control catalog '{self.__name__}'>"
+
+   @property
+   def __members__(self):
+      return {name: self[name] for name in self._index}
+
 
 def CreateControls(enumtypename,filelist,
                    name_filt_fn=None,
                    calling_module=None,
                    raw_name_regex="[\w\.]+",
-                   ctrl_id_pfx='C'):
-
-   enum_data=dict()
-   full_name_data=dict()
+                   ctrl_id_pfx='C',
+                   use_cache=True,
+                   lazy=False,
+                   stop_on_relisting=False):
 
    if not isinstance(filelist,list):
       filelist = [filelist]
 
-   ctrls_ifh = None
-   while not ctrls_ifh and len(filelist) > 0:
-      filename = filelist.pop(0)
+   catalog = None
+   for filename in filelist:
       try:
-         ctrls_ifh = open(filename,'r', encoding="utf8")
+         catalog = _read_catalog(filename,name_filt_fn,raw_name_regex,
+                                 use_cache=use_cache,
+                                 stop_on_relisting=stop_on_relisting)
+         break
       except FileNotFoundError:
          pass
 
-   if not ctrls_ifh:
+   if not catalog:
       raise FileNotFoundError("Unable to find any file in filelist")
 
-   for line in ctrls_ifh.read().splitlines():
-      ctrl_match = re.match(f"^(?P<ctrl_num>\d{{4,}})\s+(?P<raw_name>{raw_name_regex})",line)
-      if ctrl_match:
-         raw_name = ctrl_match.group('raw_name')
-         ctrl_name = name_filt_fn(raw_name) if name_filt_fn else raw_name
-         enum_data[ctrl_name] = ctrl_match.group('ctrl_num')
-         full_name_data[ctrl_name] = raw_name_regex
+   enum_data, full_name_data, group_data = catalog
 
-   ctrls_ifh.close()
+   if lazy:
+      catalog = ControlCatalog(enumtypename,enum_data,full_name_data,
+                               ctrl_id_pfx,module=calling_module,
+                               group_data=group_data)
+      _register_catalog(catalog)
+      return catalog
 
    if calling_module:
       enumclass = Enum(value=enumtypename,names=enum_data,type=Control,module=calling_module)
    else:
       enumclass = Enum(value=enumtypename,names=enum_data,type=Control)
    enumclass._FullNameData = full_name_data
+   enumclass._GroupData = group_data
    enumclass._CtrlIdPrefix = ctrl_id_pfx
+   _register_catalog(enumclass)
    return enumclass
 
+# The catalogs CreateControls() made that are still in use, oldest first.
+# _globals.Catalogs only holds weak references, the dead ones are dropped
+# here.
+def loaded_catalogs():
+   catalogs = list()
+   live_refs = list()
+   for catalog_ref in _globals.Catalogs:
+      catalog = catalog_ref()
+      if catalog is not None:
+         catalogs.append(catalog)
+         live_refs.append(catalog_ref)
+   _globals.Catalogs[:] = live_refs
+   return catalogs
+
+def _register_catalog(catalog):
+   loaded_catalogs()
+   _globals.Catalogs.append(weakref.ref(catalog))
+
+
 
+def FsuipcCtrlNameFilter(raw_name):
+   return re.sub(pattern=r'[ /]', repl='_',
+                 string=re.sub(pattern=r'[\s*][^\w ].*',
+                               repl='',string=raw_name,count=1))
+
+FsuipcCtrlRawNameRegex = "[\w\/ ]+\w"
 
 def CreateFSUIPCControls(enumtypename,filelist="fsuipc_controls.txt",
-                         calling_module=None):
+                         calling_module=None,
+                         lazy=False):
 
    return CreateControls("FsuipcCtrl",
                          filelist,
-                         name_filt_fn=lambda n:
-                            re.sub(pattern=r'[ /]', repl='_',
-                                   string=re.sub(pattern=r'[\s*][^\w ].*',
-                                                 repl='',string=n,count=1)
-                                  ),
-                         raw_name_regex="[\w\/ ]+\w",
+                         name_filt_fn=FsuipcCtrlNameFilter,
+                         raw_name_regex=FsuipcCtrlRawNameRegex,
                          calling_module=calling_module,
-                         ctrl_id_pfx='C')
+                         ctrl_id_pfx='C',
+                         lazy=lazy)
+
+
+# Default locations of the controls lists, as used by gen_ini.py
+SimCtrlFiles = [f'{x}Controls List for MSFS Build 999.txt' for x in \
+                 ["", "c:/FSUIPC7/", "/mnt/c/FSUIPC7/"]]
+
+FsuipcCtrlFiles = ["fsuipc_controls.txt"]
 
+MBFCtrlFiles = ["custom_ctrls_info.tsv.txt",
+                "custom_ctrls_info.tsv.DEMO.txt"]
 
+# Strips the leading "MobiFlight." and everything after the event name from
+# a custom_ctrls_info.tsv.txt control
+def MBFCtrlNameFilter(raw_name):
+   return re.sub(pattern=r'MobiFlight\.',repl='', count=1,
+                 flags=re.IGNORECASE,
+                 string=re.sub(pattern=r' .*', repl='',
+                               string=raw_name,count=1))
@@ -1,6 +1,6 @@
 """
 __init__.py -- Module initializer
-Version 20210616-0-dbdc273
+Version 20261017-0
 
 The MIT License (MIT)
 Copyright © 2021 Blake Buhlig
@@ -33,10 +33,24 @@ TODO
 """
 from ..buttons import ButtonEnum
 from ..controls import Control
+from ..virtbtns import virtual_buttons, is_virtual_joy
 
 # This is here instead of in buttons.py because I don't want
 # to introduce a dependency there on controls.py
+#
+# Buttons of the virtual joysticks 64-72 are reserved in
+# virtbtns.virtual_buttons(), which raises VirtualButtonCollision if another
+# class already has one. With joycode None, the first free block of as many
+# buttons as the largest mapping needs is allocated instead, the mappings
+# being relative to its first button.
 def CreateButtons(name,joycode,mappings):
+   if joycode is None:
+      joycode, first_btn = virtual_buttons().allocate(
+                              name,max(mappings.values())+1)
+      mappings = {key: first_btn + btn for key, btn in mappings.items()}
+   elif is_virtual_joy(joycode):
+      virtual_buttons().reserve(name,joycode,mappings.values())
+
    enum_cls = ButtonEnum(name,mappings,type=Control)
    enum_cls.JoystickCode = joycode
    return enum_cls
@@ -0,0 +1,117 @@
+"""
+entries.py -- Intermediate representation of generated INI entries
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+WARNING: This is a prototype work-in-progress; expect problems.
+
+btnmap() does not write [Buttons] entries out directly but records each as a
+ButtonEntry, collected per section and only numbered and rendered when the
+section ends. Until then the entries of the section can be inspected,
+filtered or reordered through section_entries(), and parse_entry() reads
+the entries of an existing INI back into the same form.
+
+An entry renders as
+
+   [<offset conds> ]C?<action><button conds><joy>,<btn>,<ctrlcode>,<param>
+
+e.g. "B337D=0 CP(+A,133)A,12,C65883,0", where the C prefix is only present
+with button conditions. The conditions are kept as ButtonCondition and
+OffsetCondition objects, see conditions.py, and only rendered along with the
+rest of the entry.
+
+"""
+import re
+from . import _globals
+from .conditions import parse_cond
+
+class ButtonEntry:
+   __slots__ = ('joy','btn','action','ctrlcode','param',
+                'button_conds','offset_conds','trace','repeat')
+
+   def __init__(self,joy,btn,action,ctrlcode,param=0,
+                     button_conds=(),offset_conds=(),trace=None,repeat=1):
+      self.joy = joy
+      self.btn = btn
+      self.action = action
+      self.ctrlcode = ctrlcode
+      self.param = param
+      self.button_conds = tuple(button_conds)
+      self.offset_conds = tuple(offset_conds)
+      self.trace = trace
+      self.repeat = repeat
+
+   @property
+   def joycode(self):
+      return f'{self.joy},{self.btn}'
+
+   # What FSUIPC acts on, i.e. everything but the provenance and repetition
+   @property
+   def key(self):
+      return (self.joy,self.btn,self.action,self.ctrlcode,str(self.param),
+              self.button_conds,self.offset_conds)
+
+   def __str__(self):
+      s = self.action
+      if self.button_conds:
+         s = f"C{s}{''.join(map(str,self.button_conds))}"
+      if self.offset_conds:
+         s = f"{' '.join(map(str,self.offset_conds))} {s}"
+      return f'{s}{self.joy},{self.btn},{self.ctrlcode},{self.param}'
+
+   def __repr__(self):
+      return f'<ButtonEntry {self}' + \
+             (f' x{self.repeat}>' if self.repeat != 1 else '>')
+
+# The entries btnmap() collected for the current section so far
+def section_entries():
+   return _globals.Section_entries
+
+_EntryRegex = re.compile(r'^(?P<num>\d+)=(?P<offset_conds>(?:\S+ )*)'
+                         r'(?P<c>C)?(?P<action>[PURH])'
+                         r'(?P<button_conds>(?:\([^)]*\))*)'
+                         r'(?P<joy>[^,()\s]+),(?P<btn>\d+),'
+                         r'(?P<ctrlcode>[^,\s]+),(?P<param>[^\s;]+)'
+                         r'\s*(?:;(?P<trace>.*))?$')
+_BracketedRegex = re.compile(r'\([^)]*\)')
+
+# Parse a line of a [Buttons] section into (entry number, ButtonEntry), or
+# None if it is not a button entry, e.g. a fixed token or a trace comment.
+# Raises ValueError on conditions parse_cond() does not support.
+def parse_entry(line):
+   m = _EntryRegex.match(line.strip())
+   if not m or (m.group('button_conds') and not m.group('c')):
+      return None
+
+   param = m.group('param')
+   return (int(m.group('num')),
+           ButtonEntry(m.group('joy'),int(m.group('btn')),m.group('action'),
+                       m.group('ctrlcode'),
+                       int(param) if param.isdigit() else param,
+                       map(parse_cond,_BracketedRegex.findall(
+                                         m.group('button_conds'))),
+                       map(parse_cond,m.group('offset_conds').split()),
+                       m.group('trace')))
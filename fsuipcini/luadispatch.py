@@ -0,0 +1,408 @@
+"""
+luadispatch.py -- Dispatch selected buttons from a generated Lua plugin
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+
+An alternative backend for heavily overloaded buttons. FSUIPC scans the
+[Buttons] entries of a button one by one on every event, testing the
+conditions of each. For the buttons selected with LuaDispatch.select(),
+the entries are instead compiled into a DispatchTable:
+
+ - the variables are the distinct conditions of the button's entries, i.e.
+   the pressed or flag state of other buttons and the offset tests, and
+   their current values make up the key, one bit per variable,
+ - the entries are grouped by shape, the set of variables their conditions
+   test, with a hash table per shape and per press and release mapping the
+   key's bits of those variables to the controls the entries send,
+ - shapes are merged while the tables stay small, repeating an entry's row
+   for each value of the variables the merged shape adds, so that a button
+   usually needs only a few lookups.
+
+render() emits a Lua plugin that registers the buttons with event.button
+and, on each event, computes the key by testing each variable once and
+looks it up in each shape's table, sending the controls found in the order
+of the entries. The cost is one test per variable and one lookup per shape,
+e.g. a few for a button overloaded in a dozen modes, where FSUIPC tests the
+conditions of every one of the button's entries. The selected buttons' entries
+are left out of the [Buttons] section; start the plugin like the others,
+e.g. from [Auto].
+
+A button stays in the INI, with the reason reported by LuaDispatch.skipped,
+if it has entries acting while held (R or H), more than MaxVariables
+variables, keypress or other controls the plugin cannot send, a condition on
+its own flag, or a control that changes one of its variables: the plugin
+tests the variables once before sending anything, whereas FSUIPC tests each
+entry's conditions after sending the controls of the entries before it.
+Entries sending their control several times, btnmap(...,repeat=n), are
+dispatched with the control repeated n times in their row.
+
+gen_ini.py --lua-dispatch FILE moves the buttons it selects into FILE, and
+
+   python3 -m fsuipcini.bench dispatch --script gen_ini.py
+
+compares the work of the two backends, see bench.py.
+
+"""
+import re
+from collections import namedtuple
+from .conditions import ButtonCondition
+from .luagen import joy_number, write_atomic
+from .offsets import OffsetControl
+from .utils import val
+from .virtbtns import is_virtual_joy, VirtualButtonOffset, VirtualJoyCount
+
+# The key of the variables' values must fit the 32 bit integers of Lua's
+# logic library
+MaxVariables = 31
+
+# How many hash table rows a button's shapes may be expanded to, per entry
+# and at least, when merging them to save lookups
+RowsPerEntry = 8
+MinRows = 64
+
+_ControlRegex = re.compile(r'^C(?P<code>\d+)$')
+_FlagControls = ('C1003','C1004','C1005')
+
+# The event.button() downup values of press and release
+_DownUp = {'P': 1, 'U': 0}
+
+# FSUIPC's virtual buttons, see virtbtns.py
+_VirtualButtonOffsets = (VirtualButtonOffset,
+                         VirtualButtonOffset+4*VirtualJoyCount)
+
+# A condition as (variable, wanted value), where the variable is the
+# condition testing for true, e.g. (+A,1) for (-A,1)
+def _literal(cond):
+   if isinstance(cond,ButtonCondition):
+      return (cond if cond.state else cond.complement()), cond.state
+   return cond, True
+
+class DispatchTable:
+   def __init__(self,joy,btn,entries):
+      self.joy = joy
+      self.btn = btn
+      self.n_entries = sum(entry.repeat for entry in entries)
+
+      variables = dict()
+      # {action: {mask: {want: [(entry index, control), ...]}}}
+      shapes = dict()
+      for index, entry in enumerate(entries):
+         mask = want = 0
+         for cond in entry.offset_conds + entry.button_conds:
+            variable, value = _literal(cond)
+            bit = 1 << variables.setdefault(variable,len(variables))
+            mask |= bit
+            want |= bit if value else 0
+         row = shapes.setdefault(entry.action,dict()).setdefault(
+                  mask,dict()).setdefault(want,list())
+         row.extend([(index,(entry.ctrlcode,val(entry.param)))]*entry.repeat)
+      self.variables = tuple(variables)
+
+      # {action: ((mask, {want: ((entry index, control), ...)}), ...)}
+      self.shapes = {action: tuple((mask,{want: tuple(row)
+                                          for want, row in rows.items()})
+                                   for mask, rows in _merge_shapes(
+                                      list(by_mask.items()),
+                                      max(MinRows,RowsPerEntry*len(entries))))
+                     for action, by_mask in shapes.items()}
+
+   @property
+   def joycode(self):
+      return f'{self.joy},{self.btn}'
+
+   # The key of the variables' current values, as evaluated by test(variable)
+   def key(self,test):
+      key = 0
+      for i, variable in enumerate(self.variables):
+         if test(variable):
+            key |= 1 << i
+      return key
+
+   # The controls the entries of action send given the key, in entry order
+   def controls(self,action,key):
+      hits = [row for mask, rows in self.shapes.get(action,())
+              for row in (rows.get(key & mask),) if row]
+      if len(hits) > 1:
+         hits = [sorted(hit for row in hits for hit in row)]
+      return tuple(control for row in hits for _, control in row)
+
+# The shape (mask, rows) of the entries of both shapes a and b, with the
+# rows of each repeated for every value of the variables only the other tests
+def _merge_shape(a,b):
+   mask = a[0] | b[0]
+   rows = dict()
+   for shape_mask, shape_rows in (a,b):
+      extra = [1 << i for i in range(mask.bit_length())
+               if (mask & ~shape_mask) >> i & 1]
+      for want, row in shape_rows.items():
+         for n in range(1 << len(extra)):
+            key = want
+            for i, bit in enumerate(extra):
+               if n >> i & 1:
+                  key |= bit
+            rows[key] = sorted(rows.get(key,[]) + list(row))
+   return mask, rows
+
+# Merge the shapes pairwise, cheapest first, for fewer lookups per event
+# while the rows of all the shapes stay within max_rows
+def _merge_shapes(shapes,max_rows):
+   while len(shapes) > 1:
+      n_rows = sum(len(rows) for _, rows in shapes)
+      best = None
+      for i in range(len(shapes)):
+         for j in range(i+1,len(shapes)):
+            mask = shapes[i][0] | shapes[j][0]
+            growth = sum(len(rows) * ((1 << bin(mask & ~m).count('1')) - 1)
+                         for m, rows in (shapes[i],shapes[j]))
+            if best is None or growth < best[0]:
+               best = (growth,i,j)
+      growth, i, j = best
+      if n_rows + growth > max_rows:
+         break
+      merged = _merge_shape(shapes[i],shapes[j])
+      shapes = [shape for k, shape in enumerate(shapes) if k not in (i,j)]
+      shapes.append(merged)
+   return shapes
+
+# Why the entries of the button joy,btn cannot be dispatched from Lua, or
+# None if they can
+def _not_compilable(joy,btn,entries):
+   variables = set()
+   offset_ranges = list()
+   for entry in entries:
+      if entry.action not in _DownUp:
+         return f'{entry.action} entries'
+      for cond in entry.offset_conds + entry.button_conds:
+         if isinstance(cond,ButtonCondition):
+            if cond.test == ButtonCondition.Test.FLAG_SET and \
+               (str(cond.joy),cond.btn) == (joy,btn):
+               return 'condition on its own flag'
+         else:
+            offset_ranges.append((cond.offset,cond.offset+4))
+         variables.add(_literal(cond)[0])
+   if len(variables) > MaxVariables:
+      return f'{len(variables)} variables'
+
+   button_vars = [v for v in variables if isinstance(v,ButtonCondition)]
+   virtual_conds = any(is_virtual_joy(v.joy) for v in button_vars)
+   flag_conds = {v for v in button_vars
+                 if v.test == ButtonCondition.Test.FLAG_SET}
+   for entry in entries:
+      ctrlcode = str(entry.ctrlcode)
+      decoded = OffsetControl.decode(ctrlcode,entry.param)
+      if decoded is not None:
+         start, end = decoded.offset, decoded.offset + 8
+         if any(start < hi and lo < end for lo, hi in offset_ranges) or \
+            (virtual_conds and start < _VirtualButtonOffsets[1] and
+             _VirtualButtonOffsets[0] < end):
+            return f'{ctrlcode} changes a condition'
+      elif not _ControlRegex.match(ctrlcode) or \
+           not isinstance(val(entry.param),int):
+         return f'control {ctrlcode},{entry.param}'
+      elif ctrlcode in _FlagControls and flag_conds:
+         return f'{ctrlcode} may change a condition'
+   return None
+
+class LuaDispatch:
+   def __init__(self):
+      self.selected = set()
+      self.tables = list()
+      self.skipped = dict()
+
+   # Dispatch the given buttons, or all the buttons of the given
+   # CreateButtons() classes, from Lua
+   def select(self,*buttons):
+      for button in buttons:
+         members = list(button) if isinstance(button,type) else [button]
+         for member in members:
+            joy, btn = val(member.joycode).split(',')
+            self.selected.add((joy,int(btn)))
+
+   # Compile the entries of the selected buttons in the [Buttons] section
+   # into DispatchTables, returning the rest of the entries
+   def take(self,section_name,entries):
+      if section_name != 'Buttons' or not self.selected:
+         return entries
+      by_button = dict()
+      for entry in entries:
+         key = (str(entry.joy),int(entry.btn))
+         if key in self.selected:
+            by_button.setdefault(key,list()).append(entry)
+
+      taken = set()
+      for (joy, btn), btn_entries in by_button.items():
+         reason = _not_compilable(joy,btn,btn_entries)
+         if reason:
+            self.skipped[f'{joy},{btn}'] = reason
+            continue
+         self.tables.append(DispatchTable(joy,btn,btn_entries))
+         taken.update(map(id,btn_entries))
+      return [entry for entry in entries if id(entry) not in taken]
+
+   def render(self,joy_numbers=dict(),newline='\n'):
+      return render_lua(self.tables,joy_numbers).replace('\n',newline)
+
+   # Write the plugin to fn, with Windows line endings like the INI
+   def write(self,fn,joy_numbers=dict()):
+      write_atomic(fn,self.render(joy_numbers,'\r\n'))
+
+
+# Lua reading an offset condition's value
+_LuaRead = {'B': 'ipc.readUB', 'W': 'ipc.readUW', 'D': 'ipc.readUD'}
+_LuaTest = {'=': '==', '!': '~=', '<': '<', '>': '>'}
+# ipc read/write suffixes per offset control size, unsigned and signed
+_LuaSizes = {1: ('UB','SB'), 2: ('UW','SW'), 3: ('UD','SD'),
+             0: ('FLT','FLT'), 4: ('DBL','DBL')}
+
+def _lua_variable(variable,joy_numbers):
+   if isinstance(variable,ButtonCondition):
+      test = 'ipc.testbuttonflag' \
+             if variable.test == ButtonCondition.Test.FLAG_SET \
+             else 'ipc.testbutton'
+      return f"{test}({joy_number(variable.joy,joy_numbers)}," \
+             f"{variable.btn})"
+   read = f"{_LuaRead[variable.size.condcode]}(0x{variable.offset:04X})"
+   if variable.mask is not None:
+      read = f"logic.And({read},0x{variable.mask:X})"
+   return f"{read} {_LuaTest[variable.test.value]} {variable.condvalue}"
+
+def _lua_offset_control(ctrl):
+   Op = OffsetControl.Operation
+   op, offset = ctrl.operation, f'0x{ctrl.offset:04X}'
+   unsigned, signed = _LuaSizes[ctrl.size]
+   if op in (Op.FloatSet,Op.FloatInc):
+      # As OffsetSpace.apply_decoded() does it
+      fsfx = _LuaSizes[ctrl.size if ctrl.size in (0,4) else 4][0]
+      operand = ctrl.operand - (1 << 32) if ctrl.operand & (1 << 31) \
+                else ctrl.operand
+      if op == Op.FloatSet:
+         return f'ipc.write{fsfx}({offset},{operand})'
+      return f'ipc.write{fsfx}({offset},ipc.read{fsfx}({offset})+{operand})'
+   if op == Op.Set:
+      return f'ipc.write{unsigned}({offset},{ctrl.operand})'
+   if op in (Op.Setbits,Op.Clrbits,Op.Togglebits):
+      fn = {Op.Setbits: 'setbits', Op.Clrbits: 'clearbits',
+            Op.Togglebits: 'togglebits'}[op]
+      return f'ipc.{fn}{unsigned}({offset},{ctrl.operand})'
+   sfx = signed if op in (Op.IncrementSigned,Op.DecrementSigned) else unsigned
+   read = f'ipc.read{sfx}({offset})'
+   if op in (Op.IncrementUnsigned,Op.IncrementSigned):
+      value = f'math.min({read}+{ctrl.operand},{ctrl.limit})'
+   elif op in (Op.DecrementUnsigned,Op.DecrementSigned):
+      value = f'math.max({read}-{ctrl.operand},{ctrl.limit})'
+   elif op == Op.IncrementCyclic:
+      value = f'{read}+{ctrl.operand}; if v > {ctrl.limit} then v = 0 end'
+   else:
+      value = f'{read}-{ctrl.operand}; if v < 0 then v = {ctrl.limit} end'
+   return f'local v = {value}; ipc.write{sfx}({offset},v)'
+
+def _lua_control(ctrlcode,param):
+   decoded = OffsetControl.decode(ctrlcode,param)
+   if decoded is not None:
+      return _lua_offset_control(decoded)
+   return f'ipc.control({_ControlRegex.match(ctrlcode).group("code")},' \
+          f'{param})'
+
+def render_lua(tables,joy_numbers=dict()):
+   lines = ['-- Generated by fsuipcini.luadispatch, do not edit; see',
+            '-- luadispatch.py for how the tables below are built.','']
+
+   # One function per distinct control sent
+   functions = dict()
+   for table in tables:
+      for shapes in table.shapes.values():
+         for mask, rows in shapes:
+            for row in rows.values():
+               for _, control in row:
+                  if control not in functions:
+                     functions[control] = f'_c{len(functions)+1}'
+                     lines.append(f'local function {functions[control]}() '
+                                  f'{_lua_control(*control)} end '
+                                  f'-- {control[0]},{control[1]}')
+   lines += ['','_Dispatch = {}']
+
+   registrations = list()
+   for table in tables:
+      joynum = joy_number(table.joy,joy_numbers)
+      lines.append(f'_Dispatch[{joynum*256+table.btn}] = {{ -- '
+                   f'{table.joycode}, {table.n_entries} entries')
+      lines.append('  key = function()')
+      lines.append('    local k = 0')
+      for i, variable in enumerate(table.variables):
+         test = _lua_variable(variable,joy_numbers)
+         lines.append(f'    if {test} then k = k + {1 << i} end')
+      lines += ['    return k','  end,']
+      # Rows are flat lists of entry index, control function, ...
+      for action, shapes in sorted(table.shapes.items()):
+         lines.append(f'  [{_DownUp[action]}] = {{')
+         for mask, rows in shapes:
+            lines.append(f'    {{mask = {mask}, rows = {{')
+            for want, row in sorted(rows.items()):
+               cells = ','.join(f'{index},{functions[control]}'
+                                for index, control in row)
+               lines.append(f'      [{want}] = {{{cells}}},')
+            lines.append('    }},')
+         lines.append('  },')
+      lines.append('}')
+      downup = sum({'P': 1, 'U': 2}[action] for action in table.shapes)
+      registrations.append(f"event.button({joynum},{table.btn},{downup},"
+                           f"'_dispatch')")
+
+   lines += ['',
+             '-- The rows a and b merged in entry index order',
+             'local function _merge(a,b)',
+             '  local merged, i, j = {}, 1, 1',
+             '  while i <= #a or j <= #b do',
+             '    if j > #b or (i <= #a and a[i] <= b[j]) then',
+             '      merged[#merged+1] = a[i]; merged[#merged+1] = a[i+1]',
+             '      i = i + 2',
+             '    else',
+             '      merged[#merged+1] = b[j]; merged[#merged+1] = b[j+1]',
+             '      j = j + 2',
+             '    end',
+             '  end',
+             '  return merged',
+             'end',
+             '',
+             'function _dispatch(j,b,du)',
+             '  local d = _Dispatch[j*256+b]',
+             '  local shapes = d[du]',
+             '  if shapes == nil then return end',
+             '  local k = d.key()',
+             '  local hits = nil',
+             '  for s = 1,#shapes do',
+             '    local row = shapes[s].rows[logic.And(k,shapes[s].mask)]',
+             '    if row ~= nil then',
+             '      hits = hits == nil and row or _merge(hits,row)',
+             '    end',
+             '  end',
+             '  if hits ~= nil then',
+             '    for i = 2,#hits,2 do hits[i]() end',
+             '  end',
+             'end',
+             ''] + registrations
+   return '\n'.join(lines) + '\n'
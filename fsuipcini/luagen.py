@@ -0,0 +1,254 @@
+"""
+luagen.py -- Generate the Lua plugin configuration from the button definitions
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+
+The Lua plugins shipped alongside the INI generator need the same
+joystick, button and virtual button numbers as the [Buttons] entries that
+are mapped to what they do. Rather than keeping two copies in step by hand,
+the generator script describes each plugin's configuration with the same
+CreateButtons() objects it maps, and the functions here rewrite the
+configuration part of the plugin from that:
+
+ - rotfsev.lua: update_rotfsev() replaces the init({...}) call between the
+   "-- BEGIN GENERATED" and "-- END GENERATED" lines with one entry per
+   Rotary, with the joystick number and VirtualButton() indices resolved.
+ - rotvel.lua: update_rotvel() likewise, with one entry per VelocityRotary.
+ - ovrldbtn.lua: update_ovrldbtn() rewrites the value of each assignment
+   in its CONFIGURATION section from an OverloadedButton.
+
+Joystick letters are resolved to the numbers FSUIPC passes to event
+handlers through the [JoyNames] section of the FSUIPC INI, see
+read_joy_numbers(), so nothing is looked up on the Lua side at runtime.
+Files are rewritten in place atomically, like IniUpdater does for the INI.
+
+"""
+import os
+import re
+import shutil
+import tempfile
+from collections import namedtuple
+from .luamodel import virtual_button
+from .utils import val
+
+# A rotary managed by rotfsev.lua: the physical button and the virtual
+# buttons toggled when it turns slow and fast
+Rotary = namedtuple('Rotary','button slow fast FastThresh_ms '
+                             'FastThreshFilter_cnt PressEvent ReleaseEvent',
+                    defaults=(100,0,True,False))
+
+# A rotary managed by rotvel.lua: the physical button, the virtual button
+# toggled for each of its velocity tiers, slowest first, and the interval
+# under which each tier but the first is chosen, see VelocityTierMgr.py
+VelocityRotary = namedtuple('VelocityRotary','button tiers Thresh_ms '
+                                             'Debounce_ms MaxTierStep '
+                                             'PressEvent ReleaseEvent',
+                            defaults=((100,50,25),0,0,True,False))
+
+# The button overloaded by ovrldbtn.lua and the first of its click and
+# click-and-hold virtual buttons
+OverloadedButton = namedtuple('OverloadedButton','button clicks clkNhold '
+                                                 'n_clicks_max '
+                                                 'n_click_threshold_ms '
+                                                 'btn_hold_threshold_ms',
+                              defaults=(3,300,200))
+
+_BeginGenerated = '-- BEGIN GENERATED'
+_EndGenerated = '-- END GENERATED'
+
+_JoyNameRegex = re.compile(r'^(?P<joy>\w+)(?P<guid>\.GUID)?=(?P<value>.*)$')
+
+# {joy letter: joy number} from the [JoyNames] section of an FSUIPC INI,
+# matching the letters to the numbers by device GUID
+def read_joy_numbers(ini_fn):
+   names = dict()
+   guids = dict()
+   in_joynames = False
+   with open(ini_fn,'r') as ifh:
+      for line in ifh:
+         line = line.strip()
+         if line.startswith('['):
+            in_joynames = line.lower() == '[joynames]'
+            continue
+         m = _JoyNameRegex.match(line) if in_joynames else None
+         if m:
+            (guids if m.group('guid') else names)[m.group('joy')] = \
+               m.group('value').strip()
+
+   by_guid = {guid: int(joy) for joy, guid in guids.items() if joy.isdigit()}
+   by_name = {name: int(joy) for joy, name in names.items() if joy.isdigit()}
+   joy_numbers = dict()
+   for joy in set(names) | set(guids):
+      if joy.isdigit():
+         continue
+      number = by_guid.get(guids.get(joy),by_name.get(names.get(joy)))
+      if number is not None:
+         joy_numbers[joy] = number
+   return joy_numbers
+
+# The number of joystick joy, a number or letter, by the joy_numbers from
+# read_joy_numbers()
+def joy_number(joy,joy_numbers):
+   if isinstance(joy,int) or str(joy).isdigit():
+      return int(joy)
+   if joy not in joy_numbers:
+      raise ValueError(f'no joystick number known for joystick {joy}, see '
+                       f'read_joy_numbers()')
+   return joy_numbers[joy]
+
+# The plugins' VirtualButton() index of a virtual button
+def vbtn_index(button):
+   return virtual_button(val(button.JoystickCode),val(button))
+
+# The virtual button's index, commented with the VirtualButton() call that
+# computes it, followed by sep
+def _vbtn_lua(button,sep=''):
+   return f'{vbtn_index(button)}{sep} -- VirtualButton({button.joycode})'
+
+def _lua_bool(value):
+   return 'true' if value else 'false'
+
+def rotfsev_init(rotaries,joy_numbers=dict()):
+   lines = ['init({']
+   for rotary in rotaries:
+      button = rotary.button
+      joy = val(button.JoystickCode)
+      lines += [f"  {{Joystick='{joy}',JoyNum={joy_number(joy,joy_numbers)},"
+                f"Button={val(button)}, -- {button}",
+                f'   PressEvent={_lua_bool(rotary.PressEvent)},',
+                f'   ReleaseEvent={_lua_bool(rotary.ReleaseEvent)},',
+                f"   Slow={_vbtn_lua(rotary.slow,',')}",
+                f"   Fast={_vbtn_lua(rotary.fast,',')}",
+                f'   FastThresh_ms={rotary.FastThresh_ms},',
+                f'   FastThreshFilter_cnt={rotary.FastThreshFilter_cnt}}},']
+   lines[-1] = lines[-1].rstrip(',')
+   lines.append('})')
+   return '\n'.join(lines)
+
+def rotvel_init(rotaries,joy_numbers=dict()):
+   lines = ['init({']
+   for rotary in rotaries:
+      if len(rotary.Thresh_ms) != len(rotary.tiers)-1:
+         raise ValueError(f'{rotary.button} has {len(rotary.tiers)} tiers '
+                          f'but {len(rotary.Thresh_ms)} thresholds, expected '
+                          f'one per tier but the first')
+      button = rotary.button
+      joy = val(button.JoystickCode)
+      lines += [f"  {{Joystick='{joy}',JoyNum={joy_number(joy,joy_numbers)},"
+                f"Button={val(button)}, -- {button}",
+                f'   PressEvent={_lua_bool(rotary.PressEvent)},',
+                f'   ReleaseEvent={_lua_bool(rotary.ReleaseEvent)},',
+                f'   VBtns={{']
+      lines += [f'      {_vbtn_lua(tier,",")}' for tier in rotary.tiers]
+      lines[-1] = lines[-1].replace(', --',' --',1)
+      lines += [f'   }},',
+                f"   Thresh_ms={{{','.join(map(str,rotary.Thresh_ms))}}},",
+                f'   Debounce_ms={rotary.Debounce_ms},',
+                f'   MaxTierStep={rotary.MaxTierStep}}},']
+   lines[-1] = lines[-1].rstrip(',')
+   lines.append('})')
+   return '\n'.join(lines)
+
+def ovrldbtn_config(overloaded):
+   button = overloaded.button
+   joy = val(button.JoystickCode)
+   return dict(joy=repr(joy) if isinstance(joy,str) else str(joy),
+               btn=f'{val(button)} -- {button}',
+               n_click_threshold_ms=str(overloaded.n_click_threshold_ms),
+               n_clicks_max=str(overloaded.n_clicks_max),
+               btn_hold_threshold_ms=str(overloaded.btn_hold_threshold_ms),
+               vbtn_base_clicks=_vbtn_lua(overloaded.clicks),
+               vbtn_base_clkNhold=_vbtn_lua(overloaded.clkNhold))
+
+# Replace the file fn with text, atomically
+def write_atomic(fn,text):
+   tmp_fh = tempfile.NamedTemporaryFile('w',dir=os.path.dirname(
+                                                  os.path.abspath(fn)),
+                                        newline='',prefix='.tmp-',
+                                        delete=False)
+   try:
+      tmp_fh.write(text)
+      tmp_fh.close()
+      if os.path.exists(fn):
+         shutil.copymode(fn,tmp_fh.name)
+      os.replace(tmp_fh.name,fn)
+   except BaseException:
+      tmp_fh.close()
+      os.unlink(tmp_fh.name)
+      raise
+
+# The text of the file fn after transform(its text), keeping its line
+# endings; rendering everything before writing anything lets a caller fail
+# without having touched any file
+def _transformed(fn,transform):
+   with open(fn,'r',newline='') as ifh:
+      text = ifh.read()
+   newline = '\r\n' if '\r\n' in text else '\n'
+   return transform(text.replace('\r\n','\n')).replace('\n',newline)
+
+def _replace_generated(fn,text,generated):
+   begin = text.find(_BeginGenerated)
+   end = text.find(_EndGenerated,begin)
+   if begin < 0 or end < 0:
+      raise ValueError(f'{fn} has no {_BeginGenerated} ... {_EndGenerated} '
+                       f'lines')
+   begin = text.index('\n',begin) + 1
+   return text[:begin] + generated + '\n' + text[end:]
+
+def render_rotfsev(fn,rotaries,joy_numbers=dict()):
+   generated = rotfsev_init(rotaries,joy_numbers)
+   return _transformed(fn,lambda text: _replace_generated(fn,text,generated))
+
+def render_rotvel(fn,rotaries,joy_numbers=dict()):
+   generated = rotvel_init(rotaries,joy_numbers)
+   return _transformed(fn,lambda text: _replace_generated(fn,text,generated))
+
+def _replace_assignments(fn,text,values):
+   # Leave the assignments in the --[[ ]] documentation blocks alone
+   pieces = re.split(r'(--\[\[.*?\]\])',text,flags=re.DOTALL)
+   for name, value in values.items():
+      regex = re.compile(rf'^{name}\s*=.*$',re.MULTILINE)
+      n_found = 0
+      for i in range(0,len(pieces),2):
+         pieces[i], n = regex.subn(f'{name} = {value}',pieces[i])
+         n_found += n
+      if n_found != 1:
+         raise ValueError(f'{fn} assigns {name} {n_found} times, expected 1')
+   return ''.join(pieces)
+
+def render_ovrldbtn(fn,overloaded):
+   values = ovrldbtn_config(overloaded)
+   return _transformed(fn,lambda text: _replace_assignments(fn,text,values))
+
+def update_rotfsev(fn,rotaries,joy_numbers=dict()):
+   write_atomic(fn,render_rotfsev(fn,rotaries,joy_numbers))
+
+def update_rotvel(fn,rotaries,joy_numbers=dict()):
+   write_atomic(fn,render_rotvel(fn,rotaries,joy_numbers))
+
+def update_ovrldbtn(fn,overloaded):
+   write_atomic(fn,render_ovrldbtn(fn,overloaded))
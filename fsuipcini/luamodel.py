@@ -0,0 +1,222 @@
+"""
+luamodel.py -- Python models of the event-driven Lua plugins
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+
+Base for Python models of the Lua plugins shipped alongside the INI
+generator, e.g. rotfsev.lua, so their timing parameters can be evaluated
+offline against timestamped button event traces instead of on the hardware.
+
+LuaPluginModel emulates the parts of the FSUIPC Lua API those plugins use:
+ipc.elapsedtime(), ipc.btnToggle/btnPress/btnRelease() of virtual buttons,
+and event.timer()/event.cancel(), where a timer calls its function every
+interval until cancelled and setting it again replaces it. run() feeds it a
+list of TimedEvents, firing each timer that comes due before the next
+event. Every virtual button change is recorded as a VirtualOutput along
+with the index of the event that caused it, directly or through a timer it
+set, so outputs can be scored against what the user intended.
+
+read_timed_events() reads traces with lines like
+
+   1200 P B,12 slow
+   1210 U B,12 slow
+
+i.e. the time in milliseconds, P(ress) or U(release), the button, and an
+optional label of the intended gesture, as well as the "Button changed"
+lines of an FSUIPC log with button logging on, which start with the time.
+
+"""
+import heapq
+import itertools
+import re
+from collections import namedtuple
+
+TimedEvent = namedtuple('TimedEvent','time_ms action joy btn label',
+                        defaults=(None,))
+VirtualOutput = namedtuple('VirtualOutput','time_ms action vbtn cause')
+Gesture = namedtuple('Gesture','label joy btn start_ms indices')
+
+# The vbtn number the plugins use for virtual button joy 64-72, btn 0-31,
+# as their VirtualButton() function computes it
+def virtual_button(joy,btn):
+   if not 64 <= joy <= 72:
+      raise ValueError(f'Bad joy code, must be 64-72, was {joy}')
+   if not 0 <= btn <= 31:
+      raise ValueError(f'Bad btn code, must be 0-31, was {btn}')
+   return (joy-64)*32+btn
+
+_LuaCommentRegex = re.compile(r'--\[\[.*?\]\]|--[^\n]*',re.DOTALL)
+_LuaFieldRegex = re.compile(r'(\w+)\s*=\s*(VirtualButton\(\s*\d+\s*,\s*\d+\s*\)'
+                            r"|'[^']*'|\"[^\"]*\"|[\w.]+)")
+_LuaVirtualButtonRegex = re.compile(r'VirtualButton\(\s*(\d+)\s*,\s*(\d+)\s*\)')
+
+def strip_lua_comments(text):
+   return _LuaCommentRegex.sub('',text)
+
+# The Python value of a Lua literal, or of a VirtualButton(joy,btn) call;
+# anything else, e.g. a variable, is returned as is
+def lua_value(text):
+   m = _LuaVirtualButtonRegex.match(text)
+   if m:
+      return virtual_button(int(m.group(1)),int(m.group(2)))
+   if text[0] in '\'"':
+      return text[1:-1]
+   if text in ('true','false'):
+      return text == 'true'
+   try:
+      return int(text,0)
+   except ValueError:
+      return text
+
+# The name = value assignments in text, e.g. of a Lua table constructor
+def lua_fields(text):
+   return {name: lua_value(value)
+           for name, value in _LuaFieldRegex.findall(text)}
+
+class LuaPluginModel:
+   def __init__(self):
+      self.outputs = list()
+      self._time_ms = 0
+      self._cause = None
+      self._timers = dict()   # name -> (deadline, interval, cause)
+      self._heap = list()
+      self._seq = itertools.count()
+
+   # ipc.elapsedtime()
+   def elapsedtime(self):
+      return self._time_ms
+
+   # event.timer(ms,name), with self.name() as the function called
+   def timer(self,interval_ms,name):
+      entry = (self._time_ms+interval_ms,interval_ms,self._cause)
+      self._timers[name] = entry
+      heapq.heappush(self._heap,(entry[0],next(self._seq),name,entry))
+
+   # event.cancel(name)
+   def cancel(self,name):
+      self._timers.pop(name,None)
+
+   def _output(self,action,vbtn):
+      self.outputs.append(VirtualOutput(self._time_ms,action,vbtn,self._cause))
+
+   def btn_toggle(self,vbtn):
+      self._output('T',vbtn)
+
+   def btn_press(self,vbtn):
+      self._output('P',vbtn)
+
+   def btn_release(self,vbtn):
+      self._output('U',vbtn)
+
+   # Fire the timers due at or before time_ms in deadline order
+   def _run_timers(self,time_ms,max_fired=None):
+      heap = self._heap
+      while heap and heap[0][0] <= time_ms and max_fired != 0:
+         deadline, _, name, entry = heapq.heappop(heap)
+         if self._timers.get(name) is not entry:
+            continue   # cancelled or replaced since
+         interval, cause = entry[1], entry[2]
+         self._time_ms = deadline
+         self._cause = cause
+         # Reschedule first as FSUIPC does, so the function may cancel it
+         self.timer(interval,name)
+         getattr(self,name)(deadline)
+         if max_fired is not None:
+            max_fired -= 1
+
+   def on_event(self,index,event):
+      raise NotImplementedError
+
+   def run(self,events,drain=True):
+      for index, event in enumerate(events):
+         self._run_timers(event.time_ms)
+         self._time_ms = event.time_ms
+         self._cause = index
+         self.on_event(index,event)
+      if drain:
+         # Let the timers still pending after the last event fire, bounded
+         # in case one never cancels itself
+         self._run_timers(float('inf'),max_fired=1000)
+      return self.outputs
+
+
+# Runs of labelled events on the same button, a new one starting when the
+# label changes or a press comes more than pause_ms after the prior event
+def group_gestures(events,pause_ms=700):
+   gestures = list()
+   current = dict()
+   for index, event in enumerate(events):
+      if event.label is None:
+         continue
+      key = (event.joy,event.btn)
+      gesture = current.get(key)
+      if gesture is None or gesture.label != event.label or \
+         (event.action == 'P' and
+          event.time_ms - events[gesture.indices[-1]].time_ms > pause_ms):
+         gesture = Gesture(event.label,event.joy,event.btn,event.time_ms,
+                           [index])
+         current[key] = gesture
+         gestures.append(gesture)
+      else:
+         gesture.indices.append(index)
+   return gestures
+
+_TimedEventRegex = re.compile(r'^(?P<time>\d+)\s+(?P<action>[PU])\s+'
+                              r'(?P<joy>\w+),(?P<btn>\d+)'
+                              r'(?:\s+(?P<label>\w+))?$')
+_LogButtonRegex = re.compile(r'^\s*(?P<time>\d+)\s+Button changed:.*'
+                             r'Joy=(?P<joy>\w+),\s*Btn=(?P<btn>\d+),\s*'
+                             r'(?P<state>Pressed|Released)')
+
+def read_timed_events(fn):
+   events = list()
+   with open(fn,'r') as ifh:
+      for line in ifh:
+         line = line.strip()
+         if not line or line.startswith('#'):
+            continue
+         m = _TimedEventRegex.match(line)
+         if m:
+            events.append(TimedEvent(int(m.group('time')),m.group('action'),
+                                     m.group('joy'),int(m.group('btn')),
+                                     m.group('label')))
+            continue
+         m = _LogButtonRegex.match(line)
+         if m:
+            events.append(TimedEvent(int(m.group('time')),
+                                     'P' if m.group('state') == 'Pressed'
+                                         else 'U',
+                                     m.group('joy'),int(m.group('btn'))))
+   events.sort(key=lambda event: event.time_ms)
+   return events
+
+# The q-th percentile of values by nearest rank, None if there are none
+def percentile(values,q):
+   if not values:
+      return None
+   ordered = sorted(values)
+   return ordered[min(len(ordered)-1,max(0,-(-len(ordered)*q//100)-1))]
@@ -0,0 +1,291 @@
+"""
+offsetbatch.py -- Batched execution of offset controls
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+WARNING: This is a prototype work-in-progress; expect problems.
+
+apply_batch() applies a long sequence of offset controls, given as arrays of
+their decoded fields, to an OffsetSpace with NumPy instead of one Python
+call per control, with the same result as OffsetSpace.apply_decoded() on
+each in turn.
+
+Controls on different offsets are independent, so they are grouped per
+(offset, size), keeping their order within a group. Each operation is a
+function of the offset's value, and for each group the functions compose
+into one of a few closed forms:
+
+   - Set and the inc/dec operations clamp: v -> min(max(v + a, lo), hi)
+   - Set and the bit operations are affine over GF(2): v -> (v & m) ^ x
+   - cyclic inc/dec by 1 add modulo the limit + 1
+
+Composing these is associative, so a segmented parallel prefix scan over
+all controls yields the value after every control in log2(longest group)
+vectorized steps. Groups mixing forms, float operations, limits outside the
+range of the size, and offsets overlapping other groups are applied one at
+a time as before. Without NumPy everything is.
+
+   python3 -m fsuipcini.bench offsets
+
+"""
+try:
+   import numpy as np
+except ImportError:
+   np = None
+
+from .offsets import OffsetControl, DecodedOffsetControl
+
+_Op = OffsetControl.Operation
+_Big = 1 << 62
+# Bytes per OffsetSize.ctrlcode
+_SizeBytes = {0: 4, 1: 1, 2: 2, 3: 4, 4: 8}
+
+# Decoded fields of the given (ctrlcode, param) pairs as the arrays
+# apply_batch() takes; pairs that are not offset controls are skipped
+def decode_controls(controls):
+   # Replays repeat a handful of distinct controls many times over, so each
+   # distinct one is decoded once and the arrays are gathered from a table
+   table = dict()
+   picks = list()
+   for ctrl in controls:
+      idx = table.get(ctrl,None)
+      if idx is None:
+         idx = table[ctrl] = len(table)
+      picks.append(idx)
+
+   fields = list()
+   for ctrl in table:
+      dec = OffsetControl.decode(*ctrl)
+      fields.append(None if dec is None else
+                    (dec.offset,dec.size,dec.operation.value,dec.operand,
+                     0 if dec.limit is None else dec.limit))
+   if None in fields:
+      picks = [idx for idx in picks if fields[idx] is not None]
+
+   if np is not None:
+      columns = np.array([f for f in fields if f is not None] or
+                         [(0,)*5],dtype=np.int64)
+      remap = np.cumsum([f is not None for f in fields]) - 1
+      rows = columns[remap[np.array(picks,dtype=np.intp)]] if picks else \
+             columns[:0]
+      return tuple(rows[:,i] for i in range(5))
+
+   rows = [fields[idx] for idx in picks]
+   offset, size, operation, operand, limit = zip(*rows) if rows else ((),)*5
+   return offset, size, operation, operand, limit
+
+def _apply_one_by_one(space,offset,size,operation,operand,limit,indices,
+                      results):
+   for i in indices:
+      op = _Op(int(operation[i]))
+      has_limit = _Op.IncrementUnsigned.value <= op.value <= \
+                  _Op.DecrementCyclic.value
+      value = space.apply_decoded(DecodedOffsetControl(
+                 op,int(size[i]),int(offset[i]),
+                 int(limit[i]) if has_limit else None,int(operand[i])))
+      if results is not None:
+         results[i] = value
+
+# Hillis-Steele scan of the functions fns (a tuple of arrays) within the
+# segments seg, where compose(later, earlier) composes two such functions
+def _segmented_scan(fns,seg,compose):
+   n = len(seg)
+   d = 1
+   while d < n:
+      later = tuple(f[d:] for f in fns)
+      earlier = tuple(f[:-d] for f in fns)
+      same = seg[d:] == seg[:-d]
+      if not same.any():
+         break
+      composed = compose(later,earlier)
+      fns = tuple(np.concatenate((f[:d],np.where(same,c,l)))
+                  for f, c, l in zip(fns,composed,later))
+      d *= 2
+   return fns
+
+def _compose_clamp(later,earlier):
+   a2, lo2, hi2 = later
+   a1, lo1, hi1 = earlier
+   return (a1 + a2,np.clip(lo1 + a2,lo2,hi2),np.clip(hi1 + a2,lo2,hi2))
+
+def _compose_affine(later,earlier):
+   m2, x2 = later
+   m1, x1 = earlier
+   return (m1 & m2,(x1 & m2) ^ x2)
+
+def _size_range(size,signed):
+   if size in (0,4):
+      return -_Big, _Big
+   nbits = 8*_SizeBytes[size]
+   if signed:
+      return -(1 << (nbits - 1)), (1 << (nbits - 1)) - 1
+   return 0, (1 << nbits) - 1
+
+# Apply the controls given as equal length arrays of their decoded fields,
+# i.e. DecodedOffsetControl's with operation as the Operation value and any
+# limit as 0 where there is none. Returns the value of the offset after
+# each control if results, else None.
+def apply_batch(space,offset,size,operation,operand,limit,results=False):
+   if np is None:
+      out = [None]*len(offset) if results else None
+      _apply_one_by_one(space,offset,size,operation,operand,limit,
+                        range(len(offset)),out)
+      return out
+
+   offset = np.asarray(offset,dtype=np.int64)
+   size = np.asarray(size,dtype=np.int64)
+   operation = np.asarray(operation,dtype=np.int64)
+   operand = np.asarray(operand,dtype=np.int64)
+   limit = np.asarray(limit,dtype=np.int64)
+   n = len(offset)
+   out = np.zeros(n,dtype=np.float64 if (operation >= 28).any()
+                                     else np.int64) if results else None
+   if n == 0:
+      return out
+
+   # Group per (offset, size), in order of the controls within each group
+   order = np.argsort(offset*8 + size,kind='stable')
+   s_off, s_size, s_op = offset[order], size[order], operation[order]
+   s_operand, s_limit = operand[order], limit[order]
+   starts = np.flatnonzero(np.concatenate(
+               ([True],(s_off[1:] != s_off[:-1]) | (s_size[1:] != s_size[:-1]))))
+   seg = np.cumsum(np.isin(np.arange(n),starts)) - 1
+   ends = np.append(starts[1:],n)
+   g_off, g_size = s_off[starts], s_size[starts]
+
+   def count(mask):
+      return np.add.reduceat(mask.astype(np.int64),starts)
+   n_ops = ends - starts
+   n_set = count(s_op == _Op.Set.value)
+   n_bits = count((s_op >= _Op.Setbits.value) & (s_op <= _Op.Togglebits.value))
+   n_clamp = count((s_op >= _Op.IncrementUnsigned.value) &
+                   (s_op <= _Op.DecrementSigned.value))
+   n_signed = count((s_op == _Op.IncrementSigned.value) |
+                    (s_op == _Op.DecrementSigned.value))
+   n_cyclic = count((s_op == _Op.IncrementCyclic.value) |
+                    (s_op == _Op.DecrementCyclic.value))
+   is_int = (g_size >= 1) & (g_size <= 3)
+
+   clamp = is_int & (n_clamp > 0) & (n_set + n_clamp == n_ops) & \
+           ((n_signed == 0) | (n_signed == n_clamp))
+   affine = is_int & (n_set + n_bits == n_ops)
+   cyclic = is_int & (n_cyclic == n_ops) & \
+            (np.minimum.reduceat(s_operand,starts) == 1) & \
+            (np.maximum.reduceat(s_operand,starts) == 1) & \
+            (np.minimum.reduceat(s_limit,starts) ==
+             np.maximum.reduceat(s_limit,starts))
+   signed = n_signed > 0
+
+   # Limits must be in range of the size for clamping to match the
+   # truncation of each intermediate value
+   g_lo = np.array([_size_range(int(sz),bool(sg))[0]
+                    for sz, sg in zip(g_size,signed)],dtype=np.int64)
+   g_hi = np.array([_size_range(int(sz),bool(sg))[1]
+                    for sz, sg in zip(g_size,signed)],dtype=np.int64)
+   limit_ok = np.ones(n,dtype=bool)
+   clamp_op = (s_op >= _Op.IncrementUnsigned.value) & \
+              (s_op <= _Op.DecrementCyclic.value)
+   limit_ok[clamp_op] = (s_limit[clamp_op] >= g_lo[seg[clamp_op]]) & \
+                        (s_limit[clamp_op] <= g_hi[seg[clamp_op]])
+   limits_in_range = np.logical_and.reduceat(limit_ok,starts)
+
+   # Groups sharing bytes with another group must keep their relative order
+   g_end = g_off + np.array([_SizeBytes[int(sz)] for sz in g_size])
+   prev_end = np.concatenate(([-1],np.maximum.accumulate(g_end)[:-1]))
+   cluster = np.cumsum(g_off >= prev_end)
+   overlaps = np.bincount(cluster)[cluster] > 1
+
+   v0 = np.array([space.read(int(o),int(sz),bool(sg))
+                  for o, sz, sg in zip(g_off,g_size,signed)],dtype=np.int64)
+   cyclic &= (v0 >= 0) & (v0 <= s_limit[starts])
+
+   vectorized = ~overlaps & limits_in_range
+   clamp &= vectorized
+   affine &= vectorized & ~clamp
+   cyclic &= vectorized
+   fallback = ~(clamp | affine | cyclic)
+
+   s_out = np.zeros(n,dtype=np.int64)
+   for family, fn in ((clamp,_apply_clamp),(affine,_apply_affine),
+                      (cyclic,_apply_cyclic)):
+      sel = family[seg]
+      if sel.any():
+         s_out[sel] = fn(s_op[sel],s_operand[sel],s_limit[sel],seg[sel],
+                         v0,g_size,signed)
+
+   # Write back the final value of each group applied above
+   last = ends - 1
+   for g in np.flatnonzero(~fallback):
+      space.write(int(g_off[g]),int(s_out[last[g]]),int(g_size[g]))
+   if out is not None:
+      out[order[~fallback[seg]]] = s_out[~fallback[seg]]
+
+   fallback_idx = np.sort(order[fallback[seg]])
+   if len(fallback_idx):
+      fb_out = dict() if out is not None else None
+      _apply_one_by_one(space,offset,size,operation,operand,limit,
+                        fallback_idx,fb_out)
+      if out is not None:
+         for i, value in fb_out.items():
+            out[i] = value
+   return out
+
+def _to_size(values,g_size,signed,seg):
+   nbits = 8*np.array([_SizeBytes[int(sz)] for sz in g_size])[seg]
+   mask = (np.int64(1) << nbits) - 1
+   values = values & mask
+   if signed is not None:
+      sign = signed[seg] & (values >> (nbits - 1) == 1)
+      values = np.where(sign,values - (mask + 1),values)
+   return values
+
+def _apply_clamp(op,operand,limit,seg,v0,g_size,signed):
+   is_set = op == _Op.Set.value
+   is_inc = (op == _Op.IncrementUnsigned.value) | \
+            (op == _Op.IncrementSigned.value)
+   set_value = _to_size(operand,g_size,signed,seg)
+   a = np.where(is_set,0,np.where(is_inc,operand,-operand))
+   lo = np.where(is_set,set_value,np.where(is_inc,-_Big,limit))
+   hi = np.where(is_set,set_value,np.where(is_inc,limit,_Big))
+   a, lo, hi = _segmented_scan((a,lo,hi),seg,_compose_clamp)
+   values = np.clip(v0[seg] + a,lo,hi)
+   # As apply_decoded(), Set reads the value back unsigned
+   return np.where(is_set,_to_size(values,g_size,None,seg),values)
+
+def _apply_affine(op,operand,limit,seg,v0,g_size,signed):
+   m = np.where(op == _Op.Set.value,0,
+       np.where(op == _Op.Togglebits.value,-1,~operand))
+   x = np.where(op == _Op.Clrbits.value,0,operand)
+   m, x = _segmented_scan((m,x),seg,_compose_affine)
+   return _to_size((v0[seg] & m) ^ x,g_size,signed,seg)
+
+def _apply_cyclic(op,operand,limit,seg,v0,g_size,signed):
+   step = np.where(op == _Op.IncrementCyclic.value,1,-1)
+   total = np.cumsum(step)
+   starts = np.flatnonzero(np.concatenate(([True],seg[1:] != seg[:-1])))
+   before = np.concatenate(([0],total))[starts]
+   seg_total = total - np.repeat(before,np.diff(np.append(starts,len(seg))))
+   return (v0[seg] + seg_total) % (limit + 1)
@@ -1,6 +1,6 @@
 """
 offsets.py -- Offsets helper
-Version 20210620-0-c2a0a98
+Version 20261017-0
 
 The MIT License (MIT)
 Copyright © 2021 Blake Buhlig
@@ -33,7 +33,9 @@ TODO
 """
 from .controls import Control
 from .utils import val
+from .condexpr import CondOperand
 from enum import Enum
+from collections import namedtuple
 
 class OffsetSize(Enum):
    def __init__(self,ctrlcode,condcode):
@@ -50,29 +52,84 @@ class OffsetSize(Enum):
    Float64 = (4,None)
 
 
-class OffsetCondition:
+# Interned like ButtonCondition, see conditions.py: each distinct (size,
+# offset, value, mask, test) exists once, rendered once, and compares and
+# hashes by identity
+class OffsetCondition(CondOperand):
    class Test(Enum):
       EQUAL = '='
       NOT_EQUAL = '!'
       LESS_THAN = '<'
       GREATER_THAN = '>'
 
-   def __init__(self,size,offset,condvalue,mask=None,test=Test.EQUAL):
-
-      self._size_condcode = size.condcode
-      self._offset = offset
-      self._condvalue = condvalue
-      self._mask = mask
-      self._test = test
+   __slots__ = ('_size','_offset','_condvalue','_mask','_test','_str',
+                '_hash')
+   _Interned = dict()
+
+   def __new__(cls,size,offset,condvalue,mask=None,test=Test.EQUAL):
+      key = (size,offset,condvalue,mask,test)
+      self = cls._Interned.get(key)
+      if self is None:
+         self = super().__new__(cls)
+         mask_out = f'&x{mask:X}' if mask is not None else ''
+         rendered = f'{size.condcode}{offset:04X}{mask_out}{test.value}' \
+                    f'{condvalue}'
+         for name, value in zip(cls.__slots__,key + (rendered,hash(key))):
+            object.__setattr__(self,name,value)
+         self = cls._Interned.setdefault(key,self)
+      return self
+
+   def __setattr__(self,name,value):
+      raise AttributeError(f'{self.__class__.__name__} is immutable')
+
+   def __reduce__(self):
+      return (self.__class__,(self._size,self._offset,self._condvalue,
+                              self._mask,self._test))
+
+   def __hash__(self):
+      return self._hash
 
    def __str__(self):
-      offset = self._offset
-      mask_out = f'&x{self._mask:%X}' if self._mask is not None else ''
-      test = self._test.value
-      condvalue = self._condvalue
+      return self._str
+
+   def __repr__(self):
+      return f'{self.__class__.__name__}({self._str})'
+
+   @property
+   def size(self):
+      return self._size
+
+   @property
+   def offset(self):
+      return self._offset
 
-      retval = f'{self._size_condcode}{offset:04X}{mask_out}{test}{condvalue}'
-      return retval
+   @property
+   def condvalue(self):
+      return self._condvalue
+
+   @property
+   def mask(self):
+      return self._mask
+
+   @property
+   def test(self):
+      return self._test
+
+   # Whether this is the = or < rather than the complementary ! or > test
+   @property
+   def positive(self):
+      return self._test in (self.Test.EQUAL,self.Test.LESS_THAN)
+
+   # The condition holding exactly when this one does not: = and !, <v and
+   # >v-1
+   def complement(self):
+      test, condvalue = {
+         self.Test.EQUAL:        (self.Test.NOT_EQUAL,   self._condvalue),
+         self.Test.NOT_EQUAL:    (self.Test.EQUAL,       self._condvalue),
+         self.Test.LESS_THAN:    (self.Test.GREATER_THAN,self._condvalue-1),
+         self.Test.GREATER_THAN: (self.Test.LESS_THAN,   self._condvalue+1),
+      }[self._test]
+      return OffsetCondition(self._size,self._offset,condvalue,self._mask,test)
 
 
 class OffsetControl(Control):
@@ -96,13 +153,21 @@ class OffsetControl(Control):
 
    _BITSHIFT_SIZE = 24
 
-   @property
-   def value(self):
-      c = self._operation.value << self.__class__._BITSHIFT_OPERATION
+   # The control code of operation on this offset
+   def _ctrlcode(self,operation):
+      c = operation.value << self.__class__._BITSHIFT_OPERATION
       c = c | self._size_ctrlcode << self.__class__._BITSHIFT_SIZE
       c = c | self.offset
 
-      return f'x{c:08X}'
+      return f'{self.__class__._CtrlIdPrefix}x{c:08X}'
+
+   # An offset is not a control by itself, only an operation on it is; fail
+   # loudly rather than let btnmap() map the inherited C<object> code
+   @property
+   def ctrlcode(self):
+      raise TypeError(f'{self.__class__.__name__} at 0x{self.offset:04X} has '
+                      f'no control code of its own, map one of its .op() '
+                      f'operations instead')
 
    def __init__(self,offset,size,llimit=0,ulimit=0):
       self.offset = val(offset)
@@ -110,25 +175,116 @@ class OffsetControl(Control):
       self._llimit = val(llimit)
       self._ulimit = val(ulimit)
 
+   # The OffsetOperation of operation with operand on this offset. Equal
+   # operations, of this or any other OffsetControl with the same offset,
+   # size and limits, are encoded once and return the same object.
    def op(self,operation,operand):
-      self._operation = operation
-      opval = val(operation)
-
-      if opval >= self.__class__.Operation.IncrementUnsigned.value or \
+      if not isinstance(operation,self.__class__.Operation):
+         operation = self.__class__.Operation(val(operation))
+      key = (self.offset,self._size_ctrlcode,self._llimit,self._ulimit,
+             operation,operand)
+      cached = _Operations.get(key)
+      if cached is not None:
+         return cached
+
+      opval = operation.value
+      if opval >= self.__class__.Operation.IncrementUnsigned.value and \
          opval <= self.__class__.Operation.DecrementCyclic.value:
 
          # Of the 6 inc/dec operations on integers, the 3 that
          # are increments have the 0x4 bit set in their encoding
-         # whereas the other 3 that are decrements do not
+         # whereas the other 3 that are decrements do not. The cyclic
+         # ones both take the upper limit, at which they wrap.
 
-         limit = self._llimit if (opval & 0x4 == 0) else self._ulimit
+         if opval & 0x4 or \
+            opval >= self.__class__.Operation.IncrementCyclic.value:
+            limit = self._ulimit
+         else:
+            limit = self._llimit
 
-         param = f'x{limit&((1<<16)-1):04X}{operand&((1<<16)-1):04X}'
+         param = self.__class__._inc_dec_param(limit,operand)
       else:
          param = f'x{operand&((1<<32)-1):08X}'
 
-      return (f'C{self.value}', param)
+      return _Operations.setdefault(key,OffsetOperation(
+                                           self._ctrlcode(operation),param))
+
+   @staticmethod
+   def _inc_dec_param(limit,operand):
+      return f'x{limit&((1<<16)-1):04X}{operand&((1<<16)-1):04X}'
+
+   # The OffsetOperation of a single control doing what factor repetitions
+   # of the increment or decrement control ctrl, as returned by op(), do; or
+   # None if ctrl is not one, or its scaled operand would not fit in the
+   # param's 16 bits. Cyclic ones are not scaled since they wrap to the
+   # other limit rather than by the remainder.
+   @classmethod
+   def scaled(cls,ctrl,factor):
+      if not isinstance(ctrl,tuple) or len(ctrl) != 2:
+         return None
+      decoded = cls.decode(*ctrl)
+      if decoded is None or decoded.operation not in (
+            cls.Operation.IncrementUnsigned,cls.Operation.DecrementUnsigned,
+            cls.Operation.IncrementSigned,cls.Operation.DecrementSigned):
+         return None
+      operand = decoded.operand * factor
+      if not 0 < operand < 1<<16:
+         return None
+      return OffsetOperation(ctrl[0],cls._inc_dec_param(decoded.limit,operand))
+
+   # Decode the control code and param returned by op() into a
+   # DecodedOffsetControl, or None if ctrlcode is not an offset control.
+   # Float64 shares its size code bit with the low operation bit, so it is
+   # only recognised with the float operations.
+   @classmethod
+   def decode(cls,ctrlcode,param):
+      ctrlcode = str(ctrlcode)
+      if not ctrlcode.startswith(f'{cls._CtrlIdPrefix}x'):
+         return None
+      c = int(ctrlcode[2:],16)
+      opval = c >> cls._BITSHIFT_OPERATION
+      size = (c >> cls._BITSHIFT_SIZE) & 0x3
+      if opval not in cls._OperationValues:
+         opval -= 1
+         size |= 0x4
+      operation = cls.Operation(opval)
+      offset = c & 0xFFFF
+
+      param = int(param[1:],16) if isinstance(param,str) and \
+                                  param.startswith('x') else int(param)
+      if cls.Operation.IncrementUnsigned.value <= opval <= \
+         cls.Operation.DecrementCyclic.value:
+         limit, operand = param >> 16 & 0xFFFF, param & 0xFFFF
+         if operation in (cls.Operation.IncrementSigned,
+                          cls.Operation.DecrementSigned):
+            limit = limit - 0x10000 if limit & 0x8000 else limit
+      else:
+         limit, operand = None, param & 0xFFFFFFFF
+      return DecodedOffsetControl(operation,size,offset,limit,operand)
+
+OffsetControl._OperationValues = frozenset(
+   x.value for x in OffsetControl.Operation)
+
+DecodedOffsetControl = namedtuple('DecodedOffsetControl',
+                                  'operation size offset limit operand')
 
+# An offset control as returned by OffsetControl.op(): the (ctrlcode, param)
+# of the INI entries, immutable and hashable, so it can be used anywhere a
+# (ctrlcode, param) tuple is and sent between processes
+class OffsetOperation(namedtuple('OffsetOperation','ctrlcode param')):
+   __slots__ = ()
+
+   @property
+   def decoded(self):
+      decoded = _Decoded.get(self)
+      if decoded is None:
+         decoded = _Decoded.setdefault(self,OffsetControl.decode(*self))
+      return decoded
+
+# OffsetControl.op() results by (offset, size, limits, operation, operand),
+# and OffsetOperation.decoded by operation
+_Operations = dict()
+_Decoded = dict()
 
 
 class OffsetValEnum(Enum):
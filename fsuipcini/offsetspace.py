@@ -0,0 +1,185 @@
+"""
+offsetspace.py -- Emulated FSUIPC offset space
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+WARNING: This is a prototype work-in-progress; expect problems.
+
+A stand-in for the 64KiB FSUIPC offset space, for running the offset
+controls and evaluating the offset conditions of generated entries without
+the simulator, e.g. to test trim or virtual button logic in simulator.py:
+
+   space = OffsetSpace()
+   space.apply_control(*ElvTrimCtrl.op(OffsetControl.Operation.IncrementSigned,128))
+   space.read(0x0BC0,OffsetSize.Int16,signed=True)
+
+The offsets live in a single bytearray, read and written through typed
+memoryview casts of it per OffsetSize when the offset is aligned to the
+size, and through struct otherwise.
+
+"""
+import struct
+from .conditions import parse_cond
+from .offsets import OffsetCondition, OffsetControl
+
+# struct/memoryview formats per OffsetSize.ctrlcode, unsigned and signed
+_SizeFormats = {0: ('f','f'), 1: ('B','b'), 2: ('H','h'), 3: ('I','i'),
+                4: ('d','d')}
+# OffsetSize.condcode to OffsetSize.ctrlcode
+_CondSizes = {'B': 1, 'W': 2, 'D': 3}
+
+def _size_code(size):
+   if hasattr(size,'ctrlcode'): # OffsetSize
+      return size.ctrlcode
+   if isinstance(size,str):
+      return _CondSizes[size]
+   return size
+
+# How many bytes an offset of the given size, as for read(), spans
+def size_bytes(size):
+   return struct.calcsize(_SizeFormats[_size_code(size)][0])
+
+class OffsetSpace:
+   Size = 0x10000
+
+   def __init__(self):
+      self.mem = bytearray(self.Size)
+      self.view = memoryview(self.mem)
+      self.views = {fmt: self.view.cast(fmt)
+                    for fmts in _SizeFormats.values() for fmt in fmts}
+      self._structs = {fmt: struct.Struct(f'<{fmt}') for fmt in self.views}
+      self._decoded = dict()
+
+   # An (unpack, pack) pair of functions of no argument and of the value
+   # respectively, for the given offset and size
+   def accessor(self,offset,size='D',signed=False):
+      fmt = _SizeFormats[_size_code(size)][bool(signed)]
+      st = self._structs[fmt]
+      if offset % st.size == 0:
+         view, idx = self.views[fmt], offset // st.size
+         def unpack():
+            return view[idx]
+         def pack(value):
+            view[idx] = value
+      else:
+         mem = self.mem
+         def unpack():
+            return st.unpack_from(mem,offset)[0]
+         def pack(value):
+            st.pack_into(mem,offset,value)
+      return unpack, pack
+
+   def read(self,offset,size='D',signed=False):
+      return self.accessor(offset,size,signed)[0]()
+
+   # Integers are truncated to the size, as FSUIPC would
+   def write(self,offset,value,size='D'):
+      size = _size_code(size)
+      if size in (0,4):
+         self.accessor(offset,size)[1](float(value))
+      else:
+         nbits = 8 << (size - 1) if size < 3 else 32
+         self.accessor(offset,size)[1](int(value) & ((1 << nbits) - 1))
+
+   # Apply an offset control, i.e. a control code and param pair such as
+   # returned by OffsetControl.op(). Returns the DecodedOffsetControl, or
+   # None if ctrlcode is not an offset control, in which case nothing is
+   # done.
+   def apply_control(self,ctrlcode,param):
+      key = (ctrlcode,param)
+      ctrl = self._decoded.get(key,None)
+      if ctrl is None:
+         ctrl = OffsetControl.decode(ctrlcode,param)
+         if ctrl is None:
+            return None
+         self._decoded[key] = ctrl
+      self.apply_decoded(ctrl)
+      return ctrl
+
+   # Apply a DecodedOffsetControl, returning the resulting value
+   def apply_decoded(self,ctrl):
+      Op = OffsetControl.Operation
+      op, size, offset = ctrl.operation, ctrl.size, ctrl.offset
+      limit, operand = ctrl.limit, ctrl.operand
+
+      if op in (Op.FloatSet,Op.FloatInc):
+         fsize = size if size in (0,4) else 4
+         operand = operand - (1 << 32) if operand & (1 << 31) else operand
+         value = operand if op == Op.FloatSet else \
+                 self.read(offset,fsize) + operand
+         self.write(offset,value,fsize)
+         return value
+
+      signed = op in (Op.IncrementSigned,Op.DecrementSigned)
+      value = self.read(offset,size,signed)
+      if op == Op.Set:
+         value = operand
+      elif op == Op.Setbits:
+         value |= operand
+      elif op == Op.Clrbits:
+         value &= ~operand
+      elif op == Op.Togglebits:
+         value ^= operand
+      elif op in (Op.IncrementUnsigned,Op.IncrementSigned):
+         value = min(value + operand,limit)
+      elif op in (Op.DecrementUnsigned,Op.DecrementSigned):
+         value = max(value - operand,limit)
+      elif op == Op.IncrementCyclic:
+         value += operand
+         if value > limit:
+            value = 0
+      elif op == Op.DecrementCyclic:
+         value -= operand
+         if value < 0:
+            value = limit
+      self.write(offset,value,size)
+      return self.read(offset,size,signed)
+
+   # A function of no arguments evaluating an OffsetCondition, or a condition
+   # string such as "B337D=0" or "W0BC8&xFF!1", against this offset space
+   def condition(self,cond):
+      if not isinstance(cond,OffsetCondition):
+         cond = parse_cond(str(cond))
+         if not isinstance(cond,OffsetCondition):
+            raise ValueError(f'unsupported offset condition {cond}')
+      unpack, _ = self.accessor(cond.offset,cond.size)
+      mask = cond.mask
+      test, value = cond.test.value, cond.condvalue
+
+      if mask is None:
+         read = unpack
+      else:
+         read = lambda: unpack() & mask
+      if test == '=':
+         return lambda: read() == value
+      if test == '!':
+         return lambda: read() != value
+      if test == '<':
+         return lambda: read() < value
+      return lambda: read() > value
+
+   def eval_condition(self,cond):
+      return self.condition(cond)()
@@ -0,0 +1,128 @@
+"""
+optimize.py -- Dead and redundant button entry elimination
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+WARNING: This is a prototype work-in-progress; expect problems.
+
+FSUIPC scans every entry for a button each time the button changes state,
+so entries that can never fire or only repeat an earlier one cost time on
+every press. Before a section is rendered its ButtonEntry's are passed
+through optimize_entries(), which
+
+   - drops conditions repeated within an entry,
+   - drops entries whose conditions contradict each other, e.g. both
+     (+A,1) and (-A,1), or B337D=0 together with B337D=1, and
+   - drops entries identical to an earlier one up to the order of their
+     conditions, unless either is repeated with btnmap(...,repeat=n).
+
+Each entry dropped is reported on stderr with its trace. Entries meant to
+send their control several times should say so with btnmap(...,repeat=n)
+rather than by being generated more than once; otherwise keep them all with
+gen_ini.py --no-optimize.
+
+"""
+from collections import namedtuple
+
+OptimizeStats = namedtuple('OptimizeStats',
+                           'entries duplicate unsatisfiable conditions')
+
+# Whether the ButtonCondition's can all hold together
+def button_conds_satisfiable(conds):
+   states = dict()
+   for cond in conds:
+      if states.setdefault((cond.test,cond.joy,cond.btn),
+                           cond.state) != cond.state:
+         return False
+   return True
+
+# Whether the OffsetCondition's can all hold together
+def offset_conds_satisfiable(conds):
+   # Track for each masked offset the range and the excluded values its
+   # (integer) value can still take
+   ranges = dict()
+   for cond in conds:
+      key = (cond.size,cond.offset,cond.mask)
+      lo, hi, excluded = ranges.get(key,(None,None,frozenset()))
+      test, value = cond.test.value, cond.condvalue
+      if test == '=':
+         lo = value if lo is None else max(lo,value)
+         hi = value if hi is None else min(hi,value)
+      elif test == '<':
+         hi = value-1 if hi is None else min(hi,value-1)
+      elif test == '>':
+         lo = value+1 if lo is None else max(lo,value+1)
+      else:
+         excluded = excluded | {value}
+      if lo is not None and hi is not None:
+         if lo > hi or (lo == hi and lo in excluded):
+            return False
+      ranges[key] = (lo,hi,excluded)
+   return True
+
+def _dedup(conds):
+   return tuple(dict.fromkeys(conds))
+
+def satisfiable(entry):
+   return button_conds_satisfiable(entry.button_conds) and \
+          offset_conds_satisfiable(entry.offset_conds)
+
+# Optimize the given ButtonEntry's in place as described above, returning
+# those to keep and an OptimizeStats of what was dropped. The entries
+# dropped are appended to dropped, if given, as (entry, reason).
+def optimize_entries(entries,dropped=None):
+   kept = list()
+   seen = set()
+   duplicate = unsatisfiable = conditions = 0
+   for entry in entries:
+      button_conds = _dedup(entry.button_conds)
+      offset_conds = _dedup(entry.offset_conds)
+      conditions += len(entry.button_conds) - len(button_conds) + \
+                    len(entry.offset_conds) - len(offset_conds)
+      entry.button_conds = button_conds
+      entry.offset_conds = offset_conds
+
+      if not satisfiable(entry):
+         unsatisfiable += 1
+         if dropped is not None:
+            dropped.append((entry,'unsatisfiable'))
+         continue
+
+      # A repeated entry is kept as is, and neither hides nor is hidden by
+      # copies of it
+      if entry.repeat == 1:
+         key = (entry.joy,entry.btn,entry.action,entry.ctrlcode,
+                str(entry.param),frozenset(button_conds),
+                frozenset(offset_conds))
+         if key in seen:
+            duplicate += 1
+            if dropped is not None:
+               dropped.append((entry,'duplicate'))
+            continue
+         seen.add(key)
+      kept.append(entry)
+
+   return kept, OptimizeStats(len(kept),duplicate,unsatisfiable,conditions)
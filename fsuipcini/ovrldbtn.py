@@ -0,0 +1,265 @@
+"""
+ovrldbtn.py -- Python model of the ovrldbtn.lua click sequence plugin
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+
+OvrldbtnModel replays timestamped press/release events of the overloaded
+button through a line by line model of ovrldbtn.lua's detector, recording
+the click and click-and-hold virtual buttons it would toggle and press, so
+its timing parameters can be judged offline. Note that, unlike what the
+plugin's documentation of n_click_threshold_ms says, the plugin measures
+that threshold from the press of one click to the press of the next.
+
+The gestures of a trace are labelled cN for an N-click and hN for an
+N-click-and-hold. latency_rows() reports, per label, the distribution of
+the detection latency from the first press of the sequence, the delay the
+plugin adds after the user's last action -- the release of the last click
+for cN, the press of the held click for hN -- and how many were detected
+as something else or not at all; score() sums that up for sweep.py.
+
+The configuration is read from the CONFIGURATION section of ovrldbtn.lua
+by read_lua_config(). synthetic_sequences() makes up labelled traces from
+ranges of press durations and of the time between clicks, e.g.
+
+   python3 -m fsuipcini replay ovrldbtn --lua ovrldbtn.lua --events trig.log
+   python3 -m fsuipcini sweep ovrldbtn --grid n_click_threshold_ms=150:450:25
+
+"""
+import random
+from collections import defaultdict, namedtuple
+from .luamodel import LuaPluginModel, TimedEvent, group_gestures, \
+                      lua_fields, percentile, strip_lua_comments
+
+OvrldbtnConfig = namedtuple('OvrldbtnConfig','joy btn n_click_threshold_ms '
+                                             'n_clicks_max '
+                                             'btn_hold_threshold_ms '
+                                             'vbtn_base_clicks '
+                                             'vbtn_base_clkNhold')
+
+LatencyRow = namedtuple('LatencyRow','label gestures p50_ms p95_ms max_ms '
+                                     'added_p95_ms misdetected missed')
+
+OvrldbtnScore = namedtuple('OvrldbtnScore','gestures click_p50_ms '
+                                           'click_p95_ms hold_p50_ms '
+                                           'hold_p95_ms misdetected missed')
+OvrldbtnScore.misdetections = property(
+   lambda self: self.misdetected + self.missed)
+
+# The configuration assigned above the IMPLEMENTATION part of ovrldbtn.lua
+def read_lua_config(fn):
+   with open(fn,'r') as ifh:
+      text = ifh.read()
+   text = strip_lua_comments(text).split('IMPLEMENTATION',1)[0]
+   fields = lua_fields(text)
+   fields['joy'] = str(fields['joy'])
+   return OvrldbtnConfig(**{name: fields[name]
+                            for name in OvrldbtnConfig._fields})
+
+class OvrldbtnModel(LuaPluginModel):
+   def __init__(self,config):
+      super().__init__()
+      self.config = config
+      self._last_btn_dn_time_ms = 0
+      self._n_clicks = 0
+      self._pending_button_rel_events = 0
+      self._n_clkNhold = 0
+
+   def _process_button_release(self,button_currently_released):
+      self.cancel('_ev_button_held')
+
+      if self._n_clkNhold > 0:
+         self.btn_release(self.config.vbtn_base_clkNhold+self._n_clkNhold-1)
+         self._n_clkNhold = 0
+      elif button_currently_released:
+         self.timer(self.config.n_click_threshold_ms,'_ev_click')
+
+   def _button_pressed(self):
+      config = self.config
+      cur_btn_dn_time_ms = self.elapsedtime()
+
+      self.cancel('_ev_click')
+
+      if self._pending_button_rel_events > 0:
+         self._process_button_release(False)
+
+      self._pending_button_rel_events += 1
+
+      if cur_btn_dn_time_ms - self._last_btn_dn_time_ms > \
+         config.n_click_threshold_ms:
+         self._n_clicks = 1
+      elif self._n_clicks < config.n_clicks_max:
+         self._n_clicks += 1
+
+      self._last_btn_dn_time_ms = cur_btn_dn_time_ms
+
+      self.timer(config.btn_hold_threshold_ms,'_ev_button_held')
+
+   def _ev_button_held(self,elapsed_time_ms):
+      self.cancel('_ev_button_held')
+      self.btn_press(self.config.vbtn_base_clkNhold+self._n_clicks-1)
+      self._n_clkNhold = self._n_clicks
+
+   def _ev_click(self,elapsed_time_ms):
+      self.cancel('_ev_click')
+      self.btn_toggle(self.config.vbtn_base_clicks+self._n_clicks-1)
+
+   def _button_released(self):
+      if self._pending_button_rel_events == 1:
+         self._process_button_release(True)
+      self._pending_button_rel_events -= 1
+
+   def on_event(self,index,event):
+      if event.joy == self.config.joy and event.btn == self.config.btn:
+         if event.action == 'P':
+            self._button_pressed()
+         else:
+            self._button_released()
+
+   # The label of what a virtual button output stands for, if anything
+   def detected(self,output):
+      config = self.config
+      if output.action == 'T':
+         n_clicks = output.vbtn - config.vbtn_base_clicks + 1
+         if 1 <= n_clicks <= config.n_clicks_max:
+            return f'c{n_clicks}'
+      elif output.action == 'P':
+         n_clicks = output.vbtn - config.vbtn_base_clkNhold + 1
+         if 1 <= n_clicks <= config.n_clicks_max:
+            return f'h{n_clicks}'
+      return None
+
+
+# Made up click sequences of up to max_clicks clicks on the configured
+# button, labelled cN or hN, with clicks held down press_ms, the last one
+# hold_ms for click-and-holds, and released gap_ms before the next press
+def synthetic_sequences(config,n_gestures,seed=0,max_clicks=None,
+                        press_ms=(40,140),gap_ms=(60,220),
+                        hold_ms=(300,1500),pause_ms=(800,2500)):
+   rnd = random.Random(seed)
+   max_clicks = max_clicks or config.n_clicks_max
+   joy, btn = config.joy, config.btn
+   events = list()
+   time_ms = 1000
+   for _ in range(n_gestures):
+      n_clicks = rnd.randint(1,max_clicks)
+      held = rnd.random() < 0.5
+      label = f'{"h" if held else "c"}{n_clicks}'
+      for click in range(n_clicks):
+         if click:
+            time_ms += rnd.randint(*gap_ms)
+         events.append(TimedEvent(time_ms,'P',joy,btn,label))
+         time_ms += rnd.randint(*(hold_ms if held and click == n_clicks-1
+                                  else press_ms))
+         events.append(TimedEvent(time_ms,'U',joy,btn,label))
+      time_ms += rnd.randint(*pause_ms)
+   return events
+
+# (gesture, latency_ms, added_ms, detected label) of each gesture: the
+# first detection its events caused, its latency from the first press and
+# the part of it after the user's last action, or None for all three
+def _detections(model,events,outputs,gestures):
+   by_cause = defaultdict(list)
+   for output in outputs:
+      if model.detected(output):
+         by_cause[output.cause].append(output)
+
+   results = list()
+   for gesture in gestures:
+      found = min((output for index in gesture.indices
+                   for output in by_cause.get(index,())),
+                  key=lambda output: output.time_ms,default=None)
+      if found is None:
+         results.append((gesture,None,None,None))
+         continue
+      if gesture.label.startswith('h'):
+         # The press of the held click
+         last_ms = max(events[index].time_ms for index in gesture.indices
+                       if events[index].action == 'P')
+      else:
+         last_ms = events[gesture.indices[-1]].time_ms
+      results.append((gesture,found.time_ms-gesture.start_ms,
+                      found.time_ms-last_ms,model.detected(found)))
+   return results
+
+# The label a gesture should be detected as, clicks beyond n_clicks_max
+# counting as n_clicks_max
+def _expected(config,label):
+   return f'{label[0]}{min(int(label[1:]),config.n_clicks_max)}'
+
+def latency_rows(model,events,outputs,gestures=None):
+   if gestures is None:
+      gestures = group_gestures(events)
+   by_label = defaultdict(list)
+   for result in _detections(model,events,outputs,gestures):
+      by_label[result[0].label].append(result)
+
+   rows = list()
+   for label in sorted(by_label,key=lambda label: (label[0],int(label[1:]))):
+      results = by_label[label]
+      expected = _expected(model.config,label)
+      correct = [result for result in results if result[3] == expected]
+      latencies = [latency for _, latency, _, _ in correct]
+      rows.append(LatencyRow(label,len(results),
+                             percentile(latencies,50),
+                             percentile(latencies,95),
+                             max(latencies,default=None),
+                             percentile([added for _, _, added, _ in correct],
+                                        95),
+                             sum(detected not in (None,expected)
+                                 for _, _, _, detected in results),
+                             sum(detected is None
+                                 for _, _, _, detected in results)))
+   return rows
+
+def score(model,events,outputs,gestures=None):
+   if gestures is None:
+      gestures = group_gestures(events)
+   latencies = dict(c=list(),h=list())
+   misdetected = missed = 0
+   for gesture, latency, _, detected in _detections(model,events,outputs,
+                                                    gestures):
+      if detected is None:
+         missed += 1
+      elif detected != _expected(model.config,gesture.label):
+         misdetected += 1
+      else:
+         latencies[gesture.label[0]].append(latency)
+
+   n_gestures = max(len(gestures),1)
+   return OvrldbtnScore(len(gestures),
+                        percentile(latencies['c'],50),
+                        percentile(latencies['c'],95),
+                        percentile(latencies['h'],50),
+                        percentile(latencies['h'],95),
+                        misdetected/n_gestures,missed/n_gestures)
+
+# score() of running the trace with the configuration's parameters updated
+# by params, e.g. dict(n_click_threshold_ms=250), for sweep.py
+def evaluate(params,config,events,gestures=None):
+   model = OvrldbtnModel(config._replace(**params))
+   outputs = model.run(events)
+   return score(model,events,outputs,gestures)
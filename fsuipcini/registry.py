@@ -0,0 +1,157 @@
+"""
+registry.py -- Registry of all loaded control catalogs
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+WARNING: This is a prototype work-in-progress; expect problems.
+
+Merges the control catalogs created by CreateControls (SimCtrl, FsuipcCtrl,
+MBFCtrl, ...) into one set of indexes, so that a control can be found by
+name, by the numeric ID seen in an INI entry (e.g. "C65883"), or by name
+prefix without scanning each catalog.
+
+"""
+from collections import namedtuple
+import bisect
+import re
+from .controls import loaded_catalogs
+from .utils import val
+
+class RegistryEntry(namedtuple('RegistryEntry',
+                               ['catalog','name','ctrl_id','ctrl_id_pfx',
+                                'group'],
+                               defaults=(None,))):
+   __slots__ = ()
+
+   @property
+   def ctrlcode(self):
+      return f'{self.ctrl_id_pfx}{self.ctrl_id}'
+
+   @property
+   def fullname(self):
+      return f'{self.catalog}.{self.name}'
+
+def _catalog_items(catalog):
+   index = getattr(catalog,'_index',None) # ControlCatalog
+   if index is not None:
+      return index.items()
+   return ((name, val(member)) for name, member in catalog.__members__.items())
+
+_CtrlCodeRegex = re.compile(r'(?P<pfx>[A-Za-z]*)(?P<ctrl_id>\d+)')
+
+class ControlRegistry:
+   def __init__(self,catalogs=()):
+      self._catalogs = list()
+      self._entries = list()
+      self._by_name = dict()
+      self._by_id = dict()
+      self._sorted_names = None
+      for catalog in catalogs:
+         self.add(catalog)
+
+   def add(self,catalog):
+      if any(c is catalog for c in self._catalogs):
+         return
+      self._catalogs.append(catalog)
+
+      catalog_name = catalog.__name__
+      ctrl_id_pfx = catalog._CtrlIdPrefix
+      group_data = getattr(catalog,'_GroupData',None) or dict()
+      for name, ctrl_num in _catalog_items(catalog):
+         entry = RegistryEntry(catalog_name,name,int(ctrl_num),ctrl_id_pfx,
+                               group_data.get(name,None))
+         self._entries.append(entry)
+         self._by_name[name] = self._by_name.get(name,()) + (entry,)
+         self._by_id[entry.ctrl_id] = self._by_id.get(entry.ctrl_id,()) + \
+                                      (entry,)
+
+      # The prefix index is rebuilt on the next prefix query
+      self._sorted_names = None
+
+   @property
+   def catalogs(self):
+      return tuple(self._catalogs)
+
+   def __len__(self):
+      return len(self._entries)
+
+   # Catalog by catalog, each in the order of its controls list
+   def __iter__(self):
+      return iter(self._entries)
+
+   def names(self):
+      return self._by_name.keys()
+
+   # Exact, case sensitive lookup by control name. A name can be defined by
+   # more than one catalog, so a tuple of entries is returned.
+   def lookup(self,name):
+      return self._by_name.get(name,())
+
+   # Reverse lookup by numeric control ID
+   def lookup_id(self,ctrl_id):
+      return self._by_id.get(int(ctrl_id),())
+
+   # Reverse lookup of a control code as written in an INI entry, e.g.
+   # "C65883". Codes without a prefix match any catalog.
+   def decode(self,ctrlcode):
+      code_match = _CtrlCodeRegex.fullmatch(str(ctrlcode).strip())
+      if not code_match:
+         return ()
+      pfx = code_match.group('pfx')
+      entries = self.lookup_id(code_match.group('ctrl_id'))
+      if pfx:
+         entries = tuple(e for e in entries if e.ctrl_id_pfx == pfx)
+      return entries
+
+   def describe(self,ctrlcode):
+      entries = self.decode(ctrlcode)
+      return '|'.join(e.fullname for e in entries) if entries else None
+
+   def _prefix_index(self):
+      if self._sorted_names is None:
+         self._sorted_names = sorted((name.casefold(), name)
+                                     for name in self._by_name)
+      return self._sorted_names
+
+   # Case insensitive lookup of all controls whose name starts with prefix,
+   # in name order
+   def with_prefix(self,prefix,limit=None):
+      sorted_names = self._prefix_index()
+      folded = prefix.casefold()
+      matches = list()
+      pos = bisect.bisect_left(sorted_names,(folded,''))
+      while pos < len(sorted_names) and \
+            sorted_names[pos][0].startswith(folded):
+         matches.extend(self._by_name[sorted_names[pos][1]])
+         if limit is not None and len(matches) >= limit:
+            return matches[:limit]
+         pos += 1
+      return matches
+
+# A new registry over the catalogs created by CreateControls that are still
+# in use. It is not kept here, so that it does not keep them in use.
+def loaded_registry():
+   return ControlRegistry(loaded_catalogs())
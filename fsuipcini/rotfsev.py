@@ -0,0 +1,214 @@
+"""
+rotfsev.py -- Python model of the rotfsev.lua slow/fast rotary plugin
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+
+RotfsevModel replays timestamped button events through a line by line
+model of rotfsev.lua's _btnevent()/_gen_slow_btn() state machine, quirks
+included, e.g. that only one slow virtual button can be pending at a time
+across all the rotaries. It records the slow and fast virtual buttons the
+plugin would toggle, so a FastThresh_ms/FastThreshFilter_cnt setting can be
+judged offline: score() groups the events of a trace into gestures by
+their labels and reports, per gesture,
+
+ - the latency from its first detent to the first virtual button toggled,
+   separately for slow and fast gestures, and to the first fast one,
+ - slow gestures that toggled a fast virtual button, fast gestures that
+   toggled none, and gestures that toggled nothing at all.
+
+The rotary definitions are read from the init({...}) table of rotfsev.lua
+by read_lua_defs(). Labelled traces can be recorded by hand (see
+luamodel.read_timed_events()) or made up by synthetic_turns(), including
+the contact bounce that FastThreshFilter_cnt is meant to filter.
+sweep.py evaluates many settings at once, e.g.
+
+   python3 -m fsuipcini sweep rotfsev --lua rotfsev.lua --synthetic 5000
+
+"""
+import random
+import re
+from collections import defaultdict, namedtuple
+from .luamodel import LuaPluginModel, TimedEvent, group_gestures, \
+                      lua_fields, percentile, strip_lua_comments
+
+RotaryDef = namedtuple('RotaryDef','Joystick Button PressEvent ReleaseEvent '
+                                   'Slow Fast FastThresh_ms '
+                                   'FastThreshFilter_cnt')
+
+RotfsevScore = namedtuple('RotfsevScore','gestures slow_p50_ms slow_p95_ms '
+                                         'fast_p50_ms fast_p95_ms '
+                                         'fast_detect_p95_ms '
+                                         'slow_as_fast fast_as_slow missed')
+RotfsevScore.misclassified = property(
+   lambda self: self.slow_as_fast + self.fast_as_slow + self.missed)
+
+_LuaDefRegex = re.compile(r'\{\s*(Joystick\s*=.*?)\}',re.DOTALL)
+
+# The rotary definitions passed to init() in rotfsev.lua
+def read_lua_defs(fn):
+   with open(fn,'r') as ifh:
+      text = strip_lua_comments(ifh.read().split('\ninit(',1)[-1])
+   defs = list()
+   for m in _LuaDefRegex.finditer(text):
+      fields = lua_fields(m.group(1))
+      fields['Joystick'] = str(fields['Joystick'])
+      defs.append(RotaryDef(**{key: fields.get(key,False)
+                               for key in RotaryDef._fields}))
+   return defs
+
+class _BtnInfo:
+   __slots__ = ('SlowVirtualButton','FastVirtualButton','FastThresh_ms',
+                'FastThreshFilter_cnt','PressEvent','ReleaseEvent',
+                '_fastDeadline')
+
+   def __init__(self,rotary):
+      self.SlowVirtualButton = rotary.Slow
+      self.FastVirtualButton = rotary.Fast
+      self.FastThresh_ms = rotary.FastThresh_ms
+      self.FastThreshFilter_cnt = rotary.FastThreshFilter_cnt
+      self.PressEvent = rotary.PressEvent
+      self.ReleaseEvent = rotary.ReleaseEvent
+      self._fastDeadline = 0
+
+class RotfsevModel(LuaPluginModel):
+   def __init__(self,defs):
+      super().__init__()
+      self._BtnDefs = {(str(rotary.Joystick),rotary.Button): _BtnInfo(rotary)
+                       for rotary in defs}
+      self._SlowBtnSet = -1
+      self._FastCount = 0
+
+   def _gen_slow_btn(self,elapsed_ms=None):
+      self.cancel('_gen_slow_btn')
+      if self._SlowBtnSet >= 0:
+         self.btn_toggle(self._SlowBtnSet)
+         self._SlowBtnSet = -1
+         self._FastCount = 0
+
+   def _btnevent(self,btninfo):
+      time_ms = self.elapsedtime()
+      if btninfo._fastDeadline <= time_ms:
+         if self._SlowBtnSet == btninfo.SlowVirtualButton:
+            if self._FastCount >= btninfo.FastThreshFilter_cnt:
+               self.cancel('_gen_slow_btn')
+               self._SlowBtnSet = -1
+               self._FastCount = 0
+               self.btn_toggle(btninfo.FastVirtualButton)
+               btninfo._fastDeadline = time_ms + btninfo.FastThresh_ms
+            else:
+               self.btn_toggle(self._SlowBtnSet)
+               self._FastCount += 1
+               self.timer(btninfo.FastThresh_ms,'_gen_slow_btn')
+         else:
+            self.timer(btninfo.FastThresh_ms,'_gen_slow_btn')
+            self._SlowBtnSet = btninfo.SlowVirtualButton
+
+   def on_event(self,index,event):
+      btninfo = self._BtnDefs.get((event.joy,event.btn))
+      if btninfo is not None and \
+         (btninfo.PressEvent if event.action == 'P' else btninfo.ReleaseEvent):
+         self._btnevent(btninfo)
+
+
+# Made up turns of the given rotaries, each labelled 'slow' or 'fast': slow
+# turns of 1-4 detents slow_ms apart, some followed by a bounce of the
+# contacts bounce_ms later, and fast turns of 5-25 detents fast_ms apart
+def synthetic_turns(defs,n_gestures,seed=0,slow_ms=(180,600),fast_ms=(15,70),
+                    pause_ms=(800,2000),bounce=0.05,bounce_ms=(2,25),
+                    release_ms=8):
+   rnd = random.Random(seed)
+   events = list()
+   time_ms = 1000
+   for _ in range(n_gestures):
+      rotary = rnd.choice(defs)
+      joy, btn = str(rotary.Joystick), rotary.Button
+      label = rnd.choice(('slow','fast'))
+      interval_ms = slow_ms if label == 'slow' else fast_ms
+      for detent in range(rnd.randint(1,4) if label == 'slow'
+                          else rnd.randint(5,25)):
+         if detent:
+            time_ms += rnd.randint(*interval_ms)
+         events.append(TimedEvent(time_ms,'P',joy,btn,label))
+         events.append(TimedEvent(time_ms+release_ms,'U',joy,btn,label))
+         if label == 'slow' and rnd.random() < bounce:
+            bounce_at = time_ms + release_ms + rnd.randint(*bounce_ms)
+            events.append(TimedEvent(bounce_at,'P',joy,btn,label))
+            events.append(TimedEvent(bounce_at+1,'U',joy,btn,label))
+      time_ms += rnd.randint(*pause_ms)
+   events.sort(key=lambda event: event.time_ms)
+   return events
+
+def score(defs,events,outputs,gestures=None):
+   if gestures is None:
+      gestures = group_gestures(events)
+   fast_vbtns = {rotary.Fast for rotary in defs}
+   by_cause = defaultdict(list)
+   for output in outputs:
+      by_cause[output.cause].append(output)
+
+   latencies = dict(slow=list(),fast=list())
+   detect_latencies = list()
+   slow_as_fast = fast_as_slow = missed = 0
+   n_slow = n_fast = 0
+   for gesture in gestures:
+      toggled = sorted((output for index in gesture.indices
+                        for output in by_cause.get(index,())),
+                       key=lambda output: output.time_ms)
+      n_fast_toggles = sum(output.vbtn in fast_vbtns for output in toggled)
+      if gesture.label == 'slow':
+         n_slow += 1
+         slow_as_fast += n_fast_toggles > 0
+      else:
+         n_fast += 1
+         fast_as_slow += n_fast_toggles == 0 and len(toggled) > 0
+         if n_fast_toggles:
+            detect_latencies.append(next(output.time_ms
+                                         for output in toggled
+                                         if output.vbtn in fast_vbtns) -
+                                    gesture.start_ms)
+      if toggled:
+         latencies.setdefault(gesture.label,list()).append(
+            toggled[0].time_ms - gesture.start_ms)
+      else:
+         missed += 1
+
+   return RotfsevScore(len(gestures),
+                       percentile(latencies['slow'],50),
+                       percentile(latencies['slow'],95),
+                       percentile(latencies['fast'],50),
+                       percentile(latencies['fast'],95),
+                       percentile(detect_latencies,95),
+                       slow_as_fast/max(n_slow,1),
+                       fast_as_slow/max(n_fast,1),
+                       missed/max(len(gestures),1))
+
+# score() of running the trace with every rotary's parameters set to params,
+# e.g. dict(FastThresh_ms=80,FastThreshFilter_cnt=1), for sweep.py
+def evaluate(params,defs,events,gestures=None):
+   defs = [rotary._replace(**params) for rotary in defs]
+   outputs = RotfsevModel(defs).run(events)
+   return score(defs,events,outputs,gestures)
@@ -0,0 +1,210 @@
+"""
+rotvel.py -- Model of the rotvel.lua velocity tier plugin
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+
+WARNING: This is a prototype work-in-progress; expect problems.
+
+RotvelModel replays timestamped button events through a line by line model
+of rotvel.lua's _btnevent(), recording the tier virtual button it toggles
+for each detent, so the Thresh_ms/Debounce_ms/MaxTierStep of a rotary can be
+judged offline. Gestures are labelled with the tier they are meant to be
+turned at, 'tier0' being the slowest, and score() reports
+
+ - the detents toggling the gesture's tier, a slower or a faster one, or
+   nothing (ignored as bounce),
+ - how many detents it takes for a gesture to reach its tier, the ramp the
+   MaxTierStep limit costs.
+
+The rotary definitions are read from the init({...}) table of rotvel.lua by
+read_lua_defs(); synthetic_turns() makes up labelled turns, e.g.
+
+   python3 -m fsuipcini sweep rotvel --grid Tier1_ms=60:160:20
+
+"""
+import random
+import re
+from collections import namedtuple
+from .luamodel import LuaPluginModel, TimedEvent, group_gestures, \
+                      lua_fields, percentile, strip_lua_comments
+
+RotvelDef = namedtuple('RotvelDef','Joystick Button PressEvent ReleaseEvent '
+                                   'VBtns Thresh_ms Debounce_ms MaxTierStep')
+
+RotvelScore = namedtuple('RotvelScore','gestures detents exact slower faster '
+                                       'ignored ramp_p50 ramp_p95 unreached')
+RotvelScore.misclassified = property(
+   lambda self: self.slower + self.faster + self.ignored)
+
+_LuaDefRegex = re.compile(r'\{\s*(Joystick\s*=(?:[^{}]|\{[^{}]*\})*)\}',
+                          re.DOTALL)
+_LuaListRegex = re.compile(r'(\w+)\s*=\s*\{([^{}]*)\}')
+
+# The rotary definitions passed to init() in rotvel.lua
+def read_lua_defs(fn):
+   with open(fn,'r') as ifh:
+      text = strip_lua_comments(ifh.read().split('\ninit(',1)[-1])
+   defs = list()
+   for m in _LuaDefRegex.finditer(text):
+      lists = {name: tuple(int(value,0) for value in values.split(',')
+                           if value.strip())
+               for name, values in _LuaListRegex.findall(m.group(1))}
+      fields = lua_fields(_LuaListRegex.sub('',m.group(1)))
+      fields.update(lists)
+      fields['Joystick'] = str(fields['Joystick'])
+      defs.append(RotvelDef(**{key: fields.get(key,0)
+                               for key in RotvelDef._fields}))
+   return defs
+
+class _Rotary:
+   __slots__ = ('VBtns','Thresh_ms','Debounce_ms','MaxTierStep','PressEvent',
+                'ReleaseEvent','_last_ms','_tier')
+
+   def __init__(self,rotary):
+      self.VBtns = rotary.VBtns
+      self.Thresh_ms = rotary.Thresh_ms
+      self.Debounce_ms = rotary.Debounce_ms
+      self.MaxTierStep = rotary.MaxTierStep
+      self.PressEvent = rotary.PressEvent
+      self.ReleaseEvent = rotary.ReleaseEvent
+      self._last_ms = -1000000
+      self._tier = 1
+
+class RotvelModel(LuaPluginModel):
+   def __init__(self,defs):
+      super().__init__()
+      self._Rotaries = {(str(rotary.Joystick),rotary.Button): _Rotary(rotary)
+                        for rotary in defs}
+
+   def _btnevent(self,rotary):
+      time_ms = self.elapsedtime()
+      interval_ms = time_ms - rotary._last_ms
+      if interval_ms < rotary.Debounce_ms:
+         return
+      rotary._last_ms = time_ms
+
+      # Tiers count from 1 as in Lua
+      tier = 1
+      for i in range(len(rotary.Thresh_ms),0,-1):
+         if interval_ms < rotary.Thresh_ms[i-1]:
+            tier = i + 1
+            break
+      if rotary.MaxTierStep > 0 and tier > rotary._tier + rotary.MaxTierStep:
+         tier = rotary._tier + rotary.MaxTierStep
+      rotary._tier = tier
+      self.btn_toggle(rotary.VBtns[tier-1])
+
+   def on_event(self,index,event):
+      rotary = self._Rotaries.get((event.joy,event.btn))
+      if rotary is not None and \
+         (rotary.PressEvent if event.action == 'P' else rotary.ReleaseEvent):
+         self._btnevent(rotary)
+
+
+# Made up turns of the given rotaries, each of 1-4 detents when at the
+# slowest tier and 5-25 otherwise, labelled 'tier<i>' and turned at an
+# interval drawn from tier_ms[i], with some contact bounce on slow turns
+def synthetic_turns(defs,n_gestures,seed=0,
+                    tier_ms=((180,600),(70,95),(32,45),(12,20)),
+                    pause_ms=(800,2000),bounce=0.05,bounce_ms=(2,6),
+                    release_ms=8):
+   rnd = random.Random(seed)
+   events = list()
+   time_ms = 1000
+   for _ in range(n_gestures):
+      rotary = rnd.choice(defs)
+      joy, btn = str(rotary.Joystick), rotary.Button
+      tier = rnd.randrange(min(len(tier_ms),len(rotary.VBtns)))
+      label = f'tier{tier}'
+      for detent in range(rnd.randint(1,4) if tier == 0
+                          else rnd.randint(5,25)):
+         if detent:
+            time_ms += rnd.randint(*tier_ms[tier])
+         events.append(TimedEvent(time_ms,'P',joy,btn,label))
+         events.append(TimedEvent(time_ms+release_ms,'U',joy,btn,label))
+         if tier == 0 and rnd.random() < bounce:
+            bounce_at = time_ms + release_ms + rnd.randint(*bounce_ms)
+            events.append(TimedEvent(bounce_at,'P',joy,btn,label))
+            events.append(TimedEvent(bounce_at+1,'U',joy,btn,label))
+      time_ms += rnd.randint(*pause_ms)
+   events.sort(key=lambda event: event.time_ms)
+   return events
+
+def score(defs,events,outputs,gestures=None):
+   if gestures is None:
+      gestures = group_gestures(events)
+   tier_of = {vbtn: tier for rotary in defs
+              for tier, vbtn in enumerate(rotary.VBtns)}
+   by_cause = {output.cause: output for output in outputs}
+
+   detents = exact = slower = faster = ignored = unreached = 0
+   ramps = list()
+   for gesture in gestures:
+      want = int(gesture.label[4:])
+      ramp = None
+      for n, index in enumerate(i for i in gesture.indices
+                                if events[i].action == 'P'):
+         detents += 1
+         output = by_cause.get(index)
+         if output is None:
+            ignored += 1
+            continue
+         tier = tier_of[output.vbtn]
+         exact += tier == want
+         slower += tier < want
+         faster += tier > want
+         if ramp is None and tier == want:
+            ramp = n
+      if ramp is None:
+         unreached += 1
+      elif want:
+         ramps.append(ramp)
+
+   n = max(detents,1)
+   return RotvelScore(len(gestures),detents,exact/n,slower/n,faster/n,
+                      ignored/n,percentile(ramps,50),percentile(ramps,95),
+                      unreached/max(len(gestures),1))
+
+# The thresholds of params, e.g. dict(Tier1_ms=100,Tier3_ms=20), replacing
+# those of rotary
+def _with_params(rotary,params):
+   thresh_ms = list(rotary.Thresh_ms)
+   others = dict()
+   for name, value in params.items():
+      m = re.match(r'^Tier(\d+)_ms$',name)
+      if m and 1 <= int(m.group(1)) <= len(thresh_ms):
+         thresh_ms[int(m.group(1))-1] = value
+      elif not m:
+         others[name] = value
+   return rotary._replace(Thresh_ms=tuple(thresh_ms),**others)
+
+# score() of running the trace with every rotary's parameters set to params,
+# e.g. dict(Tier1_ms=100,Debounce_ms=10), for sweep.py
+def evaluate(params,defs,events,gestures=None):
+   defs = [_with_params(rotary,params) for rotary in defs]
+   outputs = RotvelModel(defs).run(events)
+   return score(defs,events,outputs,gestures)
@@ -0,0 +1,252 @@
+"""
+search.py -- Control search index
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+WARNING: This is a prototype work-in-progress; expect problems.
+
+Builds a search index over the MSFS, FSUIPC and MobiFlight controls lists
+supporting exact, prefix, substring and fuzzy name queries, optionally
+restricted to a catalog or to a MobiFlight group (the Group column of
+custom_ctrls_info.tsv.txt). The lists are read into catalogs by
+CreateControls() as for a generator script, and the index is built over
+their registry.ControlRegistry. The index is pickled into the same cache
+directory as the parsed catalogs and only rebuilt when a list changes, so
+a query costs a pickle load plus a few dict/bisect operations.
+
+Used by "python3 -m fsuipcini search".
+
+"""
+from collections import Counter
+import bisect
+import difflib
+import hashlib
+import heapq
+import os
+import pickle
+from .controls import _catalog_cache_dir, _hash_fn, _load_cached_catalog, \
+                      _read_catalog, _store_cached_catalog, CreateControls, \
+                      SimCtrlFiles, FsuipcCtrlFiles, MBFCtrlFiles, \
+                      FsuipcCtrlNameFilter, FsuipcCtrlRawNameRegex, \
+                      MBFCtrlNameFilter
+from .registry import ControlRegistry
+
+_INDEX_CACHE_VERSION = 1
+
+class CatalogSource:
+   def __init__(self,catalog,filelist,name_filt_fn=None,
+                raw_name_regex="[\w\.]+",ctrl_id_pfx='C',
+                stop_on_relisting=False):
+      self.catalog = catalog
+      self.filelist = filelist
+      self.name_filt_fn = name_filt_fn
+      self.raw_name_regex = raw_name_regex
+      self.ctrl_id_pfx = ctrl_id_pfx
+      self.stop_on_relisting = stop_on_relisting
+
+   def find_file(self):
+      for filename in self.filelist:
+         if os.path.isfile(filename):
+            return os.path.abspath(filename)
+      return None
+
+DefaultSources = [
+   CatalogSource("SimCtrl",SimCtrlFiles,stop_on_relisting=True),
+   CatalogSource("FsuipcCtrl",FsuipcCtrlFiles,
+                 name_filt_fn=FsuipcCtrlNameFilter,
+                 raw_name_regex=FsuipcCtrlRawNameRegex),
+   CatalogSource("MBFCtrl",MBFCtrlFiles,name_filt_fn=MBFCtrlNameFilter),
+]
+
+def _trigrams(folded):
+   padded = f' {folded} '
+   return {padded[i:i+3] for i in range(len(padded)-2)}
+
+class ControlIndex:
+   def __init__(self,entries):
+      self.entries = list(entries)
+      folded = [e.name.casefold() for e in self.entries]
+
+      self._by_folded = dict()
+      for idx, name in enumerate(folded):
+         self._by_folded.setdefault(name,list()).append(idx)
+
+      self._sorted = sorted((name, idx) for idx, name in enumerate(folded))
+
+      # Substring queries are a str.find() over all names joined by newlines;
+      # _offsets maps a match position back to its entry
+      self._haystack = '\n'.join(folded)
+      self._offsets = list()
+      pos = 0
+      for name in folded:
+         self._offsets.append(pos)
+         pos += len(name) + 1
+
+      self._trigram_postings = dict()
+      for idx, name in enumerate(folded):
+         for trigram in _trigrams(name):
+            self._trigram_postings.setdefault(trigram,list()).append(idx)
+
+      self.groups = sorted({e.group for e in self.entries if e.group})
+
+   def __len__(self):
+      return len(self.entries)
+
+   def _exact(self,folded):
+      return list(self._by_folded.get(folded,()))
+
+   def _prefix(self,folded):
+      matches = list()
+      pos = bisect.bisect_left(self._sorted,(folded,-1))
+      while pos < len(self._sorted) and self._sorted[pos][0].startswith(folded):
+         matches.append(self._sorted[pos][1])
+         pos += 1
+      return matches
+
+   def _substring(self,folded):
+      matches = dict()
+      pos = self._haystack.find(folded)
+      while pos >= 0:
+         idx = bisect.bisect_right(self._offsets,pos) - 1
+         matches[idx] = None
+         pos = self._haystack.find(folded,self._offsets[idx+1]
+                                   if idx+1 < len(self._offsets) else pos+1)
+      return list(matches)
+
+   def _fuzzy(self,folded,accept,n_candidates=50,cutoff=0.5):
+      # Only names sharing the most trigrams with the query are scored with
+      # difflib, which is far too slow to run against every name
+      query_trigrams = _trigrams(folded)
+      shared = Counter()
+      for trigram in query_trigrams:
+         shared.update(self._trigram_postings.get(trigram,()))
+
+      min_shared = max(1,len(query_trigrams)//3)
+      candidates = heapq.nlargest(n_candidates,
+                                  (idx for idx, count in shared.items()
+                                   if count >= min_shared and
+                                      accept(self.entries[idx])),
+                                  key=shared.__getitem__)
+
+      matcher = difflib.SequenceMatcher()
+      matcher.set_seq2(folded)
+      scored = list()
+      for idx in candidates:
+         matcher.set_seq1(self.entries[idx].name.casefold())
+         if matcher.real_quick_ratio() >= cutoff and \
+            matcher.quick_ratio() >= cutoff:
+            ratio = matcher.ratio()
+            if ratio >= cutoff:
+               scored.append((-ratio,idx))
+      return [idx for _ratio, idx in sorted(scored)]
+
+   # mode is one of 'exact', 'prefix', 'substring', 'fuzzy', or 'auto' which
+   # returns the first non-empty result of those in that order
+   def search(self,query,mode='auto',group=None,catalog=None,limit=None):
+      folded = query.casefold()
+      group_folded = group.casefold() if group else None
+      catalog_folded = catalog.casefold() if catalog else None
+
+      def accept(entry):
+         if catalog_folded and entry.catalog.casefold() != catalog_folded:
+            return False
+         if group_folded and \
+            group_folded not in (entry.group or '').casefold():
+            return False
+         return True
+
+      modes = ['exact','prefix','substring','fuzzy'] if mode == 'auto' \
+              else [mode]
+      for cur_mode in modes:
+         if cur_mode == 'fuzzy':
+            idxs = self._fuzzy(folded,accept)
+         else:
+            idxs = getattr(self,f'_{cur_mode}')(folded)
+         results = [self.entries[idx] for idx in idxs
+                    if accept(self.entries[idx])]
+         if results:
+            return results[:limit] if limit else results
+      return []
+
+# The index over the ControlRegistry of the sources' catalogs, read like
+# CreateControls() reads them for a generator script
+def build_index(sources=DefaultSources,use_cache=True):
+   registry = ControlRegistry()
+   for source in sources:
+      filename = source.find_file()
+      if not filename:
+         continue
+      registry.add(CreateControls(source.catalog,filename,
+                                  name_filt_fn=source.name_filt_fn,
+                                  raw_name_regex=source.raw_name_regex,
+                                  ctrl_id_pfx=source.ctrl_id_pfx,
+                                  use_cache=use_cache,
+                                  lazy=True,
+                                  stop_on_relisting=source.stop_on_relisting))
+   return ControlIndex(registry)
+
+def _index_cache_key(sources):
+   hasher = hashlib.sha256()
+   hasher.update(repr(_INDEX_CACHE_VERSION).encode())
+   for source in sources:
+      filename = source.find_file()
+      stat = os.stat(filename) if filename else None
+      hasher.update(repr((source.catalog,filename,
+                          stat and stat.st_size,stat and stat.st_mtime_ns,
+                          source.raw_name_regex,source.ctrl_id_pfx,
+                          source.stop_on_relisting)).encode())
+      if source.name_filt_fn:
+         _hash_fn(hasher,source.name_filt_fn)
+   return hasher.hexdigest()
+
+# Re-parse the lists into the on-disk catalog cache CreateControls() reads,
+# see controls.py
+def refresh_catalogs(sources=DefaultSources):
+   for source in sources:
+      filename = source.find_file()
+      if filename:
+         _read_catalog(filename,source.name_filt_fn,source.raw_name_regex,
+                       stop_on_relisting=source.stop_on_relisting,
+                       refresh=True)
+
+# Load the index from the cache, (re)building it if any list has changed.
+# rebuild ignores the cached index and refreshes the catalog cache as well.
+def load_index(sources=DefaultSources,use_cache=True,rebuild=False):
+   cache_dir = _catalog_cache_dir() if use_cache else ''
+   if not cache_dir:
+      return build_index(sources,use_cache=False)
+
+   key = _index_cache_key(sources)
+   cache_fn = os.path.join(cache_dir,f'{key[:32]}.index.pickle')
+   cached = None if rebuild else _load_cached_catalog(cache_fn,key)
+   if cached:
+      return cached['index']
+
+   if rebuild:
+      refresh_catalogs(sources)
+   index = build_index(sources)
+   _store_cached_catalog(cache_fn,dict(key=key,index=index))
+   return index
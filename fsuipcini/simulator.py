@@ -0,0 +1,313 @@
+"""
+simulator.py -- Offline FSUIPC button evaluation simulator
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+WARNING: This is a prototype work-in-progress; expect problems.
+
+ButtonSimulator stands in for FSUIPC resolving the [Buttons] entries of a
+section as buttons are pressed, held and released, so a generated section
+can be tested without a running simulator. It keeps the pressed state and
+the flag of each button -- toggled by each press, and set, cleared or
+toggled by the FSUIPC controls 1003-1005 -- plus an OffsetSpace the offset
+controls are applied to and the offset conditions evaluated against, and
+counts the entries scanned and the conditions evaluated. Changes to the
+virtual button offsets 0x3340-0x3363 press and release the corresponding
+virtual buttons 64-72.
+
+Given the DispatchTables of a luadispatch.LuaDispatch, the simulator
+resolves the events of those buttons as its Lua plugin would instead,
+counting the variables tested and the table lookups.
+
+Events are (action, joy, button) tuples where the action is P(ress),
+U(release) or R(epeat), the latter standing for FSUIPC's repeat while a
+button is held. read_events() reads them from a file with lines like
+
+   P A,12
+   R A,12
+   U A,12
+   O D3340=5          (write an offset: size, hex offset, value)
+
+as well as the "Button changed" lines of an FSUIPC log with button logging
+on. synthetic_events() makes up press/hold/release sequences instead.
+
+   python3 -m fsuipcini sim FSUIPC7.ini --events buttons.log
+   python3 -m fsuipcini sim --script gen_ini.py --synthetic 1000000
+
+"""
+import random
+import re
+from collections import Counter, namedtuple
+from .conditions import ButtonCondition
+from .offsetspace import OffsetSpace, size_bytes
+from .virtbtns import VirtualJoyBase, VirtualJoyCount, VirtualButtonOffset
+
+SimEvent = namedtuple('SimEvent','action joy btn')
+FiredControl = namedtuple('FiredControl','event ctrlcode param')
+
+
+def _touches_virtual_buttons(offset,nbytes):
+   return offset < VirtualButtonOffset + 4*VirtualJoyCount and \
+          offset + nbytes > VirtualButtonOffset
+
+_FlagParamRegex = re.compile(r'^J(?P<joy>\w+)B(?P<btn>\d+)$')
+
+# The entry actions to scan for each event action
+_EventEntryActions = {
+   'P': ('P','R','H'),
+   'U': ('U',),
+   'R': ('R',),
+}
+
+class ButtonSimulator:
+   FlagControls = {'C1003': 'set', 'C1004': 'clear', 'C1005': 'toggle'}
+
+   # entries is an iterable of ButtonEntry's, or of (section name, entries)
+   # as from analyze.read_ini_entries(); record keeps every FiredControl in
+   # self.fired; dispatch is an iterable of luadispatch.DispatchTable's
+   def __init__(self,entries,offsets=None,record=False,dispatch=()):
+      self.offsets = offsets if offsets is not None else OffsetSpace()
+      self.pressed = dict()
+      self.flags = dict()
+      self.record = record
+      self.fired = list()
+      self.control_counts = Counter()
+      self.events = 0
+      self.entries_scanned = 0
+      self.conditions_evaluated = 0
+      self.controls_sent = 0
+      self.variables_tested = 0
+      self.lookups = 0
+      self._pending = list()
+      self._virt_state = [self.offsets.read(VirtualButtonOffset + 4*i,'D')
+                          for i in range(VirtualJoyCount)]
+
+      # Per event action and button, the entries FSUIPC scans, in the order
+      # they appear in the section
+      index = dict()
+      for entry in _iter_entries(entries):
+         key = (str(entry.joy),int(entry.btn))
+         compiled = (tuple(self._compile_cond(c) for c in entry.offset_conds) +
+                     tuple(self._compile_cond(c) for c in entry.button_conds),
+                     entry.ctrlcode,entry.param,entry.repeat)
+         for action, entry_actions in _EventEntryActions.items():
+            if entry.action in entry_actions:
+               index.setdefault((action,)+key,list()).append(compiled)
+      self._index = {key: tuple(compiled) for key, compiled in index.items()}
+
+      self._dispatch = {(str(table.joy),int(table.btn)):
+                        (table,tuple(self._compile_cond(variable)
+                                     for variable in table.variables))
+                        for table in dispatch}
+
+   def _compile_cond(self,cond):
+      if not isinstance(cond,ButtonCondition):
+         return self.offsets.condition(cond)
+      key = (str(cond.joy),cond.btn)
+      want = cond.state
+      states = self.flags if cond.test == ButtonCondition.Test.FLAG_SET \
+               else self.pressed
+      return lambda: states.get(key,False) == want
+
+   def _send(self,event,ctrlcode,param):
+      self.controls_sent += 1
+      self.control_counts[(ctrlcode,param)] += 1
+      if self.record:
+         self.fired.append(FiredControl(event,ctrlcode,param))
+
+      flag_op = self.FlagControls.get(ctrlcode,None)
+      if flag_op:
+         m = _FlagParamRegex.match(str(param))
+         if m:
+            key = (m.group('joy'),int(m.group('btn')))
+         else:
+            key = (str(int(param) // 256),int(param) % 256)
+         if flag_op == 'toggle':
+            self.flags[key] = not self.flags.get(key,False)
+         else:
+            self.flags[key] = flag_op == 'set'
+      elif ctrlcode.startswith('Cx'):
+         ctrl = self.offsets.apply_control(ctrlcode,param)
+         if ctrl is not None and \
+            _touches_virtual_buttons(ctrl.offset,size_bytes(ctrl.size)):
+            self._sync_virtual_buttons()
+
+   # Queue press and release events for the virtual buttons whose bits in
+   # offsets 0x3340-0x3363 changed, as FSUIPC would see them on its next scan
+   def _sync_virtual_buttons(self):
+      for i, old in enumerate(self._virt_state):
+         new = self.offsets.read(VirtualButtonOffset + 4*i,'D')
+         changed = old ^ new
+         btn = 0
+         while changed:
+            if changed & 1:
+               self._pending.append(SimEvent('P' if new >> btn & 1 else 'U',
+                                             str(VirtualJoyBase + i),btn))
+            changed >>= 1
+            btn += 1
+         self._virt_state[i] = new
+
+   def _scan(self,event):
+      compiled_entries = self._index.get(event,())
+      self.entries_scanned += len(compiled_entries)
+      n_conds = 0
+      for checks, ctrlcode, param, repeat in compiled_entries:
+         for check in checks:
+            n_conds += 1
+            if not check():
+               break
+         else:
+            for _ in range(repeat):
+               self._send(event,ctrlcode,param)
+      self.conditions_evaluated += n_conds
+
+   # Resolve the event as the Lua dispatch plugin would: test each variable
+   # once, then look the key up in each shape's table. The plugin registers
+   # only the actions the table has entries for, so it never sees the others
+   def _dispatch_event(self,event):
+      table, checks = self._dispatch[event[1:]]
+      shapes = table.shapes.get(event[0],())
+      if not shapes:
+         return
+      self.variables_tested += len(checks)
+      self.lookups += len(shapes)
+      key = 0
+      for i, check in enumerate(checks):
+         if check():
+            key |= 1 << i
+      for ctrlcode, param in table.controls(event[0],key):
+         self._send(event,ctrlcode,param)
+
+   def _event(self,action,key):
+      self.events += 1
+      scan = self._dispatch_event if key in self._dispatch else self._scan
+      if action == 'P':
+         self.pressed[key] = True
+         scan(('P',)+key)
+         self.flags[key] = not self.flags.get(key,False)
+      elif action == 'U':
+         self.pressed[key] = False
+         scan(('U',)+key)
+      elif self.pressed.get(key,False):
+         scan(('R',)+key)
+
+      # Virtual buttons changed by the event
+      while self._pending:
+         event = self._pending.pop(0)
+         self._event(event.action,(event.joy,event.btn))
+
+   def press(self,joy,btn):
+      self._event('P',(str(joy),btn))
+
+   def release(self,joy,btn):
+      self._event('U',(str(joy),btn))
+
+   def repeat(self,joy,btn):
+      self._event('R',(str(joy),btn))
+
+   def write_offset(self,offset,value,size='D'):
+      self.offsets.write(offset,value,size)
+      if _touches_virtual_buttons(offset,size_bytes(size)):
+         self._sync_virtual_buttons()
+         while self._pending:
+            event = self._pending.pop(0)
+            self._event(event.action,(event.joy,event.btn))
+
+   def replay(self,events):
+      event_fn = self._event
+      for event in events:
+         if event[0] == 'O':
+            _, size, offset, value = event
+            self.write_offset(offset,value,size)
+         else:
+            event_fn(event[0],(str(event[1]),event[2]))
+      return self
+
+   def buttons(self):
+      return sorted({k[1:] for k in self._index} | set(self._dispatch),
+                    key=lambda k: (k[0],k[1]))
+
+   def summary(self):
+      events = max(self.events,1)
+      summary = (f'{self.events} events, {self.controls_sent} controls sent, '
+                 f'{self.entries_scanned/events:.2f} entries scanned and '
+                 f'{self.conditions_evaluated/events:.2f} conditions '
+                 f'evaluated per event')
+      if self._dispatch:
+         summary += (f', {self.variables_tested/events:.2f} variables '
+                     f'tested and {self.lookups/events:.2f} lookups')
+      return summary
+
+def _iter_entries(entries):
+   for item in entries:
+      if isinstance(item,tuple) and len(item) == 2:
+         yield from item[1]
+      else:
+         yield item
+
+_EventRegex = re.compile(r'^(?P<action>[PUR])\s+(?P<joy>\w+),(?P<btn>\d+)$')
+_OffsetWriteRegex = re.compile(r'^O\s+(?P<size>[BWD])(?P<offset>[0-9A-Fa-f]+)'
+                               r'=(?P<value>-?(?:0x[0-9A-Fa-f]+|\d+))$')
+_LogButtonRegex = re.compile(r'Button changed:.*Joy=(?P<joy>\w+),\s*'
+                             r'Btn=(?P<btn>\d+),\s*(?P<state>Pressed|Released)')
+
+def read_events(fn):
+   events = list()
+   with open(fn,'r') as ifh:
+      for line in ifh:
+         line = line.strip()
+         if not line or line.startswith('#'):
+            continue
+         m = _EventRegex.match(line)
+         if m:
+            events.append(SimEvent(m.group('action'),m.group('joy'),
+                                   int(m.group('btn'))))
+            continue
+         m = _OffsetWriteRegex.match(line)
+         if m:
+            events.append(('O',m.group('size'),int(m.group('offset'),16),
+                           int(m.group('value'),0)))
+            continue
+         m = _LogButtonRegex.search(line)
+         if m:
+            events.append(SimEvent('P' if m.group('state') == 'Pressed'
+                                       else 'U',
+                                   m.group('joy'),int(m.group('btn'))))
+   return events
+
+# n events pressing, possibly holding (with up to max_repeats repeats) and
+# releasing the given (joy,btn) buttons at random
+def synthetic_events(buttons,n,seed=0,max_repeats=3):
+   rnd = random.Random(seed)
+   events = list()
+   while len(events) < n:
+      joy, btn = rnd.choice(buttons)
+      events.append(SimEvent('P',joy,btn))
+      for _ in range(rnd.randint(0,max_repeats)):
+         events.append(SimEvent('R',joy,btn))
+      events.append(SimEvent('U',joy,btn))
+   del events[n:]
+   return events
@@ -0,0 +1,100 @@
+"""
+sweep.py -- Parallel parameter sweeps over the Lua plugin models
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+
+sweep() evaluates a plugin model, e.g. rotfsev.evaluate(), for every
+combination of parameter values in a grid against the same event trace,
+spread over a process pool. The trace is sent to each worker process once
+rather than with every combination.
+
+   python3 -m fsuipcini sweep rotfsev --grid FastThresh_ms=40:300:20 \
+      --grid FastThreshFilter_cnt=0:3 --events rotary.log
+
+"""
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+_Worker = None
+
+def _init_worker(evaluate,trace):
+   global _Worker
+   _Worker = (evaluate,trace)
+
+def _evaluate(params):
+   evaluate, trace = _Worker
+   return params, evaluate(params,*trace)
+
+# Every combination of the values of each parameter, as a list of dicts
+def param_grid(**values):
+   names = list(values)
+   return [dict(zip(names,combo))
+           for combo in itertools.product(*(values[name] for name in names))]
+
+# 'START:STOP[:STEP]' (STOP included) or 'V1,V2,...' as a list of ints
+def parse_range(text):
+   if ':' in text:
+      start, stop, step = (text.split(':') + ['1'])[:3]
+      return list(range(int(start),int(stop)+1,int(step)))
+   return [int(value) for value in text.split(',')]
+
+# [(params, evaluate(params,*trace))] for each params of grid
+def sweep(evaluate,grid,trace,workers=None):
+   workers = workers or os.cpu_count() or 1
+   if workers == 1 or len(grid) == 1:
+      return [(params, evaluate(params,*trace)) for params in grid]
+   with ProcessPoolExecutor(max_workers=workers,initializer=_init_worker,
+                            initargs=(evaluate,trace)) as executor:
+      return list(executor.map(_evaluate,grid,
+                               chunksize=max(1,len(grid)//(workers*4))))
+
+def _format_value(value):
+   if value is None:
+      return '-'
+   if isinstance(value,float):
+      return f'{value:.3f}'
+   return str(value)
+
+# A table of the results, best first by key, one row per params
+def format_results(results,key=None,limit=None):
+   if key:
+      results = sorted(results,key=lambda result: key(result[1]))
+   if limit:
+      results = results[:limit]
+   if not results:
+      return ''
+   params, score = results[0]
+   header = list(params) + list(score._fields)
+   rows = [[_format_value(value)
+            for value in list(params.values()) + list(score)]
+           for params, score in results]
+   widths = [max(len(row[i]) for row in rows + [header])
+             for i in range(len(header))]
+   return '\n'.join(' '.join(f'{cell:>{width}}'
+                             for cell, width in zip(row,widths))
+                    for row in [header] + rows)
@@ -0,0 +1,222 @@
+"""
+tracemap.py -- Trace source maps for generated INI entries
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+WARNING: This is a prototype work-in-progress; expect problems.
+
+Instead of the inline trace comment, which is truncated to 64 characters,
+each generated entry can get just a short ID comment (" ;#<id>") while its
+full call chain -- file, line and function of every frame -- goes to a
+sidecar file next to the INI. The sidecar is tab separated text, with each
+source file and each distinct call chain written once and referred to by
+index from the entry records:
+
+   F <file idx> <path>
+   C <chain idx> <file idx>:<line>:<function> ...   (innermost frame first)
+   E <id> <section> <entry> <chain idx>
+
+where <entry> is "<first>-<last>" for the copies of an entry repeated
+under consecutive numbers, which all share the one ID.
+
+Look entries up with e.g.
+
+   python3 -m fsuipcini trace FSUIPC7.ini.trace 42
+   python3 -m fsuipcini trace FSUIPC7.ini.trace '#1z'
+
+"""
+import re
+from collections import namedtuple
+from .utils import IniWriter
+
+_Base36Digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+def _n2base36(v):
+   s = ''
+   while True:
+      v, r = divmod(v,36)
+      s = _Base36Digits[r] + s
+      if v == 0:
+         return s
+
+TraceFrame = namedtuple('TraceFrame','file line function')
+TraceRef = namedtuple('TraceRef','id chain')
+
+class TraceRecord(namedtuple('TraceRecord','id section entry chain')):
+   __slots__ = ()
+
+   # The frame of the code that called btnmap() etc. to generate the entry
+   @property
+   def origin(self):
+      return self.chain[0]
+
+   def format(self):
+      lines = [f'#{self.id}\t[{self.section}] {self.entry}']
+      for frame in self.chain:
+         lines.append(f'   {frame.file}:{frame.line} in {frame.function}')
+      return '\n'.join(lines)
+
+# Records the provenance of each generated entry into a sidecar file and
+# hands back the short ID to put in the entry's comment
+class TraceSidecar:
+   Header = '# fsuipcini trace map v1'
+
+   def __init__(self,fh,close_fh=False):
+      self._writer = IniWriter(fh,close_fh=close_fh)
+      self._files = dict()
+      self._chains = dict()
+      self._code_files = dict()
+      self._next_id = 0
+      self._writer.writeline(self.Header)
+
+   def _file_idx(self,filename):
+      idx = self._files.get(filename,None)
+      if idx is None:
+         idx = len(self._files)
+         self._files[filename] = idx
+         self._writer.writeline(f'F\t{idx}\t{filename}')
+      return idx
+
+   def _chain_idx(self,frame):
+      # As in utils._trace_str, the chain is keyed by (code object, instruction
+      # offset) pairs and only rendered the first time it is seen
+      chain = list()
+      cur_frame = frame
+      while cur_frame is not None:
+         chain.append((id(cur_frame.f_code),cur_frame.f_lasti))
+         cur_frame = cur_frame.f_back
+
+      chain = tuple(chain)
+      idx = self._chains.get(chain,None)
+      if idx is None:
+         idx = len(self._chains)
+         self._chains[chain] = idx
+         elems = list()
+         for _ in chain:
+            code = frame.f_code
+            if id(code) not in self._code_files:
+               self._code_files[id(code)] = (code,
+                  self._file_idx(frame.f_globals.get("__file__",
+                                                     code.co_filename)))
+            func = getattr(code,'co_qualname',code.co_name)
+            elems.append(f'{self._code_files[id(code)][1]}:'
+                         f'{frame.f_lineno}:{func}')
+            frame = frame.f_back
+         self._writer.writeline(f'C\t{idx}\t' + '\t'.join(elems))
+      return idx
+
+   # Entries are only numbered once their section is rendered, so the
+   # provenance captured while generating an entry is kept as a TraceRef
+   # until place() records where the entry ended up
+   def capture(self,frame):
+      trace_id = _n2base36(self._next_id)
+      self._next_id += 1
+      return TraceRef(trace_id,self._chain_idx(frame))
+
+   def place(self,ref,section,entry):
+      self._writer.writeline(f'E\t{ref.id}\t{section}\t{entry}\t{ref.chain}')
+      return ref.id
+
+   def flush(self):
+      self._writer.flush()
+
+   def close(self):
+      self._writer.close()
+
+# Read a sidecar written by TraceSidecar
+class TraceMap:
+   def __init__(self,fn):
+      files = dict()
+      chains = dict()
+      self._by_id = dict()
+      self._by_entry = dict()
+      with open(fn,'r') as ifh:
+         if ifh.readline().rstrip('\n') != TraceSidecar.Header:
+            raise ValueError(f'{fn} is not a trace sidecar file')
+         for line in ifh:
+            fields = line.rstrip('\n').split('\t')
+            kind = fields[0]
+            if kind == 'E':
+               trace_id, section, entry, chain_idx = fields[1:]
+               rec = TraceRecord(trace_id,section,entry,chains[chain_idx])
+               self._by_id[trace_id] = rec
+               for number in _entry_numbers(entry):
+                  self._by_entry[(section.lower(),number)] = rec
+            elif kind == 'C':
+               chain = list()
+               for elem in fields[2:]:
+                  file_idx, lineno, func = elem.split(':',2)
+                  chain.append(TraceFrame(files[file_idx],int(lineno),func))
+               chains[fields[1]] = tuple(chain)
+            elif kind == 'F':
+               files[fields[1]] = fields[2]
+
+   def __len__(self):
+      return len(self._by_id)
+
+   def __iter__(self):
+      return iter(self._by_id.values())
+
+   def by_id(self,trace_id):
+      return self._by_id.get(trace_id.lstrip('#').lower(),None)
+
+   def by_entry(self,entry,section='Buttons'):
+      return self._by_entry.get((section.lower(),str(entry)),None)
+
+   # Look up '#<id>', or an entry number (or fixed token name) of the given
+   # section. Entry numbers are those the entries were generated with; pass
+   # the INI they went into as ini_fn to resolve the number through the ID
+   # comment of the entry in that file instead.
+   def lookup(self,key,section='Buttons',ini_fn=None):
+      if key.startswith('#'):
+         return self.by_id(key)
+      if ini_fn:
+         trace_id = _ini_entry_trace_id(ini_fn,section,key)
+         return self.by_id(trace_id) if trace_id else None
+      return self.by_entry(key,section)
+
+_EntryRangeRegex = re.compile(r'^(\d+)-(\d+)$')
+
+# The entry numbers an E record's <entry> stands for
+def _entry_numbers(entry):
+   m = _EntryRangeRegex.match(entry)
+   if not m:
+      return [entry]
+   return [str(n) for n in range(int(m.group(1)),int(m.group(2))+1)]
+
+_IdCommentRegex = re.compile(r';#([0-9a-z]+)\s*$')
+
+def _ini_entry_trace_id(ini_fn,section,entry):
+   in_section = False
+   with open(ini_fn,'r') as ifh:
+      for line in ifh:
+         line = line.strip()
+         if line.startswith('['):
+            in_section = line[1:].split(']')[0].lower() == section.lower()
+         elif in_section and line.split('=',1)[0] == str(entry):
+            m = _IdCommentRegex.search(line)
+            return m.group(1) if m else None
+   return None
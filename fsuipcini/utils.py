@@ -1,6 +1,6 @@
 """
 utils.py -- General module utlities
-Version 20210621-0-4fcf466
+Version 20261017-0
 
 The MIT License (MIT)
 Copyright © 2021 Blake Buhlig
@@ -31,32 +31,162 @@ WARNING: This is a prototype work-in-progress; expect problems.
 TODO
 
 """
+import os
 import re
-import inspect
+import shutil
 import string
 import sys
-import traceback
+import tempfile
 from . import _globals
+from .optimize import optimize_entries
+
+_SectionRegex = re.compile(r'^\[(?P<section>[^\]]*)\]')
+
+# All generated INI text goes through an IniWriter, which collects lines and
+# writes them out in large chunks with the line terminator applied once,
+# rather than through thousands of print() calls. The default writer targets
+# whatever sys.stdout is when output starts; use set_output() to send the
+# generated sections anywhere else.
+class IniWriter:
+   def __init__(self,fh,newline='\n',bufsize=1 << 16,close_fh=False):
+      self._fh = fh
+      self._newline = newline
+      self._bufsize = bufsize
+      self._close_fh = close_fh
+      self._lines = list()
+      self._buffered = 0
+
+   def writeline(self,line):
+      self._lines.append(line)
+      self._buffered += len(line)
+      if self._buffered >= self._bufsize:
+         self.flush()
+
+   def writelines(self,lines):
+      for line in lines:
+         self.writeline(line)
+
+   def flush(self):
+      if self._lines:
+         self._lines.append('')
+         self._fh.write(self._newline.join(self._lines))
+         self._lines = list()
+         self._buffered = 0
+      self._fh.flush()
+
+   def close(self):
+      self.flush()
+      if self._close_fh:
+         self._fh.close()
+
+def set_output(output):
+   if _globals.Writer is not None:
+      _globals.Writer.flush()
+   if output is not None and not isinstance(output,IniWriter):
+      output = IniWriter(output)
+   _globals.Writer = output
+   return output
+
+def get_output():
+   if _globals.Writer is None:
+      _globals.Writer = IniWriter(sys.stdout)
+   return _globals.Writer
+
+def close_output():
+   if _globals.Writer is not None:
+      _globals.Writer.close()
+      _globals.Writer = None
+   set_trace_sidecar(None)
+
+# Whether to pass the button entries of each section through
+# optimize_entries() before rendering them, see optimize.py
+def set_optimize(enabled=True):
+   _globals.Optimize = enabled
+
+# Keep the button entries of each section rendered from here on, e.g. for
+# analyze.py, returning the list they are kept in as (section name, entries)
+def keep_rendered_entries():
+   if _globals.Rendered_sections is None:
+      _globals.Rendered_sections = list()
+   return _globals.Rendered_sections
+
+# Leave the entries of the buttons selected in dispatch, a
+# luadispatch.LuaDispatch, out of the [Buttons] section and compile them
+# into its dispatch tables instead
+def set_lua_dispatch(dispatch):
+   _globals.Lua_dispatch = dispatch
+
+# Render the button entries collected for the current section, see
+# entries.py
+def _render_entries():
+   entries = _globals.Section_entries
+   if not entries:
+      return
+   _globals.Section_entries = list()
+
+   if _globals.Optimize:
+      dropped = list()
+      entries, stats = optimize_entries(entries,dropped)
+      for entry, reason in dropped:
+         print(f'[{_globals.Section_name}]: dropped {reason} entry {entry}'
+               f'{render_trace(entry.trace,"dropped")}',file=sys.stderr)
+      if stats.duplicate or stats.unsatisfiable or stats.conditions:
+         print(f'[{_globals.Section_name}]: {stats.entries} entries after '
+               f'removing {stats.duplicate} duplicate and '
+               f'{stats.unsatisfiable} unsatisfiable entries, and '
+               f'{stats.conditions} repeated conditions',file=sys.stderr)
+
+   if _globals.Lua_dispatch is not None:
+      n_entries = len(entries)
+      entries = _globals.Lua_dispatch.take(_globals.Section_name,entries)
+      if len(entries) != n_entries:
+         print(f'[{_globals.Section_name}]: {n_entries-len(entries)} entries '
+               f'moved to Lua dispatch',file=sys.stderr)
+
+   if _globals.Rendered_sections is not None:
+      _globals.Rendered_sections.append((_globals.Section_name,entries))
+
+   # The copies of a repeated entry share its trace, recorded once with the
+   # range of entry numbers they went to
+   writer = get_output()
+   for entry in entries:
+      if entry.repeat < 1:
+         continue
+      body = str(entry)
+      first = _globals.Section_idx + 1
+      _globals.Section_idx += entry.repeat
+      trace = render_trace(entry.trace,
+                           first if entry.repeat == 1 else
+                           f'{first}-{_globals.Section_idx}')
+      for idx in range(first,_globals.Section_idx+1):
+         writer.writeline(f'{idx}={body}{trace}')
 
 def _init_section():
+   _render_entries()
    _gen_trace_dict()
 
    _globals.Section_idx = 0
    _globals.Trace_file_idx=0
    _globals.Trace_file_dict=dict()
+   _globals.Trace_cache=dict()
 
 def section(header,fixed_tokens=None):
    _init_section()
-   print(f'[{header}]')
+   _globals.Section_name = header
+   writer = get_output()
+   writer.writeline(f'[{header}]')
    if fixed_tokens:
       if isinstance(fixed_tokens,dict):
          for key,value in fixed_tokens.items():
-            print(f'{key}={value} ;{gen_trace_str()}')
+            writer.writeline(f'{key}={value}{trace_comment(key)}')
       else:
-         print(fixed_tokens)
+         writer.writeline(fixed_tokens)
 
 def end_section():
    _init_section()
+   get_output().flush()
+   if _globals.Trace_sidecar is not None:
+      _globals.Trace_sidecar.flush()
 
 def val(x):
    v = x
@@ -64,18 +194,81 @@ def val(x):
       v = v.value if hasattr(v,'value') else v._value_
    return v
 
-def filter_ini(fn,*argv):
-   with open(fn,'r') as ini_ifh:
-      inputlines = ini_ifh.read().splitlines()
+# Collects the sections generated after filter_ini() until the output is
+# closed, then streams the original INI into a temporary file next to it,
+# splicing each generated section in where the original section of the same
+# name was, and atomically replaces the original with it. Generated sections
+# the INI did not have yet are appended at the end. Nothing touches the
+# original if generation fails before close_output().
+class IniUpdater(IniWriter):
+   def __init__(self,fn,drop_sections=(),newline='\r\n'):
+      super().__init__(None,newline=newline)
+      self._fn = fn
+      self._drop = [x.lower() for x in drop_sections]
+      self._sections = dict()
+      self._cur = self._sections.setdefault(None,list())
+
+   def _dropped(self,name):
+      name = name.lower()
+      family = name.split('.')[0]
+      return any(name == x if '.' in x else family == x for x in self._drop)
+
+   def writeline(self,line):
+      m = _SectionRegex.match(line)
+      if m:
+         self._cur = self._sections.setdefault(m.group('section').lower(),
+                                               list())
+      self._cur.append(line)
 
-   sys.stdout = open(fn,'w',newline='\r\n')
-   copythru = True
-   for line in inputlines:
-      section_match = re.match("^\[(?P<section>[^\.]+).*?\]",line)
-      if section_match:
-         copythru = all(section_match.group('section') != arg for arg in argv)
-      if copythru:
-         print(line)
+   def flush(self):
+      pass
+
+   def close(self):
+      self.commit()
+
+   def commit(self):
+      if self._sections is None:
+         return
+      sections, self._sections = self._sections, None
+
+      dirname = os.path.dirname(os.path.abspath(self._fn))
+      tmp_fh = tempfile.NamedTemporaryFile('w',dir=dirname,newline='',
+                                           prefix='.tmp-',delete=False)
+      try:
+         writer = IniWriter(tmp_fh,newline=self._newline)
+         with open(self._fn,'r') as ini_ifh:
+            copythru = True
+            replaced = set()
+            for line in ini_ifh:
+               line = line.rstrip('\r\n')
+               m = _SectionRegex.match(line)
+               if m:
+                  name = m.group('section').lower()
+                  generated = sections.pop(name,None)
+                  if generated is not None:
+                     writer.writelines(generated)
+                     replaced.add(name)
+                  copythru = name not in replaced and not self._dropped(name)
+               if copythru:
+                  writer.writeline(line)
+
+         for generated in sections.values():
+            writer.writelines(generated)
+         writer.flush()
+         tmp_fh.close()
+         shutil.copymode(self._fn,tmp_fh.name)
+         os.replace(tmp_fh.name,self._fn)
+      except BaseException:
+         tmp_fh.close()
+         os.unlink(tmp_fh.name)
+         raise
+
+# Update the INI at fn with the sections generated from here on, see
+# IniUpdater. Sections named in argv are also removed from it; a name without
+# a '.' covers all its profile specific sections too, e.g. 'Buttons' removes
+# [Buttons] and any [Buttons.xxx], whereas 'Buttons.xxx' removes just that.
+def filter_ini(fn,*argv):
+   return set_output(IniUpdater(fn,argv))
 
 
 _N2alpha = dict(zip(range(1, 27), string.ascii_lowercase))
@@ -87,28 +280,108 @@ _N2alphadict = dict(zip(range(1, 27), string.ascii_lowercase))
 def _n2alphacode(v):
    n = v // 26
    r = (1+v) % 26
-   return f'{n2alphacode(n-1) if n > 0 else ""}{_N2alphadict[r] if r > 0 else "z"}'
+   return f'{_n2alphacode(n-1) if n > 0 else ""}{_N2alphadict[r] if r > 0 else "z"}'
 
-def gen_trace_str():
-   infelems=list()
-   last_file=None
-   for frame, b in traceback.walk_stack(inspect.currentframe().f_back.f_back):
-      cur_file=frame.f_globals["__file__"]
-      cur_file_code = _globals.Trace_file_dict.get(cur_file,None)
-      if not cur_file_code:
-         cur_file_code = _n2alphacode(_globals.Trace_file_idx)
-
-         _globals.Trace_file_dict[cur_file] = cur_file_code
-         _globals.Trace_file_idx += 1
-         
-      infelems.append(f'{cur_file_code}{frame.f_lineno}')
-
-   trace_str =';'.join(infelems)
-   if len(trace_str) > 64:
-      trace_str=f'~{trace_str[-64:]}'
+# Limit the trace comments to the innermost depth frames, or pass depth=0 to
+# leave them out of the generated entries entirely. depth=None traces the
+# whole call chain.
+def set_trace_depth(depth=None):
+   _globals.Trace_depth = depth
+   _globals.Trace_cache = dict()
+
+# Write the full provenance of each entry to a sidecar file (see tracemap.py)
+# and only a short ID in the entry's comment. Pass None to go back to inline
+# trace comments.
+def set_trace_sidecar(sidecar):
+   from .tracemap import TraceSidecar
+   if _globals.Trace_sidecar is not None:
+      _globals.Trace_sidecar.close()
+   if sidecar is not None and not isinstance(sidecar,TraceSidecar):
+      if isinstance(sidecar,str):
+         sidecar = TraceSidecar(open(sidecar,'w'),close_fh=True)
+      else:
+         sidecar = TraceSidecar(sidecar)
+   _globals.Trace_sidecar = sidecar
+   return sidecar
+
+def _trace_file_code(cur_file):
+   cur_file_code = _globals.Trace_file_dict.get(cur_file,None)
+   if not cur_file_code:
+      cur_file_code = _n2alphacode(_globals.Trace_file_idx)
+
+      _globals.Trace_file_dict[cur_file] = cur_file_code
+      _globals.Trace_file_idx += 1
+   return cur_file_code
+
+def _trace_str(frame):
+   # The same few call sites generate most entries, so a rendered trace is
+   # cached per call chain, i.e. per tuple of (code object, instruction
+   # offset) pairs, which is all that is built per call by following f_back
+   # directly. Code objects are keyed by id() because hashing one hashes its
+   # bytecode; they are kept alive in Trace_code_files so the ids stay
+   # unique. Line numbers, which are costly to derive, are only looked up to
+   # render a chain not seen before.
+   depth = _globals.Trace_depth
+   chain = list()
+   cur_frame = frame
+   while cur_frame is not None and (depth is None or len(chain) < depth):
+      chain.append((id(cur_frame.f_code),cur_frame.f_lasti))
+      cur_frame = cur_frame.f_back
+
+   chain = tuple(chain)
+   trace_str = _globals.Trace_cache.get(chain,None)
+   if trace_str is None:
+      code_files = _globals.Trace_code_files
+      infelems=list()
+      for _ in chain:
+         code = frame.f_code
+         if id(code) not in code_files:
+            code_files[id(code)] = (code,
+                                    frame.f_globals.get("__file__",
+                                                        code.co_filename))
+         cur_file_code = _trace_file_code(code_files[id(code)][1])
+         infelems.append(f'{cur_file_code}{frame.f_lineno}')
+         frame = frame.f_back
+
+      trace_str =';'.join(infelems)
+      if len(trace_str) > 64:
+         trace_str=f'~{trace_str[-64:]}'
+      _globals.Trace_cache[chain] = trace_str
 
    return trace_str
 
+def gen_trace_str():
+   return _trace_str(sys._getframe(2))
+
+def _capture_trace(frame):
+   if _globals.Trace_depth == 0:
+      return None
+   if _globals.Trace_sidecar is not None:
+      return _globals.Trace_sidecar.capture(frame)
+   return _trace_str(frame)
+
+# The provenance of an entry generated by the caller's caller, to be turned
+# into the entry's comment by render_trace() once the entry is numbered
+def capture_trace():
+   return _capture_trace(sys._getframe(2))
+
+# The " ;<trace>" comment for a captured trace. entry is what the entry is
+# recorded as in a trace sidecar, by default its number in the current
+# section, or "<first>-<last>" for the copies of a repeated entry.
+def render_trace(trace,entry=None):
+   if trace is None:
+      return ''
+   if isinstance(trace,str):
+      return f' ;{trace}'
+   trace_id = _globals.Trace_sidecar.place(trace,_globals.Section_name,
+                  _globals.Section_idx if entry is None else entry)
+   return f' ;#{trace_id}'
+
+# The " ;<trace>" comment to append to an entry generated by the caller's
+# caller, or '' if tracing is disabled
+def trace_comment(entry=None):
+   return render_trace(_capture_trace(sys._getframe(2)),entry)
+
 def _gen_trace_dict():
    for filename, code in sorted(_globals.Trace_file_dict.items(),
                                 key=lambda x: x[1]):
@@ -119,5 +392,5 @@ def _gen_trace_dict():
          dictstr2 = f'~{filename[-short_dictstr2_len:]}'
 
       _globals.Section_idx += 1 
-      print(f'{_globals.Section_idx}=;{dictstr1}{dictstr2}')
+      get_output().writeline(f'{_globals.Section_idx}=;{dictstr1}{dictstr2}')
  
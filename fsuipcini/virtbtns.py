@@ -0,0 +1,161 @@
+"""
+virtbtns.py -- Allocation of FSUIPC virtual buttons
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+
+WARNING: This is a prototype work-in-progress; expect problems.
+
+FSUIPC has 288 virtual buttons: joysticks 64-72 with 32 buttons each,
+pressed and released through the bits of the DWord at offset 0x3340 +
+4*(joystick-64). The INI generator and the Lua plugins it configures use
+them to pass events to one another, so two uses of the same one silently
+interfere. VirtualButtonMap keeps one bit per virtual button, set when it
+is taken, with the bits each owner took, so that
+
+ - reserve() takes given buttons, raising VirtualButtonCollision with the
+   owners of any already taken,
+ - allocate() finds the first run of free buttons on one joystick.
+
+fsuipcini.devices.CreateButtons() reserves the virtual buttons of the
+classes it creates, or allocates them when no joycode is given, in the map
+returned by virtual_buttons(). An owner, i.e. the name of the class, takes
+buttons only once, so two classes of the same name are caught as well;
+release() gives an owner's buttons back. analyze.run_script_entries()
+starts each run of a generator script with an empty map.
+
+   python3 -m fsuipcini vbtns --script gen_ini.py
+
+lists the virtual buttons a generator script takes.
+
+"""
+from . import _globals
+
+VirtualJoyBase = 64
+VirtualJoyCount = 9
+ButtonsPerJoy = 32
+VirtualButtonOffset = 0x3340
+
+class VirtualButtonCollision(ValueError):
+   pass
+
+def is_virtual_joy(joycode):
+   return isinstance(joycode,int) and \
+          VirtualJoyBase <= joycode < VirtualJoyBase + VirtualJoyCount
+
+class VirtualButtonMap:
+   def __init__(self):
+      self.bits = 0
+      self._owners = dict()   # owner -> bits
+
+   @staticmethod
+   def _bit(joycode,btn):
+      if not is_virtual_joy(joycode):
+         raise ValueError(f'Bad joy code, must be 64-72, was {joycode}')
+      if not 0 <= btn < ButtonsPerJoy:
+         raise ValueError(f'Bad btn code, must be 0-31, was {btn}')
+      return 1 << (joycode-VirtualJoyBase)*ButtonsPerJoy + btn
+
+   # Give owner the buttons bits, leaving the map as it was if any of them
+   # is taken or owner already has buttons
+   def _take(self,owner,bits):
+      if owner in self._owners:
+         raise VirtualButtonCollision(
+                  f'{owner}: already took virtual buttons '
+                  f'{" ".join(self._joycodes(self._owners[owner]))}')
+      if self.bits & bits:
+         taken = [f'{other} ({", ".join(self._joycodes(other_bits & bits))})'
+                  for other, other_bits in self._owners.items()
+                  if other_bits & bits]
+         raise VirtualButtonCollision(f'{owner}: virtual buttons already '
+                                      f'taken by {"; ".join(taken)}')
+      self.bits |= bits
+      self._owners[owner] = bits
+
+   @staticmethod
+   def _joycodes(bits):
+      joycodes = list()
+      index = 0
+      while bits:
+         if bits & 1:
+            joycodes.append(f'{VirtualJoyBase + index // ButtonsPerJoy},'
+                            f'{index % ButtonsPerJoy}')
+         bits >>= 1
+         index += 1
+      return joycodes
+
+   # Take the buttons btns of virtual joystick joycode for owner
+   def reserve(self,owner,joycode,btns):
+      bits = 0
+      for btn in btns:
+         bits |= self._bit(joycode,btn)
+      self._take(owner,bits)
+
+   # Take the first n free consecutive buttons on a virtual joystick, or on
+   # joycode if given, for owner, returning (joycode, first button)
+   def allocate(self,owner,n,joycode=None):
+      if not 0 < n <= ButtonsPerJoy:
+         raise ValueError(f'{owner}: cannot allocate {n} virtual buttons on '
+                          f'one joystick')
+      block = (1 << n) - 1
+      joys = [joycode] if joycode is not None else \
+             range(VirtualJoyBase,VirtualJoyBase+VirtualJoyCount)
+      for joy in joys:
+         self._bit(joy,0)
+         shift = (joy-VirtualJoyBase)*ButtonsPerJoy
+         free = ~(self.bits >> shift) & ((1 << ButtonsPerJoy) - 1)
+         for btn in range(ButtonsPerJoy-n+1):
+            if (free >> btn) & block == block:
+               self._take(owner,block << (shift + btn))
+               return joy, btn
+      raise VirtualButtonCollision(f'{owner}: no {n} free consecutive virtual '
+                                   f'buttons left')
+
+   def release(self,owner):
+      self.bits &= ~self._owners.pop(owner,0)
+
+   def is_free(self,joycode,btn):
+      return not self.bits & self._bit(joycode,btn)
+
+   @property
+   def n_free(self):
+      return VirtualJoyCount*ButtonsPerJoy - bin(self.bits).count('1')
+
+   # One line per owner with the virtual buttons it took
+   def format(self):
+      lines = [f'{owner}: {" ".join(self._joycodes(bits))}'
+               for owner, bits in sorted(self._owners.items(),
+                                         key=lambda item: (item[1] &
+                                                           -item[1]))]
+      lines.append(f'{self.n_free} of {VirtualJoyCount*ButtonsPerJoy} '
+                   f'virtual buttons free')
+      return '\n'.join(lines)
+
+# The VirtualButtonMap of the INI being generated
+def virtual_buttons():
+   if _globals.Virtual_buttons is None:
+      _globals.Virtual_buttons = VirtualButtonMap()
+   return _globals.Virtual_buttons
@@ -1,7 +1,7 @@
 #!/usr/bin/python3
 """
 gen_ini.py -- FSUIPC7.ini generator for a Honeycomb Alpha/Bravo based FS rig
-Version 20210628-0-073677f
+Version 20261017-0
 
 The MIT License (MIT)
 Copyright © 2021 Blake Buhlig
@@ -55,42 +55,79 @@ Eventually I settled on writing a python based framework to get me there.
 
 
 import argparse
+import os
+import sys
 from enum import Enum
-import re
-from fsuipcini.controls import CreateControls, CreateFSUIPCControls
-from fsuipcini.utils import filter_ini, section, end_section
+from fsuipcini.controls import CreateControls, CreateFSUIPCControls, \
+                               MBFCtrlNameFilter, SimCtrlFiles, MBFCtrlFiles
+from fsuipcini.utils import filter_ini, section, end_section, close_output, \
+                            set_trace_depth, set_trace_sidecar, set_optimize, \
+                            set_lua_dispatch
 from fsuipcini.buttons import btnmap, ButtonAction
 from fsuipcini.keys import KeyControl, VK, VKM
 from fsuipcini.offsets import OffsetControl, OffsetSize, OffsetValEnum
+from fsuipcini.luagen import Rotary, OverloadedButton, read_joy_numbers, \
+                             render_rotfsev, render_rotvel, render_ovrldbtn, \
+                             write_atomic
+from fsuipcini.luadispatch import LuaDispatch
 import fsuipcini.SlowFastIncDecMgr
+from fsuipcini.VelocityTierMgr import VelocityTierMgr, CreateTierButtons
 import fsuipcini.devices.honeycomb.alpha
 import fsuipcini.devices.honeycomb.bravo
 
 parser = argparse.ArgumentParser(
                             description="Generate FSUIPC ini file sections")
 parser.add_argument("updateinifile", nargs='?',
-                    help="(optional) read the INI at the given path, "+
-                         "then update it with sections generated by this script "+
-                         "filtered out. Always outputs windows line endings. " +
-                         "Does NOT make a backup copy, so do that before running this "
-                         "if you care." )
+                    help="(optional) update the INI at the given path, "+
+                         "replacing its Buttons sections (including any "+
+                         "profile specific ones) with the sections generated "+
+                         "by this script. The INI is only replaced once "+
+                         "generation succeeds. Always outputs windows line "+
+                         "endings. Does NOT make a backup copy, so do that "+
+                         "before running this if you care." )
+parser.add_argument("--trace-depth", type=int, default=None,
+                    help="number of call frames to trace in the comment of "
+                         "each entry (default: all); 0 omits the comments")
+parser.add_argument("--trace-sidecar", metavar="PATH",
+                    help="comment each entry with only a short ID and write "
+                         "its full call chain to PATH instead; look entries "
+                         "up with 'python3 -m fsuipcini trace PATH <entry>'")
+parser.add_argument("--no-optimize", action="store_true",
+                    help="keep duplicate and unsatisfiable entries rather "
+                         "than removing them")
+parser.add_argument("--update-lua", metavar="DIR", nargs='?', const='.',
+                    help="also rewrite the configuration of the rotfsev.lua, "
+                         "rotvel.lua and ovrldbtn.lua plugins in DIR "
+                         "(default: the current directory) to match the "
+                         "buttons used here")
+parser.add_argument("--joy-number", metavar="LETTER=NUM", action='append',
+                    help="joystick number of a joystick letter for the Lua "
+                         "plugins, if not in the [JoyNames] of the "
+                         "updateinifile, e.g. B=2")
+parser.add_argument("--lua-dispatch", metavar="FILE",
+                    help="move the entries of the LuaDispatchButtons below "
+                         "out of the Buttons section into a Lua plugin FILE "
+                         "generated to dispatch them by table lookup; its "
+                         "joystick letters are resolved like for "
+                         "--update-lua")
 args=parser.parse_args()
 
 # The "Controls List for MSFS Build 999.txt" file is provided by the
 # the FSUIPC7 installer. Controls are listed twice in that file --
-# first sorted by control ID then sorted by control name -- but whatever
-# the last encountered mapping is between name and ID will be used, so
-# the fact they are duplicated should not be issue.
-# For demo convenience, try finding that file in a couple possible locations if
-# not in the current directory
-SimCtrl = CreateControls("SimCtrl",
-                         [f'{x}Controls List for MSFS Build 999.txt' for x in \
-                           ["", "c:/FSUIPC7/", "/mnt/c/FSUIPC7"]],
-                         calling_module=__name__)
+# first sorted by control ID then sorted by control name -- so parsing
+# stops at the first control listed again, i.e. the start of the second
+# listing.
+# For demo convenience, SimCtrlFiles also looks for that file in a couple
+# possible locations if not in the current directory
+SimCtrl = CreateControls("SimCtrl",SimCtrlFiles,
+                         calling_module=__name__,
+                         lazy=True,
+                         stop_on_relisting=True)
 
 # See fsuipc_controls.txt for more information about how this enum type is
 # dynamically generated.
-FsuipcCtrl = CreateFSUIPCControls("FsuipcCtrl", calling_module=__name__)
+FsuipcCtrl = CreateFSUIPCControls("FsuipcCtrl", calling_module=__name__,
+                                  lazy=True)
 
 # The script cip_to_evt.py converts a Mobiflight CIP file to a set of
 # custom event files, and the script gen_custom_ctrls_info.py takes both
@@ -107,15 +144,10 @@ FsuipcCtrl = CreateFSUIPCControls("FsuipcCtrl", calling_module=__name__)
 # library, running it that way should not be expected to generate a working
 # config for the reasons documented in custom_ctrls_info.tsv.DEMO.txt.
 
-MBFCtrl = CreateControls("MBFCtrl",
-                         ["custom_ctrls_info.tsv.txt",
-                          "custom_ctrls_info.tsv.DEMO.txt"],
-                         name_filt_fn=lambda n:
-                            re.sub(pattern=r'MobiFlight\.',repl='', count=1,
-                                   flags=re.IGNORECASE,
-                                   string=re.sub(pattern=r' .*', repl='',
-                                                 string=n,count=1)),
-                         calling_module=__name__)
+MBFCtrl = CreateControls("MBFCtrl",MBFCtrlFiles,
+                         name_filt_fn=MBFCtrlNameFilter,
+                         calling_module=__name__,
+                         lazy=True)
 
 # Define aliases for controls implemented by keystrokes. An important use for
 # this section is as reference while configuring FS2020 with appropriate key
@@ -246,6 +278,9 @@ AlphaTrigHeld = fsuipcini.devices.CreateButtons('AlphaTrigHeld',joycode=66,
                                                 mappings=alphaTrigClicks)
 AlphaTrigHeld.FALSE = "(-A,0)"
 
+AlphaTrigOverload = OverloadedButton(Alpha.LY_TRIG,clicks=AlphaTrig.CLICK1,
+                                     clkNhold=AlphaTrigHeld.CLICK1)
+
 # The rotfsev.lua plugin manages fast vs. slow manipulation of the Bravo's
 # rotary encoder (Bravo.ROTENC_INCR, Bravo.ROTENC_DECR). The result is 4
 # possible types of actions that can be overloaded to various controls
@@ -262,17 +297,28 @@ BravoRotEnc.mgr = fsuipcini.SlowFastIncDecMgr.SlowFastIncDecMgr(
     slow_decr_btn=BravoRotEnc.DEC_SLOW, slow_incr_btn=BravoRotEnc.INC_SLOW,
     fast_decr_btn=BravoRotEnc.DEC_FAST, fast_incr_btn=BravoRotEnc.INC_FAST)
 
-# The rotfsev.lua plugin also manages fast vs. slow manipulation of the
-# Bravo's trim wheel (Bravo.TRIMWHEEL_DOWN, Bravo.TRIMWHEEL_UP). We can
-# add in the holding of the Alpha trigger as an additional shift to
-# further increase the manipulation speed of the elevator control.
-BravoTrimWheel = fsuipcini.devices.CreateButtons('BravoTrimWheel',joycode=68,
-                                                 mappings=dict(
-   DOWN_FAST = 0,
-   DOWN_SLOW = 1,
-   UP_SLOW   = 2,
-   UP_FAST   = 3
-))
+# The rotvel.lua plugin manages the Bravo's trim wheel (Bravo.TRIMWHEEL_DOWN,
+# Bravo.TRIMWHEEL_UP) in 4 velocity tiers, toggling one of 4 virtual buttons
+# per direction for each detent depending on how fast the wheel is turned.
+BravoTrimWheel = CreateTierButtons('BravoTrimWheel',joycode=68,n_tiers=4)
+BravoTrimWheel.mgr = VelocityTierMgr.for_buttons(BravoTrimWheel)
+
+# The rotaries as configured in rotfsev.lua by --update-lua
+RotfsevRotaries = [
+   Rotary(Bravo.ROTENC_INCR,    slow=BravoRotEnc.INC_SLOW,
+                                fast=BravoRotEnc.INC_FAST),
+   Rotary(Bravo.ROTENC_DECR,    slow=BravoRotEnc.DEC_SLOW,
+                                fast=BravoRotEnc.DEC_FAST)
+]
+
+# The rotaries as configured in rotvel.lua by --update-lua
+RotvelRotaries = BravoTrimWheel.mgr.rotaries(Bravo.TRIMWHEEL_DOWN,
+                                             Bravo.TRIMWHEEL_UP)
+
+# The buttons, or all the buttons of a device, whose mappings --lua-dispatch
+# moves into a Lua plugin. These are the most overloaded, i.e. mapped
+# differently in the most PanelModes.
+LuaDispatchButtons = [BravoRotEnc, BravoTrimWheel]
 
 ElvTrimCtrl=OffsetControl(offset = 0x0BC0,
                           size   = OffsetSize.Int16,
@@ -282,14 +328,10 @@ ElvTrimCtrl=OffsetControl(offset = 0x0BC0,
 ElvTrimCtrl.IncrSlow = SimCtrl.ELEV_TRIM_UP
 ElvTrimCtrl.DecrSlow = SimCtrl.ELEV_TRIM_DN
 
-[
-   [ ElvTrimCtrl.IncrFast, ElvTrimCtrl.IncrFaster, ElvTrimCtrl.IncrFastest ],
-   [ ElvTrimCtrl.DecrFast, ElvTrimCtrl.DecrFaster, ElvTrimCtrl.DecrFastest ]
-] = map( lambda mult_func : map(mult_func, [1, 2, 8]),
-         map(lambda oper : lambda mult : ElvTrimCtrl.op(oper, mult * 128),
-             [ OffsetControl.Operation.IncrementSigned,
-               OffsetControl.Operation.DecrementSigned ])
-       )
+ElvTrimCtrl.IncrStep = ElvTrimCtrl.op(OffsetControl.Operation.IncrementSigned,
+                                      128)
+ElvTrimCtrl.DecrStep = ElvTrimCtrl.op(OffsetControl.Operation.DecrementSigned,
+                                      128)
 
 class ParkingBrakeIsNotSet(OffsetValEnum):
    Offset = 0x0BC8
@@ -309,11 +351,22 @@ class PropellerDeiceSwitchIsOff(OffsetValEnum):
 
    TRUE = 0
 
-# If passed as an arg, regenerate the current FSUIPC7.ini file filtering out any
-# Buttons sections
+set_trace_depth(args.trace_depth)
+set_optimize(not args.no_optimize)
+if args.trace_sidecar:
+   set_trace_sidecar(args.trace_sidecar)
+
+# If passed as an arg, update the current FSUIPC7.ini file with the generated
+# Buttons section in place of its own, dropping any profile specific Buttons
+# sections. The file is rewritten when the output is closed at the end.
 if args.updateinifile:
    filter_ini(args.updateinifile,'Buttons')
 
+if args.lua_dispatch:
+   lua_dispatch = LuaDispatch()
+   lua_dispatch.select(*LuaDispatchButtons)
+   set_lua_dispatch(lua_dispatch)
+
 
 
 # Now generate a new Buttons section
@@ -445,23 +498,19 @@ btnmap(Alpha.LY_QTR_D,SimCtrl.SIM_RATE_INCR,conds=AlphaTrigHeld.CLICK1)
 
 
 
-# Map the Bravo trim wheel to the Elevator Trim control
-btnmap(BravoTrimWheel.DOWN_SLOW,ElvTrimCtrl.DecrSlow,
-       conds=AlphaTrigHeld.FALSE, action=ButtonAction.PRESS_AND_RELEASE)
-btnmap(BravoTrimWheel.DOWN_FAST,ElvTrimCtrl.DecrFast,
-       conds=AlphaTrigHeld.FALSE, action=ButtonAction.PRESS_AND_RELEASE)
-btnmap(BravoTrimWheel.DOWN_SLOW,ElvTrimCtrl.DecrFaster,
-       conds=AlphaTrigHeld.CLICK1,action=ButtonAction.PRESS_AND_RELEASE)
-btnmap(BravoTrimWheel.DOWN_FAST,ElvTrimCtrl.DecrFastest,
-       conds=AlphaTrigHeld.CLICK1,action=ButtonAction.PRESS_AND_RELEASE)
-btnmap(BravoTrimWheel.UP_SLOW,  ElvTrimCtrl.IncrSlow,
-       conds=AlphaTrigHeld.FALSE, action=ButtonAction.PRESS_AND_RELEASE)
-btnmap(BravoTrimWheel.UP_FAST,  ElvTrimCtrl.IncrFast,
-       conds=AlphaTrigHeld.FALSE, action=ButtonAction.PRESS_AND_RELEASE)
-btnmap(BravoTrimWheel.UP_SLOW,  ElvTrimCtrl.IncrFaster,
-       conds=AlphaTrigHeld.CLICK1,action=ButtonAction.PRESS_AND_RELEASE)
-btnmap(BravoTrimWheel.UP_FAST,  ElvTrimCtrl.IncrFastest,
-       conds=AlphaTrigHeld.CLICK1,action=ButtonAction.PRESS_AND_RELEASE)
+# Map the Bravo trim wheel to the Elevator Trim control. Turned slowly it
+# sends the sim's trim controls, turned faster it steps the trim offset by
+# 128, 256 and 1024 per detent, each as a single entry with the increment
+# scaled rather than repeated. Holding the Alpha trigger after a single
+# click remains a shift for trimming faster still, by 256 up to 2048.
+BravoTrimWheel.mgr.btnmap(ElvTrimCtrl.DecrStep,ElvTrimCtrl.IncrStep,
+                          conds=AlphaTrigHeld.FALSE,
+                          speeds=[1,1,2,8],
+                          tier_ctrls={0: (ElvTrimCtrl.DecrSlow,
+                                          ElvTrimCtrl.IncrSlow)})
+BravoTrimWheel.mgr.btnmap(ElvTrimCtrl.DecrStep,ElvTrimCtrl.IncrStep,
+                          conds=AlphaTrigHeld.CLICK1,
+                          speeds=[2,4,8,16])
 
 #
 # Map VR Controls to Alpha trigger clicks.
@@ -504,39 +553,42 @@ btnmap(AlphaTrig.CLICK2,KeyCtrl.VR_MODE_TOGGLE)
 #    an internally managed offset like how the WHOLE/FRACT stuff is done
 #  In a PFD/MFD mode, move the PFD/MFD joystick
 
+# Outside the PFD/MFD modes, i.e. in the cockpit, drone or external views
+view_mode = ~PanelMode.FDSel
+
 pov_mappings = [
   ([Alpha.LY_HAT_U,Alpha.LY_HAT_UR,Alpha.LY_HAT_UL] , [ # Up
      (KeyCtrl.INCREASE_COCKPIT_VIEW_HEIGHT,
-        [AlphaTrigHeld.FALSE,PanelMode.FDSel.CondNotPressed]),
+        AlphaTrigHeld.FALSE & view_mode),
      (KeyCtrl.TRANSLATE_COCKPIT_VIEW_FORWARD,
-        [AlphaTrigHeld.CLICK1,PanelMode.FDSel.CondNotPressed]),
+        AlphaTrigHeld.CLICK1 & view_mode),
      (KeyCtrl.VR_CAMERA_RESET,
-        [AlphaTrigHeld.CLICK2,PanelMode.FDSel.CondNotPressed],
+        AlphaTrigHeld.CLICK2 & view_mode,
         ButtonAction.PRESS),
      (MBFCtrl.AS1000_MFD_JOYSTICK_UP, PanelMode.MFD),
      (MBFCtrl.AS1000_PFD_JOYSTICK_UP, PanelMode.PFD),
 # appears inop    (MBFCtrl.Generic_Lwr_JOYSTICK_UP, PanelMode.MFD),
    ]),
   ([Alpha.LY_HAT_R,Alpha.LY_HAT_UR,Alpha.LY_HAT_DR] , [ # Right
-     (KeyCtrl.TRANSLATE_COCKPIT_VIEW_RIGHT, [PanelMode.FDSel.CondNotPressed]),
+     (KeyCtrl.TRANSLATE_COCKPIT_VIEW_RIGHT, view_mode),
      (MBFCtrl.AS1000_MFD_JOYSTICK_RIGHT, PanelMode.MFD),
      (MBFCtrl.AS1000_PFD_JOYSTICK_RIGHT, PanelMode.PFD),
 # appears inop    (MBFCtrl.Generic_Lwr_JOYSTICK_RIGHT, PanelMode.MFD),
    ]),
   ([Alpha.LY_HAT_D,Alpha.LY_HAT_DR,Alpha.LY_HAT_DL] , [ # Down
      (KeyCtrl.DECREASE_COCKPIT_VIEW_HEIGHT,
-        [AlphaTrigHeld.FALSE,PanelMode.FDSel.CondNotPressed]),
+        AlphaTrigHeld.FALSE & view_mode),
      (KeyCtrl.TRANSLATE_COCKPIT_VIEW_BACKWARD,
-        [AlphaTrigHeld.CLICK1,PanelMode.FDSel.CondNotPressed]),
+        AlphaTrigHeld.CLICK1 & view_mode),
      (KeyCtrl.RESET_COCKPIT_VIEW,
-        [AlphaTrigHeld.CLICK2,PanelMode.FDSel.CondNotPressed],
+        AlphaTrigHeld.CLICK2 & view_mode,
         ButtonAction.PRESS),
      (MBFCtrl.AS1000_MFD_JOYSTICK_DOWN, PanelMode.MFD),
      (MBFCtrl.AS1000_PFD_JOYSTICK_DOWN, PanelMode.PFD),
 # appears inop     (MBFCtrl.Generic_Lwr_JOYSTICK_DOWN, PanelMode.MFD),
    ]),
   ([Alpha.LY_HAT_L,Alpha.LY_HAT_UL,Alpha.LY_HAT_DL] , [ # Left
-     (KeyCtrl.TRANSLATE_COCKPIT_VIEW_LEFT, [PanelMode.FDSel.CondNotPressed]),
+     (KeyCtrl.TRANSLATE_COCKPIT_VIEW_LEFT, view_mode),
      (MBFCtrl.AS1000_MFD_JOYSTICK_LEFT, PanelMode.MFD),
      (MBFCtrl.AS1000_PFD_JOYSTICK_LEFT, PanelMode.PFD),
 # appears inop     (MBFCtrl.Generic_Lwr_JOYSTICK_LEFT, PanelMode.MFD),
@@ -553,9 +605,6 @@ for buttons, ctrl_act_cond_mappings in pov_mappings:
        else:
           control,conds = ctrl_act_cond_mapping
 
-       if not isinstance(conds,list):
-          conds=list(conds)
-
        btnmap(button,control,conds=conds,action=action)
 
 
@@ -681,7 +730,7 @@ for paramlist in [
                     SimCtrl.COM2_RADIO_FRACT_INC,
                     PanelMode.COM+radio_sel[2]+fract_sel[True]]
    ]:
-    BravoRotEnc.mgr.btnmapgroup(*paramlist, fast_ctrl_events=4)
+    BravoRotEnc.mgr.btnmapgroup(*paramlist, fast_speed=4)
 
 
 # In PanelMode.XPNDR_ADF...
@@ -754,7 +803,7 @@ for paramlist in [
                     [ADFSel.ADF_1.CondEqual]+adf_conds]
    ]:
 
-    BravoRotEnc.mgr.btnmapgroup(*paramlist, fast_ctrl_events=4)
+    BravoRotEnc.mgr.btnmapgroup(*paramlist, fast_speed=4)
 
 
 
@@ -812,3 +861,40 @@ btnmap(Bravo.THROTLVR6_DETENT,SimCtrl.MIXTURE2_DECR,action=ButtonAction.HOLD)
 
 end_section()
 
+# Bring the Lua plugins in line with the buttons mapped above, with the
+# joystick letters resolved to numbers through the INI's [JoyNames].
+# Everything is rendered before close_output() commits the INI, so that a
+# missing joystick number or a malformed plugin leaves every file untouched.
+lua_files = dict()
+if args.update_lua is not None or args.lua_dispatch:
+   joy_numbers = read_joy_numbers(args.updateinifile) \
+                    if args.updateinifile else dict()
+   for joy_number in args.joy_number or []:
+      letter, _, number = joy_number.partition('=')
+      if not letter or not number.isdigit():
+         parser.error(f'--joy-number {joy_number}: expected LETTER=NUM')
+      joy_numbers[letter] = int(number)
+
+   try:
+      if args.update_lua is not None:
+         fn = os.path.join(args.update_lua,'rotfsev.lua')
+         lua_files[fn] = render_rotfsev(fn,RotfsevRotaries,joy_numbers)
+         fn = os.path.join(args.update_lua,'rotvel.lua')
+         lua_files[fn] = render_rotvel(fn,RotvelRotaries,joy_numbers)
+         fn = os.path.join(args.update_lua,'ovrldbtn.lua')
+         lua_files[fn] = render_ovrldbtn(fn,AlphaTrigOverload)
+      if args.lua_dispatch:
+         # Windows line endings like the INI
+         lua_files[args.lua_dispatch] = lua_dispatch.render(joy_numbers,
+                                                            '\r\n')
+   except (OSError, ValueError) as e:
+      parser.error(f'{e}; {args.updateinifile or "the INI"} left unchanged')
+
+close_output()
+
+if args.lua_dispatch:
+   for joycode, reason in lua_dispatch.skipped.items():
+      print(f'{joycode}: kept in the INI, {reason}',file=sys.stderr)
+
+for fn, text in lua_files.items():
+   write_atomic(fn,text)
@@ -1,6 +1,6 @@
 --[[
 ovrldbtn - event-based manager of an overloaded button for FSUIPC
-Version 20210620-0-4b40cac
+Version 20261017-0
 
 The MIT License (MIT)
 Copyright © 2021 Blake Buhlig
@@ -125,11 +125,15 @@ morse code WAV file that plays the word "ready".
 
 -- CONFIGURATION
 
+-- The joy, btn and vbtn_base_* assignments, and the thresholds, are kept in
+-- line with the button definitions of the INI generator by
+-- "gen_ini.py --update-lua", which rewrites their values in place.
+
 -- Joycode number/joyletter string for the joystick w/ the button to overload
 joy = 'A'
 
 -- Button id for the button to overload
-btn = 0
+btn = 0 -- Alpha.LY_TRIG
 
 --[[
 n_click_threshold_ms:
@@ -190,7 +194,7 @@ function VirtualButton(joy,btn)
   return (joy-64)*32+btn
 end
 
-vbtn_base_clicks = VirtualButton(65,1)
+vbtn_base_clicks = 33 -- VirtualButton(65,1)
 
 --[[
 btn_hold_threshold_ms: If after a button click, a button release is not
@@ -223,7 +227,7 @@ single-click-and-hold, 66,2 will be set on every double-click-and-hold, 66,3
 will be set on every triple-click-and-hold, 66,4 will be set every
 4x-click-and-hold...  through vbtn_base_clkNhold + n_clicks_max.
 --]]
-vbtn_base_clkNhold = VirtualButton(66,1)
+vbtn_base_clkNhold = 65 -- VirtualButton(66,1)
 
 --
 -- IMPLEMENTATION
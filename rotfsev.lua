@@ -1,6 +1,6 @@
 --[[
 rotfsev: FSUIPC event-based fast/slow event generator for rotary switches
-Version 20210620-0-e723f2a
+Version 20261017-0
 
 The MIT License (MIT)
 Copyright © 2021 Blake Buhlig
@@ -85,26 +85,20 @@ function _btnevent(j,b,ud)
   end
 end
 
-function _convert_joy_letter_to_num(ltr)
-  -- TODO implement
-  return 2
-end
-
 function init(defs)
   local def
   for _,def in ipairs(defs) do
-    local joynum = _convert_joy_letter_to_num(def.Joystick)
-    if _BtnDefs[joynum] == nil then
-       _BtnDefs[joynum] = {}
+    if _BtnDefs[def.JoyNum] == nil then
+       _BtnDefs[def.JoyNum] = {}
     end
-    _BtnDefs[joynum][def.Button]={
+    _BtnDefs[def.JoyNum][def.Button]={
        SlowVirtualButton=def.Slow,
        FastVirtualButton=def.Fast,
        FastThresh_ms=def.FastThresh_ms,
        FastThreshFilter_cnt=def.FastThreshFilter_cnt,
        _fastDeadline=0
     }
-    event.button(def.Joystick,def.Button,
+    event.button(def.JoyNum,def.Button,
                  (def.PressEvent and 1 or 0)+(def.ReleaseEvent and 2 or 0),
                  '_btnevent')
   end
@@ -120,48 +114,34 @@ function VirtualButton(joy,btn)
 end
 
 
+-- The init() call below is generated from the button definitions of the INI
+-- generator by "gen_ini.py --update-lua", which resolves the Joystick letter
+-- to the JoyNum FSUIPC passes to _btnevent and computes the VirtualButton
+-- indices of the Slow and Fast virtual buttons. The fields of each rotary:
+--   Joystick, JoyNum, Button: the actual rotary button to manage
+--   PressEvent, ReleaseEvent: trigger an event upon button press/release?
+--   Slow: virtual button to generate when turning slowly
+--   Fast: virtual button to generate when turning fast
+--   FastThresh_ms: generate the fast vBtn when a new event happens within
+--     this threshold of the last event...
+--   FastThreshFilter_cnt: ... except require this many consecutive fast
+--     events before generating the fast vButton (and keep sending slow
+--     vButtons each event until that happens.)
+-- BEGIN GENERATED
 init({
-  -- 1st actual rotary button to manage
-  {Joystick='B',Button=12, -- inc direction of the inc/dec
-   -- trigger event upon button press?
-   PressEvent=true,
-   -- trigger event upon button release?
-   ReleaseEvent=false,
-   -- virtual button to generate when turning slowly
-   Slow=VirtualButton(70,2),
-   -- virtual button to generate when turning fast
-   Fast=VirtualButton(70,3),
-   -- generate fast vBtn when a new event happens within this threshold of the
-   -- last event...
-   FastThresh_ms=100,
-   -- ... except require this many consecutive fast events before generating
-   -- fast vButton (and keep sending slow vButtons each event until that happens.)
-   FastThreshFilter_cnt=0},
-
-  -- 2nd actual rotary button to manage
-  {Joystick='B',Button=13, -- dec direction of the inc/dec
+  {Joystick='B',JoyNum=2,Button=12, -- Bravo.ROTENC_INCR
    PressEvent=true,
    ReleaseEvent=false,
-   Slow=VirtualButton(70,1),
-   Fast=VirtualButton(70,0),
+   Slow=194, -- VirtualButton(70,2)
+   Fast=195, -- VirtualButton(70,3)
    FastThresh_ms=100,
    FastThreshFilter_cnt=0},
-
-  -- 3rd actual rotary button to manage
-  {Joystick='B',Button=21, -- fwd (trim down) on the trim wheel
-   PressEvent=true,
-   ReleaseEvent=false,
-   Slow=VirtualButton(68,1),
-   Fast=VirtualButton(68,0),
-   FastThresh_ms=100,
-   FastThreshFilter_cnt=0},
-
-  -- 4th actual rotary button to manage
-  {Joystick='B',Button=22, -- rev (trim up) on the trim wheel
+  {Joystick='B',JoyNum=2,Button=13, -- Bravo.ROTENC_DECR
    PressEvent=true,
    ReleaseEvent=false,
-   Slow=VirtualButton(68,2),
-   Fast=VirtualButton(68,3),
+   Slow=193, -- VirtualButton(70,1)
+   Fast=192, -- VirtualButton(70,0)
    FastThresh_ms=100,
    FastThreshFilter_cnt=0}
 })
+-- END GENERATED
@@ -0,0 +1,145 @@
+--[[
+rotvel: FSUIPC event-based velocity tier generator for rotary switches
+Version 20261017-0
+
+The MIT License (MIT)
+Copyright © 2021 Blake Buhlig
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+“Software”), to deal in the Software without restriction, including without
+limitation the rights to use, copy, modify, merge, publish, distribute,
+sublicense, and/or sell copies of the Software, and to permit persons to whom
+the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Description:
+
+This module generalizes rotfsev.lua from two speeds to any number of
+velocity tiers. For each button event of a rotary it measures the time
+since the rotary's previous event and toggles the virtual button of the
+fastest tier whose threshold the interval is under, or the first (slowest)
+tier's if none. Each event toggles exactly one virtual button, right away,
+so the INI can map every tier to a control and a multiplier, e.g. 1, 2, 4
+and 8 steps per detent, and a rotary turned ever faster converges ever
+faster.
+
+Events within Debounce_ms of the prior one, e.g. from contact bounce, are
+ignored. To ride over the odd short interval that remains, the tier can be
+limited to rise MaxTierStep tiers per event, while it always drops as soon
+as the rotary slows.
+
+Define the desired buttons according to the array passed to the
+init() function at the bottom of the file.
+]]
+
+_Rotaries={}
+
+function _btnevent(j,b,ud)
+  local time_ms=ipc.elapsedtime()
+  local rotary=_Rotaries[j][b]
+  local interval_ms=time_ms-rotary._last_ms
+  if interval_ms < rotary.Debounce_ms then
+     return
+  end
+  rotary._last_ms=time_ms
+
+  local tier=1
+  for i=#rotary.Thresh_ms,1,-1 do
+     if interval_ms < rotary.Thresh_ms[i] then
+        tier=i+1
+        break
+     end
+  end
+  if rotary.MaxTierStep > 0 and tier > rotary._tier+rotary.MaxTierStep then
+     tier=rotary._tier+rotary.MaxTierStep
+  end
+  rotary._tier=tier
+  ipc.btnToggle(rotary.VBtns[tier])
+end
+
+function init(defs)
+  local def
+  for _,def in ipairs(defs) do
+    if _Rotaries[def.JoyNum] == nil then
+       _Rotaries[def.JoyNum] = {}
+    end
+    if #def.Thresh_ms ~= #def.VBtns-1 then
+       error("Need one Thresh_ms per tier but the first, for button " ..
+             def.Button)
+    end
+    _Rotaries[def.JoyNum][def.Button]={
+       VBtns=def.VBtns,
+       Thresh_ms=def.Thresh_ms,
+       Debounce_ms=def.Debounce_ms,
+       MaxTierStep=def.MaxTierStep,
+       _last_ms=-1000000,
+       _tier=1
+    }
+    event.button(def.JoyNum,def.Button,
+                 (def.PressEvent and 1 or 0)+(def.ReleaseEvent and 2 or 0),
+                 '_btnevent')
+  end
+end
+
+function VirtualButton(joy,btn)
+  if joy < 64 or joy > 72 then
+    error("Bad joy code, must be 64-72, was " .. joy)
+  elseif btn < 0 or btn > 31 then
+    error("Bad btn code, must be 0-31, was " .. btn)
+  end
+  return (joy-64)*32+btn
+end
+
+
+-- The init() call below is generated from the button definitions of the INI
+-- generator by "gen_ini.py --update-lua", which resolves the Joystick letter
+-- to the JoyNum FSUIPC passes to _btnevent and computes the VirtualButton
+-- indices of the tiers' virtual buttons. The fields of each rotary:
+--   Joystick, JoyNum, Button: the actual rotary button to manage
+--   PressEvent, ReleaseEvent: trigger an event upon button press/release?
+--   VBtns: virtual button to generate for each tier, slowest first
+--   Thresh_ms: for each tier but the first, generate its vBtn when the
+--     event is within this threshold of the rotary's last event; each
+--     threshold shorter than the one before
+--   Debounce_ms: ignore events within this time of the last event
+--   MaxTierStep: how many tiers the tier may rise per event, 0 for any
+-- BEGIN GENERATED
+init({
+  {Joystick='B',JoyNum=2,Button=21, -- Bravo.TRIMWHEEL_DOWN
+   PressEvent=true,
+   ReleaseEvent=false,
+   VBtns={
+      128, -- VirtualButton(68,0)
+      129, -- VirtualButton(68,1)
+      130, -- VirtualButton(68,2)
+      131 -- VirtualButton(68,3)
+   },
+   Thresh_ms={100,50,25},
+   Debounce_ms=0,
+   MaxTierStep=0},
+  {Joystick='B',JoyNum=2,Button=22, -- Bravo.TRIMWHEEL_UP
+   PressEvent=true,
+   ReleaseEvent=false,
+   VBtns={
+      132, -- VirtualButton(68,4)
+      133, -- VirtualButton(68,5)
+      134, -- VirtualButton(68,6)
+      135 -- VirtualButton(68,7)
+   },
+   Thresh_ms={100,50,25},
+   Debounce_ms=0,
+   MaxTierStep=0}
+})
+-- END GENERATED
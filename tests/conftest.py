@@ -0,0 +1,9 @@
+import pytest
+from fsuipcini import _globals
+
+# btnmap() also collects the entries it returns into the current section;
+# the tests use the returned entries, so drop the collected ones after each
+@pytest.fixture(autouse=True)
+def _section_entries():
+   yield
+   _globals.Section_entries = list()
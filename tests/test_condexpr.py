@@ -0,0 +1,119 @@
+import itertools
+import random
+import pytest
+import fsuipcini.devices
+import fsuipcini.devices.honeycomb.bravo
+from fsuipcini import condexpr
+from fsuipcini.buttons import btnmap
+from fsuipcini.condexpr import Cond, compile_conds
+from fsuipcini.conditions import ButtonCondition
+from fsuipcini.offsets import OffsetCondition, OffsetSize
+
+Bravo = fsuipcini.devices.CreateButtons(
+   'Bravo',joycode='B',mappings=fsuipcini.devices.honeycomb.bravo.ButtonMappings)
+
+Pressed = ButtonCondition.Test.PRESSED
+FlagSet = ButtonCondition.Test.FLAG_SET
+A, B, C, D = (ButtonCondition('A',btn,Pressed,True) for btn in range(4))
+F = ButtonCondition('A',9,FlagSet,True)
+X1, X2 = (OffsetCondition(OffsetSize.Byte,0x66C0,v) for v in (1,2))
+
+def _holds(cond,state):
+   if isinstance(cond,ButtonCondition):
+      return state[(cond.joy,cond.btn,cond.test)] == cond.state
+   value = state[(cond.size,cond.offset)]
+   return {'=': value == cond.condvalue, '!': value != cond.condvalue,
+           '<': value < cond.condvalue,
+           '>': value > cond.condvalue}[cond.test.value]
+
+# Every state of the given buttons and of the offset 0x66C0 from 0 to 3
+def _states(buttons):
+   keys = [(b.joy,b.btn,b.test) for b in buttons]
+   for pressed in itertools.product((False,True),repeat=len(keys)):
+      for value in range(4):
+         state = dict(zip(keys,pressed))
+         state[(OffsetSize.Byte,0x66C0)] = value
+         yield state
+
+# Assert that in every state exactly one of the entries fires if holds(state)
+# and none otherwise
+def _check(expr,holds,buttons):
+   cond_lists = compile_conds(expr)
+   for state in _states(buttons):
+      fired = sum(all(_holds(cond,state) for cond in button_conds+offset_conds)
+                  for button_conds, offset_conds in cond_lists)
+      assert fired == (1 if holds(state) else 0), state
+   return cond_lists
+
+def _p(cond):
+   return lambda state: _holds(cond,state)
+
+@pytest.mark.parametrize('expr,holds,n_entries',[
+   ((A | B) & ~C,
+    lambda s: (_p(A)(s) or _p(B)(s)) and not _p(C)(s),2),
+   ((A & ~B) | (~A & B),lambda s: _p(A)(s) != _p(B)(s),2),
+   (A | B | C | D,lambda s: any(_p(x)(s) for x in (A,B,C,D)),4),
+   ((A & B) | (A & ~B),_p(A),1),
+   (F & ~A,lambda s: _p(F)(s) and not _p(A)(s),1),
+   # The offset cannot be both 1 and 2, so neither entry needs to test that
+   # it is not the other
+   (X1 | X2,lambda s: _p(X1)(s) or _p(X2)(s),2),
+])
+def test_entries_fire_once_exactly_when_the_expression_holds(expr,holds,
+                                                             n_entries):
+   cond_lists = _check(expr,holds,(A,B,C,D,F))
+   assert len(cond_lists) == n_entries
+
+def test_offset_entries_test_only_their_value():
+   cond_lists = compile_conds(X1 | X2)
+   assert sorted(cond_lists,key=str) == [([],[X1]),([],[X2])]
+
+def _random_expr(rnd,depth):
+   if depth == 0 or rnd.random() < 0.3:
+      var = rnd.choice((A,B,C,D))
+      if rnd.random() < 0.5:
+         return ~Cond(var), (lambda s, v=var: not _holds(v,s))
+      return Cond(var), (lambda s, v=var: _holds(v,s))
+   (a, fa), (b, fb) = _random_expr(rnd,depth-1), _random_expr(rnd,depth-1)
+   if rnd.random() < 0.5:
+      return a & b, (lambda s: fa(s) and fb(s))
+   return a | b, (lambda s: fa(s) or fb(s))
+
+def test_random_expressions():
+   rnd = random.Random(0)
+   for _ in range(200):
+      expr, holds = _random_expr(rnd,4)
+      _check(expr,holds,(A,B,C,D))
+
+def test_search_falls_back_to_the_first_cover(monkeypatch):
+   monkeypatch.setattr(condexpr,'MaxSearchNodes',0)
+   rnd = random.Random(1)
+   for _ in range(50):
+      expr, holds = _random_expr(rnd,4)
+      _check(expr,holds,(A,B,C,D))
+
+def test_always_and_never():
+   assert compile_conds(Cond(True)) == [([],[])]
+   assert compile_conds(A | ~A) == [([],[])]
+   assert compile_conds(A & ~A) == []
+   assert compile_conds(X1 & X2) == []
+
+def test_too_many_conditions(monkeypatch):
+   buttons = [ButtonCondition('A',btn,Pressed,True) for btn in range(4)]
+   monkeypatch.setattr(condexpr,'MaxConditions',3)
+   with pytest.raises(ValueError,match='4 distinct conditions'):
+      compile_conds(condexpr.Or(*buttons))
+
+def test_btnmap_rejects_an_expression_that_never_holds():
+   with pytest.raises(ValueError,match='never holds'):
+      btnmap(Bravo.HDG,('C66000',0),conds=Bravo.NAV & ~Bravo.NAV)
+
+def test_btnmap_maps_each_entry_of_the_expression():
+   entries = btnmap(Bravo.HDG,('C66000',0),
+                    conds=(Bravo.NAV | Bravo.APR) & ~Bravo.ALT)
+   assert len(entries) == 2
+   assert {str(entry) for entry in entries} == {
+      f'CP(+B,{Bravo.NAV.value})(-B,{Bravo.ALT.value})B,{Bravo.HDG.value},'
+      f'C66000,0',
+      f'CP(-B,{Bravo.NAV.value})(+B,{Bravo.APR.value})'
+      f'(-B,{Bravo.ALT.value})B,{Bravo.HDG.value},C66000,0'}
@@ -0,0 +1,104 @@
+import os
+import pytest
+from fsuipcini import utils
+from fsuipcini.utils import IniUpdater
+
+Original = (b'[General]\r\n'
+            b'UpdatedByVersion=7440\r\n'
+            b'\r\n'
+            b'[Buttons]\r\n'
+            b'1=PB,1,C65607,0\r\n'
+            b'2=PB,2,C65615,0\r\n'
+            b'\r\n'
+            b'[Buttons.A320]\r\n'
+            b'1=PB,3,C65580,0\r\n'
+            b'\r\n'
+            b'[Keys]\r\n'
+            b'1=65,8,1070,0\r\n')
+
+@pytest.fixture
+def ini(tmp_path):
+   fn = tmp_path / 'FSUIPC7.ini'
+   fn.write_bytes(Original)
+   return fn
+
+def _update(fn,lines,drop_sections=()):
+   updater = IniUpdater(str(fn),drop_sections)
+   for line in lines:
+      updater.writeline(line)
+   updater.close()
+
+def _leftovers(fn):
+   return [x for x in os.listdir(fn.parent) if x.startswith('.tmp-')]
+
+def test_replaces_section_in_place(ini):
+   _update(ini,['[Buttons]','1=PB,5,C65588,0',''])
+   assert ini.read_bytes() == (b'[General]\r\n'
+                               b'UpdatedByVersion=7440\r\n'
+                               b'\r\n'
+                               b'[Buttons]\r\n'
+                               b'1=PB,5,C65588,0\r\n'
+                               b'\r\n'
+                               b'[Buttons.A320]\r\n'
+                               b'1=PB,3,C65580,0\r\n'
+                               b'\r\n'
+                               b'[Keys]\r\n'
+                               b'1=65,8,1070,0\r\n')
+   assert not _leftovers(ini)
+
+def test_appends_new_section(ini):
+   _update(ini,['[Axes]','0=BX,256,F,66382,0,0,0'])
+   assert ini.read_bytes() == (Original +
+                               b'[Axes]\r\n'
+                               b'0=BX,256,F,66382,0,0,0\r\n')
+
+def test_nothing_generated_keeps_ini(ini):
+   _update(ini,[])
+   assert ini.read_bytes() == Original
+
+def test_drops_section_family(ini):
+   _update(ini,[],drop_sections=('Buttons',))
+   assert ini.read_bytes() == (b'[General]\r\n'
+                               b'UpdatedByVersion=7440\r\n'
+                               b'\r\n'
+                               b'[Keys]\r\n'
+                               b'1=65,8,1070,0\r\n')
+
+def test_drops_profile_section_only(ini):
+   _update(ini,[],drop_sections=('Buttons.A320',))
+   assert ini.read_bytes() == (b'[General]\r\n'
+                               b'UpdatedByVersion=7440\r\n'
+                               b'\r\n'
+                               b'[Buttons]\r\n'
+                               b'1=PB,1,C65607,0\r\n'
+                               b'2=PB,2,C65615,0\r\n'
+                               b'\r\n'
+                               b'[Keys]\r\n'
+                               b'1=65,8,1070,0\r\n')
+
+def test_failure_before_close_keeps_ini(ini):
+   updater = IniUpdater(str(ini))
+   updater.writeline('[Buttons]')
+   updater.writeline('1=PB,5,C65588,0')
+   # generation raising before close_output() never reaches commit()
+   del updater
+   assert ini.read_bytes() == Original
+   assert not _leftovers(ini)
+
+def test_failure_while_rendering_keeps_ini(ini,monkeypatch):
+   def fail(self,lines):
+      raise RuntimeError('rendering failed')
+   monkeypatch.setattr(utils.IniWriter,'writelines',fail)
+   with pytest.raises(RuntimeError,match='rendering failed'):
+      _update(ini,['[Buttons]','1=PB,5,C65588,0'])
+   assert ini.read_bytes() == Original
+   assert not _leftovers(ini)
+
+def test_failure_while_replacing_keeps_ini(ini,monkeypatch):
+   def fail(src,dst):
+      raise OSError('replace failed')
+   monkeypatch.setattr(utils.os,'replace',fail)
+   with pytest.raises(OSError,match='replace failed'):
+      _update(ini,['[Buttons]','1=PB,5,C65588,0'])
+   assert ini.read_bytes() == Original
+   assert not _leftovers(ini)
@@ -0,0 +1,42 @@
+import fsuipcini.devices
+import fsuipcini.devices.honeycomb.bravo
+from fsuipcini.buttons import btnmap, ButtonAction
+from fsuipcini.luadispatch import LuaDispatch
+from fsuipcini.simulator import ButtonSimulator, SimEvent
+
+Bravo = fsuipcini.devices.CreateButtons(
+   'Bravo',joycode='B',mappings=fsuipcini.devices.honeycomb.bravo.ButtonMappings)
+
+def _fired(entries,events,dispatch=()):
+   sim = ButtonSimulator(entries,record=True,dispatch=dispatch)
+   sim.replay(events)
+   return [(fired.ctrlcode,fired.param) for fired in sim.fired]
+
+def test_repeated_entries_fire_the_same_controls_when_dispatched():
+   entries = btnmap(Bravo.HDG,('C66000',0),conds=[Bravo.NAV],repeat=3) + \
+             btnmap(Bravo.HDG,('C66001',0),conds=[Bravo.NAV.CondNotPressed]) + \
+             btnmap(Bravo.HDG,('C66002',1),action=ButtonAction.RELEASE,
+                    repeat=2)
+   dispatch = LuaDispatch()
+   dispatch.select(Bravo.HDG)
+   rest = dispatch.take('Buttons',entries)
+   assert rest == [] and not dispatch.skipped
+   assert dispatch.tables[0].n_entries == 6
+
+   events = [SimEvent(*e) for e in [('P','B',Bravo.HDG.value),
+                                    ('U','B',Bravo.HDG.value),
+                                    ('P','B',Bravo.NAV.value),
+                                    ('P','B',Bravo.HDG.value),
+                                    ('U','B',Bravo.HDG.value),
+                                    ('U','B',Bravo.NAV.value)]]
+   expected = [('C66001',0)] + [('C66002',1)]*2 + \
+              [('C66000',0)]*3 + [('C66002',1)]*2
+   assert _fired(entries,events) == expected
+   assert _fired(rest,events,dispatch.tables) == expected
+
+def test_held_entries_stay_in_the_ini():
+   entries = btnmap(Bravo.HDG,('C66000',0),action=ButtonAction.REPEAT)
+   dispatch = LuaDispatch()
+   dispatch.select(Bravo.HDG)
+   assert dispatch.take('Buttons',entries) == entries
+   assert dispatch.skipped == {f'B,{Bravo.HDG.value}': 'R entries'}
@@ -0,0 +1,115 @@
+import random
+import pytest
+from fsuipcini import offsetbatch
+from fsuipcini.offsetbatch import apply_batch, decode_controls
+from fsuipcini.offsets import OffsetControl, OffsetSize
+from fsuipcini.offsetspace import OffsetSpace
+
+Op = OffsetControl.Operation
+
+# One offset per closed form, plus groups only the fallback can apply: an
+# offset mixing forms, two overlapping offsets and a float offset
+Clamp = OffsetControl(0x66C0,OffsetSize.Byte,llimit=0,ulimit=200)
+SignedClamp = OffsetControl(0x0BC0,OffsetSize.Int16,llimit=-16383,
+                            ulimit=16383)
+Affine = OffsetControl(0x3340,OffsetSize.DWord)
+Cyclic = OffsetControl(0x66C1,OffsetSize.Byte,llimit=0,ulimit=3)
+Mixed = OffsetControl(0x66C4,OffsetSize.Word,llimit=0,ulimit=9)
+OverlapByte = OffsetControl(0x5000,OffsetSize.Byte,llimit=0,ulimit=255)
+OverlapWord = OffsetControl(0x5000,OffsetSize.Word,llimit=0,ulimit=1000)
+Float = OffsetControl(0x5100,OffsetSize.Float64)
+
+def _random_control(rnd):
+   return rnd.choice([
+      lambda: Clamp.op(rnd.choice((Op.IncrementUnsigned,
+                                   Op.DecrementUnsigned)),rnd.randint(1,60)),
+      lambda: Clamp.op(Op.Set,rnd.randint(0,255)),
+      lambda: SignedClamp.op(rnd.choice((Op.IncrementSigned,
+                                         Op.DecrementSigned)),
+                             rnd.randint(1,5000)),
+      lambda: Affine.op(rnd.choice((Op.Setbits,Op.Clrbits,Op.Togglebits)),
+                        rnd.getrandbits(32)),
+      lambda: Affine.op(Op.Set,rnd.getrandbits(32)),
+      lambda: Cyclic.op(rnd.choice((Op.IncrementCyclic,Op.DecrementCyclic)),
+                        1),
+      lambda: Mixed.op(rnd.choice((Op.IncrementCyclic,Op.Setbits,Op.Set,
+                                   Op.IncrementUnsigned)),rnd.randint(1,3)),
+      lambda: OverlapByte.op(Op.IncrementUnsigned,rnd.randint(1,9)),
+      lambda: OverlapWord.op(Op.Togglebits,rnd.getrandbits(16)),
+      lambda: Float.op(Op.FloatInc,rnd.randint(-5,5)),
+   ])()
+
+def _initial_space():
+   space = OffsetSpace()
+   space.write(0x66C0,17,'B')
+   space.write(0x3340,0x12345678,'D')
+   space.write(0x66C1,2,'B')
+   return space
+
+# The value after each control and the final memory, applying them one by one
+def _one_by_one(space,controls):
+   values = [space.apply_decoded(OffsetControl.decode(*ctrl))
+             for ctrl in controls]
+   return values, bytes(space.mem)
+
+def _batch(space,controls):
+   values = apply_batch(space,*decode_controls(controls),results=True)
+   return list(values), bytes(space.mem)
+
+@pytest.mark.parametrize('seed',range(5))
+def test_batch_matches_one_by_one(seed):
+   rnd = random.Random(seed)
+   controls = [_random_control(rnd) for _ in range(2000)]
+   assert _batch(_initial_space(),controls) == \
+          _one_by_one(_initial_space(),controls)
+
+@pytest.mark.parametrize('seed',range(3))
+def test_batch_without_numpy(monkeypatch,seed):
+   rnd = random.Random(seed)
+   controls = [_random_control(rnd) for _ in range(500)]
+   expected = _one_by_one(_initial_space(),controls)
+   monkeypatch.setattr(offsetbatch,'np',None)
+   assert _batch(_initial_space(),controls) == expected
+
+def test_cyclic_wraps_around_both_ways():
+   inc = Cyclic.op(Op.IncrementCyclic,1)
+   dec = Cyclic.op(Op.DecrementCyclic,1)
+   controls = [dec,dec,inc,inc,inc,inc,inc]
+   values, _ = _batch(OffsetSpace(),controls)
+   assert values == [3,2,3,0,1,2,3]
+   assert (values, _) == _one_by_one(OffsetSpace(),controls)
+
+def test_cyclic_out_of_range_start_falls_back():
+   controls = [Cyclic.op(Op.IncrementCyclic,1)]*3
+   space = OffsetSpace()
+   space.write(0x66C1,7,'B')
+   ref = OffsetSpace()
+   ref.write(0x66C1,7,'B')
+   assert _batch(space,controls) == _one_by_one(ref,controls)
+
+def test_signed_clamp_at_the_limits():
+   up = SignedClamp.op(Op.IncrementSigned,5000)
+   down = SignedClamp.op(Op.DecrementSigned,5000)
+   controls = [up]*5 + [down]*9
+   values, _ = _batch(OffsetSpace(),controls)
+   assert values[3:5] == [16383,16383] and values[-2:] == [-16383,-16383]
+   assert (values, _) == _one_by_one(OffsetSpace(),controls)
+
+def test_closed_forms_need_no_fallback(monkeypatch):
+   applied = list()
+   one_by_one = offsetbatch._apply_one_by_one
+   def _counting(space,*args):
+      applied.extend(args[5])
+      return one_by_one(space,*args)
+   monkeypatch.setattr(offsetbatch,'_apply_one_by_one',_counting)
+
+   rnd = random.Random(0)
+   controls = [Clamp.op(Op.IncrementUnsigned,rnd.randint(1,60))
+               for _ in range(100)] + \
+              [Affine.op(Op.Togglebits,rnd.getrandbits(32))
+               for _ in range(100)] + \
+              [Cyclic.op(Op.DecrementCyclic,1) for _ in range(100)]
+   rnd.shuffle(controls)
+   expected = _one_by_one(_initial_space(),controls)
+   assert _batch(_initial_space(),controls) == expected
+   assert applied == []
@@ -0,0 +1,65 @@
+import pytest
+from fsuipcini.offsets import OffsetCondition, OffsetControl, OffsetSize
+
+Op = OffsetControl.Operation
+
+Selector = OffsetControl(0x66C1,OffsetSize.Byte,llimit=0,ulimit=3)
+Trim = OffsetControl(0x0BC0,OffsetSize.Int16,llimit=-16383,ulimit=16383)
+
+@pytest.mark.parametrize('ctrl,operation,operand,expected',[
+   # Set and the bit operations take the operand alone, no limit
+   (Selector,Op.Set,5,('Cx010066C1','x00000005')),
+   (Selector,Op.Setbits,0x80,('Cx050066C1','x00000080')),
+   (Selector,Op.Clrbits,0x80,('Cx090066C1','x00000080')),
+   (Selector,Op.Togglebits,0x80,('Cx0D0066C1','x00000080')),
+   # Increments take the upper limit, decrements the lower one...
+   (Selector,Op.IncrementUnsigned,1,('Cx110066C1','x00030001')),
+   (Selector,Op.DecrementUnsigned,1,('Cx210066C1','x00000001')),
+   (Trim,Op.IncrementSigned,128,('Cx32000BC0','x3FFF0080')),
+   (Trim,Op.DecrementSigned,128,('Cx42000BC0','xC0010080')),
+   # ...except cyclic ones, which both wrap at the upper limit
+   (Selector,Op.IncrementCyclic,1,('Cx510066C1','x00030001')),
+   (Selector,Op.DecrementCyclic,1,('Cx610066C1','x00030001')),
+])
+def test_op_encoding(ctrl,operation,operand,expected):
+   assert ctrl.op(operation,operand) == expected
+
+def test_masked_condition_format():
+   cond = OffsetCondition(OffsetSize.Word,0x0BC8,1,mask=0xFF,
+                          test=OffsetCondition.Test.NOT_EQUAL)
+   assert str(cond) == 'W0BC8&xFF!1'
+
+_IntSizes = [OffsetSize.Byte,OffsetSize.Word,OffsetSize.DWord]
+_IntOps = [op for op in Op if op not in (Op.FloatSet,Op.FloatInc)]
+
+@pytest.mark.parametrize('size',_IntSizes)
+@pytest.mark.parametrize('operation',_IntOps)
+def test_decode_round_trip(size,operation):
+   ctrl = OffsetControl(0x1234,size,llimit=-7,ulimit=250)
+   decoded = OffsetControl.decode(*ctrl.op(operation,9))
+   assert (decoded.operation,decoded.size,decoded.offset,decoded.operand) \
+          == (operation,size.ctrlcode,0x1234,9)
+   if operation in (Op.IncrementSigned,Op.DecrementSigned):
+      limit = -7 if operation == Op.DecrementSigned else 250
+   elif operation in (Op.DecrementUnsigned,):
+      limit = -7 & 0xFFFF
+   elif Op.IncrementUnsigned.value <= operation.value <= \
+        Op.DecrementCyclic.value:
+      limit = 250
+   else:
+      limit = None
+   assert decoded.limit == limit
+
+@pytest.mark.parametrize('size',[OffsetSize.Float32,OffsetSize.Float64])
+@pytest.mark.parametrize('operation',[Op.FloatSet,Op.FloatInc])
+def test_decode_round_trip_float(size,operation):
+   decoded = OffsetControl.decode(
+                *OffsetControl(0x2EA0,size).op(operation,-3))
+   assert decoded == (operation,size.ctrlcode,0x2EA0,None,(-3) & 0xFFFFFFFF)
+
+def test_decode_ignores_other_controls():
+   assert OffsetControl.decode('C65883',0) is None
+
+def test_bare_offset_control_has_no_ctrlcode():
+   with pytest.raises(TypeError):
+      Selector.ctrlcode
@@ -0,0 +1,56 @@
+from fsuipcini.conditions import parse_cond
+from fsuipcini.entries import ButtonEntry
+from fsuipcini.optimize import optimize_entries, satisfiable
+
+def _entry(conds='',ctrlcode='C66000',param=0,repeat=1,trace=None):
+   conds = [parse_cond(c) for c in conds.split()]
+   return ButtonEntry('B',5,'P',ctrlcode,param,
+                      [c for c in conds if not hasattr(c,'offset')],
+                      [c for c in conds if hasattr(c,'offset')],
+                      trace,repeat)
+
+def test_repeated_conditions_are_dropped():
+   entry = _entry('(+A,1) (+A,1) B66C0=1 B66C0=1 (-A,2)')
+   kept, stats = optimize_entries([entry])
+   assert kept == [entry] and stats.conditions == 2
+   assert str(entry) == 'B66C0=1 CP(+A,1)(-A,2)B,5,C66000,0'
+
+def test_contradictions():
+   for conds in ['(+A,1) (-A,1)','(F+A,1) (F-A,1)','B66C0=0 B66C0=1',
+                 'B66C0=3 B66C0!3','B66C0<5 B66C0>7','W0BC8<1 W0BC8>0',
+                 'B66C0&x3=1 B66C0&x3=2']:
+      assert not satisfiable(_entry(conds)), conds
+   for conds in ['(+A,1) (F-A,1)','(+A,1) (-B,1)','B66C0=3 B66C0<5',
+                 'B66C0=0 B66C1=1','B66C0=1 W66C0=2','B66C0&x3=1 B66C0=5',
+                 'B66C0>2 B66C0<4 B66C0!2','W0BC8<1 W0BC8>-1']:
+      assert satisfiable(_entry(conds)), conds
+
+def test_unsatisfiable_entries_are_dropped_and_reported():
+   kept_entry, dead = _entry('(+A,1)'), _entry('(+A,1) (-A,1)')
+   dropped = list()
+   kept, stats = optimize_entries([kept_entry,dead],dropped)
+   assert kept == [kept_entry] and stats.unsatisfiable == 1
+   assert dropped == [(dead,'unsatisfiable')]
+
+def test_duplicates_up_to_condition_order_are_dropped_and_reported():
+   first = _entry('(+A,1) B66C0=1',trace='a1')
+   same = _entry('B66C0=1 (+A,1)',trace='a2')
+   other_param = _entry('(+A,1) B66C0=1',param=1)
+   other_conds = _entry('(+A,1) B66C0=2')
+   dropped = list()
+   kept, stats = optimize_entries([first,same,other_param,other_conds],
+                                  dropped)
+   assert kept == [first,other_param,other_conds]
+   assert stats == (3,1,0,0)
+   assert dropped == [(same,'duplicate')]
+
+def test_repeated_entries_are_kept():
+   once = _entry('(+A,1)')
+   twice = _entry('(+A,1)',repeat=2)
+   again = _entry('(+A,1)',repeat=2)
+   copy = _entry('(+A,1)')
+   dropped = list()
+   kept, stats = optimize_entries([twice,once,again,copy],dropped)
+   assert kept == [twice,once,again]
+   assert dropped == [(copy,'duplicate')]
+   assert stats.duplicate == 1
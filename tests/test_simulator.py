@@ -0,0 +1,65 @@
+import fsuipcini.devices
+import fsuipcini.devices.honeycomb.bravo
+from fsuipcini.buttons import btnmap, ButtonAction
+from fsuipcini.luadispatch import LuaDispatch
+from fsuipcini.offsets import OffsetControl, OffsetSize
+from fsuipcini.simulator import ButtonSimulator
+from fsuipcini.virtbtns import VirtualJoyBase, VirtualButtonOffset
+
+Bravo = fsuipcini.devices.CreateButtons(
+   'Bravo',joycode='B',mappings=fsuipcini.devices.honeycomb.bravo.ButtonMappings)
+
+Op = OffsetControl.Operation
+Joy = str(VirtualJoyBase)
+
+def test_repeat_of_dispatched_button_goes_through_dispatch():
+   entries = btnmap(Bravo.HDG,('C66000',0),conds=[Bravo.NAV])
+   dispatch = LuaDispatch()
+   dispatch.select(Bravo.HDG)
+   rest = dispatch.take('Buttons',entries)
+   sim = ButtonSimulator(rest,record=True,dispatch=dispatch.tables)
+   sim.press('B',Bravo.NAV.value)
+   sim.press('B',Bravo.HDG.value)
+   assert sim.variables_tested == 1 and sim.lookups == 1
+   # The plugin registers press and release only: neither the repeats nor
+   # the release reach it, and nothing is left in the INI to scan
+   sim.repeat('B',Bravo.HDG.value)
+   sim.repeat('B',Bravo.HDG.value)
+   sim.release('B',Bravo.HDG.value)
+   assert sim.variables_tested == 1 and sim.lookups == 1
+   assert sim.entries_scanned == 0
+   assert [(f.ctrlcode,f.param) for f in sim.fired] == [('C66000',0)]
+
+def test_repeat_of_scanned_button_sends_held_entries():
+   entries = btnmap(Bravo.HDG,('C66000',0),action=ButtonAction.REPEAT)
+   sim = ButtonSimulator(entries,record=True)
+   sim.repeat('B',Bravo.HDG.value)
+   sim.press('B',Bravo.HDG.value)
+   sim.repeat('B',Bravo.HDG.value)
+   sim.release('B',Bravo.HDG.value)
+   sim.repeat('B',Bravo.HDG.value)
+   assert [(f.ctrlcode,f.param) for f in sim.fired] == [('C66000',0)]*2
+
+def test_byte_control_presses_virtual_button():
+   ctrl = OffsetControl(VirtualButtonOffset+1,OffsetSize.Byte)
+   entries = btnmap(Bravo.HDG,ctrl.op(Op.Setbits,0x02)) + \
+             btnmap(Bravo.HDG,ctrl.op(Op.Clrbits,0x02),
+                    action=ButtonAction.RELEASE)
+   sim = ButtonSimulator(entries)
+   sim.press('B',Bravo.HDG.value)
+   assert sim.pressed[(Joy,9)]
+   sim.release('B',Bravo.HDG.value)
+   assert not sim.pressed[(Joy,9)]
+
+def test_wide_write_below_virtual_buttons_presses_them():
+   sim = ButtonSimulator([])
+   # A Float64 at 0x333C spans 0x3340-0x3343, where 1.0 sets the exponent
+   # bits 0x3FF0 of its top word
+   sim.write_offset(VirtualButtonOffset-4,1.0,OffsetSize.Float64)
+   assert sorted(btn for (joy,btn), state in sim.pressed.items()
+                 if joy == Joy and state) == list(range(20,30))
+
+def test_narrow_write_below_virtual_buttons_leaves_them():
+   sim = ButtonSimulator([])
+   sim.write_offset(VirtualButtonOffset-1,0xFF,'B')
+   assert not sim.pressed